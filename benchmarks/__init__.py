@@ -0,0 +1,7 @@
+"""End-to-end benchmarks for slicker.
+
+generate.py builds synthetic Python trees; run.py does moves in them and
+reports how long they took, how much memory they used, and how much work
+khodemod did, as JSON.  Run them with `make bench`, or
+`python -m benchmarks.run --help` for the options.
+"""
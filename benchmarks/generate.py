@@ -0,0 +1,195 @@
+"""Generate synthetic Python trees for slicker to work on.
+
+The trees look, to slicker, a little like a real monorepo: packages nested a
+few deep, modules that import each other with a mix of styles (some of them
+late or implicit), and comments and strings that mention other modules.  A
+few "hot" modules are imported much more than the rest, as in real code.
+
+Everything is decided by a random.Random seeded from the arguments, so the
+same arguments always give the same tree.
+"""
+from __future__ import absolute_import
+
+import collections
+import os
+import random
+
+
+# How many modules are "hot", and what fraction of imports are of one.
+HOT_MODULES = 10
+HOT_RATIO = 0.3
+
+# The styles of top-level import we use.
+_IMPORT_STYLES = ('import', 'from', 'as', 'symbol')
+
+
+# A generated tree.  modules is a list of the fullnames of its modules;
+# module i defines func_i, Class_i and CONSTANT_i, and modules[:HOT_MODULES]
+# are the hot ones.  packages[i] is the fullname of the package that contains
+# modules[i].
+Tree = collections.namedtuple('Tree', ['root', 'modules', 'packages'])
+
+
+def _package_path(package_index, package_depth):
+    return (['pkg%s' % package_index] +
+            ['sub%s' % level for level in xrange(1, package_depth)])
+
+
+def _import(module, style):
+    """Return (import line, expression using module) for a top-level import.
+    """
+    package, name = module.rsplit('.', 1)
+    index = name[len('mod'):]
+    if style == 'import':
+        return 'import %s' % module, '%s.func_%s(1)' % (module, index)
+    elif style == 'from':
+        return ('from %s import %s' % (package, name),
+                '%s.func_%s(1)' % (name, index))
+    elif style == 'as':
+        return ('import %s as %s_alias' % (module, name),
+                '%s_alias.func_%s(1)' % (name, index))
+    else:
+        return ('from %s import func_%s' % (module, index),
+                'func_%s(1)' % index)
+
+
+def _module_text(i, fullname, imports, uses, late_functions, references):
+    lines = ['"""Synthetic module %s."""' % fullname,
+             'from __future__ import absolute_import',
+             '']
+    if imports:
+        lines.extend(sorted(set(imports)))
+        lines.append('')
+    lines.extend([
+        '',
+        'CONSTANT_%s = %s' % (i, i),
+        '',
+        '',
+        'def func_%s(x):' % i,
+        '    return x + CONSTANT_%s' % i,
+        '',
+        '',
+        'class Class_%s(object):' % i,
+        '    def method(self):',
+        '        return func_%s(CONSTANT_%s)' % (i, i),
+        '',
+        '',
+        'def uses_%s():' % i,
+    ])
+    for reference in references:
+        lines.append('    # Calls %s.' % reference)
+    lines.append('    return [')
+    for use in uses:
+        lines.append('        %s,' % use)
+    for reference in references:
+        lines.append("        '%s'," % reference)
+    lines.append('    ]')
+    for j, (late_import, use) in enumerate(late_functions):
+        lines.extend([
+            '',
+            '',
+            'def late_%s_%s():' % (i, j),
+            '    %s' % late_import,
+            '    return %s' % use,
+        ])
+    return '\n'.join(lines) + '\n'
+
+
+def generate_tree(root, num_files=1000, package_depth=3,
+                  modules_per_package=20, import_density=5.0,
+                  late_import_ratio=0.1, implicit_import_ratio=0.05,
+                  reference_ratio=0.1, seed=0):
+    """Write a synthetic tree of Python modules under root; return a Tree.
+
+    Arguments:
+        root: the directory to write to; it needn't exist, but shouldn't
+            contain anything else.
+        num_files: how many modules to write, not counting __init__.py's.
+        package_depth: how many packages deep each module is.
+        modules_per_package: how many modules to put in each package.
+        import_density: how many other modules each module imports, on
+            average.
+        late_import_ratio: the fraction of imports that are done inside a
+            function, rather than at the top of the file.
+        implicit_import_ratio: the fraction of imports that are implicit:
+            we import some other module in the same package, and refer to
+            the one we want by its fullname.
+        reference_ratio: the fraction of imports where we also mention the
+            symbol we use in a comment and a string.
+        seed: the seed for the random choices.
+    """
+    rng = random.Random(seed)
+    package_depth = max(package_depth, 1)
+    modules = []
+    packages = []
+    for i in xrange(num_files):
+        package = '.'.join(_package_path(i // modules_per_package,
+                                         package_depth))
+        packages.append(package)
+        modules.append('%s.mod%s' % (package, i))
+
+    for i, fullname in enumerate(modules):
+        num_imports = int(import_density)
+        if rng.random() < import_density - num_imports:
+            num_imports += 1
+        targets = set()
+        for _ in xrange(min(num_imports, num_files - 1)):
+            while True:
+                if rng.random() < HOT_RATIO:
+                    target = rng.randrange(min(HOT_MODULES, num_files))
+                else:
+                    target = rng.randrange(num_files)
+                if target != i and target not in targets:
+                    break
+            targets.add(target)
+
+        imports = []
+        uses = []
+        late_functions = []
+        references = []
+        for target in sorted(targets):
+            target_module = modules[target]
+            use = '%s.func_%s(2)' % (target_module, target)
+            kind = rng.random()
+            if kind < late_import_ratio:
+                late_functions.append(('import %s' % target_module, use))
+            elif kind < late_import_ratio + implicit_import_ratio:
+                # Import the first other module in target's package, if
+                # there is one, and use target through it.
+                start = target - target % modules_per_package
+                siblings = [j for j in xrange(
+                    start, min(start + modules_per_package, num_files))
+                    if j not in (i, target)]
+                if siblings:
+                    imports.append('import %s' % modules[siblings[0]])
+                else:
+                    imports.append('import %s' % target_module)
+                uses.append(use)
+            else:
+                import_line, use = _import(target_module,
+                                           rng.choice(_IMPORT_STYLES))
+                imports.append(import_line)
+                uses.append(use)
+            if rng.random() < reference_ratio:
+                references.append('%s.func_%s' % (target_module, target))
+
+        path = os.path.join(root, *fullname.split('.')) + '.py'
+        _write(path, _module_text(i, fullname, imports, uses, late_functions,
+                                  references))
+
+    for package in set(packages):
+        parts = package.split('.')
+        for depth in xrange(1, len(parts) + 1):
+            init = os.path.join(root, *(parts[:depth] + ['__init__.py']))
+            if not os.path.exists(init):
+                _write(init, '')
+
+    return Tree(root, modules, packages)
+
+
+def _write(path, text):
+    dirname = os.path.dirname(path)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    with open(path, 'w') as f:
+        f.write(text)
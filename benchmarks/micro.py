@@ -0,0 +1,213 @@
+"""Microbenchmarks for slicker's hot helpers.
+
+run.py tells us how long a whole move takes; this tells us which of the
+helpers slicker calls on every file got slower.  Each benchmark times one
+helper on one of the testdata/*_in.py fixtures repeated --scale times, which
+is roughly what those helpers see in a big file (or a big project).  We
+parse and tokenize the inputs before we start timing, so only the helper is
+timed.
+
+We print the best time per call, out of --repeat runs, for each benchmark,
+as JSON:
+    {"commit": ..., "python": ..., "scale": ...,
+     "results": {"names_starting_with": {"seconds_per_call": ...,
+                                         "calls": ...}, ...}}
+Pass --compare with an earlier run's JSON to also print how much each
+benchmark sped up or slowed down since then.
+
+Usage (from the root of the slicker repo):
+    python -m benchmarks.micro [--benchmark NAME ...] [--compare OLD.json]
+"""
+from __future__ import absolute_import
+
+import argparse
+import ast
+import collections
+import json
+import os
+import sys
+import time
+
+from . import run
+import khodemod
+import slicker
+import util
+
+
+_TESTDATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'testdata')
+
+
+def _scaled_file(name, scale):
+    """Return a util.File of testdata/name_in.py repeated scale times.
+
+    The tree and tokens are computed already, so timing doesn't count them.
+    """
+    with open(os.path.join(_TESTDATA, '%s_in.py' % name)) as f:
+        body = f.read() * scale
+    file_info = util.File('%s.py' % name, body)
+    file_info.tree, file_info.tokens
+    return file_info
+
+
+# Each benchmark takes the scale and returns the function to time.
+
+def _localnames_from_fullnames(scale):
+    file_info = _scaled_file('many_imports', scale)
+    fullnames = {'foo.bar.asdf', 'foo.quux.replaceme', 'foo.qux.nothing'}
+    return lambda: list(
+        slicker._localnames_from_fullnames(file_info, fullnames))
+
+
+def _localnames_from_localnames(scale):
+    file_info = _scaled_file('many_imports', scale)
+    localnames = {'foo.bar.asdf', 'quux.replaceme', 'qux.nothing'}
+    return lambda: list(
+        slicker._localnames_from_localnames(file_info, localnames))
+
+
+def _names_starting_with(scale):
+    file_info = _scaled_file('many_imports', scale)
+    return lambda: slicker._names_starting_with('foo', file_info.tree)
+
+
+def _unused_imports(scale):
+    file_info = _scaled_file('many_imports', scale)
+    # Just the first copy's import: with one per copy, the time would grow
+    # as scale**2, which isn't what we want to measure.
+    imports = {min((imp for imp in slicker._compute_all_imports(file_info)
+                    if imp.name == 'foo.bar'),
+                   key=lambda imp: imp.span)}
+    return lambda: slicker._unused_imports(imports, 'foo.bar', file_info)
+
+
+def _replace_in_string(scale):
+    file_info = _scaled_file('comments', scale)
+    strings = [node for node in ast.walk(file_info.tree)
+               if isinstance(node, ast.Str)]
+    regex = slicker._re_for_name('baz.some_function')
+
+    def replace_all():
+        for node in strings:
+            for _ in slicker._replace_in_string(node, regex, 'qux.new_name',
+                                                file_info):
+                pass
+    return replace_all
+
+
+def _get_area_for_ast_node(scale):
+    file_info = _scaled_file('comments', scale)
+    nodes = file_info.tree.body
+
+    def get_all_areas():
+        for node in nodes:
+            util.get_area_for_ast_node(node, file_info,
+                                       include_previous_comments=True)
+    return get_all_areas
+
+
+def _patch_apply_to(scale):
+    body = _scaled_file('many_imports', scale).body
+    old = 'foo.baz.something'
+    start = body.index(old, len(body) // 2)
+    patch = khodemod.Patch('many_imports.py', old, 'qux.something',
+                           start, start + len(old))
+    return lambda: patch.apply_to(body)
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('localnames_from_fullnames', _localnames_from_fullnames),
+    ('localnames_from_localnames', _localnames_from_localnames),
+    ('names_starting_with', _names_starting_with),
+    ('unused_imports', _unused_imports),
+    ('replace_in_string', _replace_in_string),
+    ('get_area_for_ast_node', _get_area_for_ast_node),
+    ('patch_apply_to', _patch_apply_to),
+])
+
+
+def _time(fn, calls):
+    start = time.time()
+    for _ in xrange(calls):
+        fn()
+    return time.time() - start
+
+
+def time_benchmark(fn, repeat=3, min_seconds=0.2):
+    """Return (best seconds per call, calls per run) for fn.
+
+    Like timeit, we pick a number of calls that takes at least min_seconds,
+    and then time that many calls, repeat times.
+    """
+    calls = 1
+    while True:
+        seconds = _time(fn, calls)
+        if seconds >= min_seconds:
+            break
+        calls *= 10
+    times = [seconds] + [_time(fn, calls) for _ in xrange(repeat - 1)]
+    return min(times) / calls, calls
+
+
+def _format_comparison(old_results, new_results):
+    lines = []
+    for name, result in new_results.iteritems():
+        new = result['seconds_per_call']
+        if name in old_results:
+            old = old_results[name]['seconds_per_call']
+            lines.append('%-28s %12.6fs -> %12.6fs  (%.2fx)'
+                         % (name, old, new, new / old))
+        else:
+            lines.append('%-28s %12s -> %12.6fs' % (name, '', new))
+    return '\n'.join(lines)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.micro',
+        description=("Time slicker's hot helpers on scaled-up inputs, and "
+                     "print the results as JSON."))
+    parser.add_argument('--benchmark', action='append',
+                        choices=list(BENCHMARKS),
+                        help=('A benchmark to run; may be repeated.  '
+                              'Default is to run them all.'))
+    parser.add_argument('--scale', type=int, default=1000,
+                        help=('How many times to repeat each input file.  '
+                              'Default: %(default)s'))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help=('How many times to time each benchmark; we '
+                              'report the best.  Default: %(default)s'))
+    parser.add_argument('--compare', metavar='OLD_JSON',
+                        help=('The output of an earlier run (with the same '
+                              '--scale), to compare against.'))
+    parser.add_argument('--output', '-o',
+                        help='Write the JSON here, instead of to stdout.')
+    parsed_args = parser.parse_args(argv)
+
+    results = collections.OrderedDict()
+    for name in parsed_args.benchmark or BENCHMARKS:
+        fn = BENCHMARKS[name](parsed_args.scale)
+        seconds, calls = time_benchmark(fn, repeat=parsed_args.repeat)
+        results[name] = {'seconds_per_call': seconds, 'calls': calls}
+        print >>sys.stderr, '%s: %.6fs' % (name, seconds)
+
+    if parsed_args.compare:
+        with open(parsed_args.compare) as f:
+            old_results = json.load(f)['results']
+        print >>sys.stderr, _format_comparison(old_results, results)
+
+    output = json.dumps({
+        'commit': run.git_commit(),
+        'python': sys.version.split()[0],
+        'scale': parsed_args.scale,
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
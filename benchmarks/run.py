@@ -0,0 +1,205 @@
+"""Run slicker's end-to-end benchmarks, and print the results as JSON.
+
+Each scenario generates a synthetic tree (see generate.py) in a temporary
+directory and does one move in it with slicker.make_fixes.  We do each move
+in a fresh python process, so its peak RSS is its own, and record that, the
+wall time, and the khodemod.Stats for the move.  The output looks like:
+    {"commit": ..., "python": ..., "options": {...},
+     "results": [{"scenario": "symbol-move", "old_fullnames": [...],
+                  "new_fullname": ..., "wall_seconds": ...,
+                  "peak_rss_bytes": ..., "stats": {"total": {...}, ...}},
+                 ...]}
+Since the trees are deterministic, results from different commits (with the
+same options) are comparable.
+
+Usage (from the root of the slicker repo):
+    python -m benchmarks.run [--scenario NAME ...] [--output FILE]
+"""
+from __future__ import absolute_import
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import generate
+
+
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _sibling(fullname, name):
+    """Return the fullname of name, in the same package as fullname."""
+    if '.' in fullname:
+        return '%s.%s' % (fullname.rsplit('.', 1)[0], name)
+    return name
+
+
+# Each scenario is a pair (tree options, move), where tree options are
+# keyword arguments to generate.generate_tree, overriding those from the
+# commandline, and move is a function from the Tree to the arguments
+# (old_fullnames, new_fullname) for slicker.make_fixes.
+SCENARIOS = collections.OrderedDict([
+    # Move the hottest function to another hot module.
+    ('symbol-move', ({}, lambda tree: (
+        ['%s.func_0' % tree.modules[0]], tree.modules[1]))),
+    # Move the hottest module to a new name in another package.
+    ('module-move', ({}, lambda tree: (
+        [tree.modules[0]], _sibling(tree.modules[-1], 'moved_module')))),
+    # Move the package containing the hot modules, which has 200 modules, to
+    # a new top-level package.
+    ('package-move', ({'modules_per_package': 200}, lambda tree: (
+        [tree.packages[0]], 'moved_package'))),
+])
+
+
+def measure(root, old_fullnames, new_fullname):
+    """Do the move in root, and return a dict describing what it cost.
+
+    This is what we run in the child process; it should be the only thing
+    that process does, so the peak RSS is that of the move.
+    """
+    import slicker     # not at the top, so generating trees needn't.
+
+    start = time.time()
+    stats = slicker.make_fixes(old_fullnames, new_fullname,
+                               project_root=root)
+    wall_seconds = time.time() - start
+    return {
+        'wall_seconds': wall_seconds,
+        'peak_rss_bytes': stats.peak_rss_bytes,
+        'stats': stats.to_dict(),
+    }
+
+
+def _measure_in_child(root, old_fullnames, new_fullname):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [_REPO_ROOT] + filter(None, [env.get('PYTHONPATH')]))
+    child = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.run', '--measure',
+         json.dumps([root, old_fullnames, new_fullname])],
+        cwd=_REPO_ROOT, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = child.communicate()
+    if child.returncode:
+        raise RuntimeError('Moving %s to %s failed:\n%s'
+                           % (', '.join(old_fullnames), new_fullname, stderr))
+    # The result is the last line; the move may have printed other things.
+    return json.loads(stdout.splitlines()[-1])
+
+
+def git_commit():
+    """Return the git commit we're running at, or None if we can't tell."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=_REPO_ROOT,
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scenario(name, tree_options):
+    """Generate the tree for scenario name, do its move, and return a dict.
+    """
+    options, move = SCENARIOS[name]
+    options = dict(tree_options, **options)
+    tmpdir = tempfile.mkdtemp(prefix='slicker-bench-')
+    try:
+        tree = generate.generate_tree(tmpdir, **options)
+        old_fullnames, new_fullname = move(tree)
+        result = {
+            'scenario': name,
+            'tree_options': options,
+            'old_fullnames': old_fullnames,
+            'new_fullname': new_fullname,
+        }
+        result.update(_measure_in_child(tmpdir, old_fullnames, new_fullname))
+        return result
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description=('Do some moves in synthetic trees, and print how long '
+                     'they took, their peak memory use, and the work they '
+                     'did, as JSON.'))
+    parser.add_argument('--scenario', action='append',
+                        choices=list(SCENARIOS),
+                        help=('A scenario to run; may be repeated.  Default '
+                              'is to run them all.'))
+    parser.add_argument('--files', type=int, default=1000,
+                        help='Modules in each tree.  Default: %(default)s')
+    parser.add_argument('--package-depth', type=int, default=3,
+                        help=('How deep in packages each module is.  '
+                              'Default: %(default)s'))
+    parser.add_argument('--modules-per-package', type=int, default=20,
+                        help=('Modules in each package, except where the '
+                              'scenario says otherwise.  '
+                              'Default: %(default)s'))
+    parser.add_argument('--import-density', type=float, default=5.0,
+                        help=('How many modules each module imports, on '
+                              'average.  Default: %(default)s'))
+    parser.add_argument('--late-imports', type=float, default=0.1,
+                        help=('The fraction of imports done inside a '
+                              'function.  Default: %(default)s'))
+    parser.add_argument('--implicit-imports', type=float, default=0.05,
+                        help=('The fraction of imports that are implicit.  '
+                              'Default: %(default)s'))
+    parser.add_argument('--references', type=float, default=0.1,
+                        help=('The fraction of imports whose target is also '
+                              'mentioned in a comment and a string.  '
+                              'Default: %(default)s'))
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for generating trees.  Default: 0')
+    parser.add_argument('--output', '-o',
+                        help='Write the JSON here, instead of to stdout.')
+    # Internal: used to run a single move in a child process.
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parsed_args = parser.parse_args(argv)
+
+    if parsed_args.measure:
+        root, old_fullnames, new_fullname = json.loads(parsed_args.measure)
+        print json.dumps(measure(
+            root.encode('utf-8'),
+            [fullname.encode('utf-8') for fullname in old_fullnames],
+            new_fullname.encode('utf-8')))
+        return
+
+    tree_options = {
+        'num_files': parsed_args.files,
+        'package_depth': parsed_args.package_depth,
+        'modules_per_package': parsed_args.modules_per_package,
+        'import_density': parsed_args.import_density,
+        'late_import_ratio': parsed_args.late_imports,
+        'implicit_import_ratio': parsed_args.implicit_imports,
+        'reference_ratio': parsed_args.references,
+        'seed': parsed_args.seed,
+    }
+    results = []
+    for name in parsed_args.scenario or SCENARIOS:
+        results.append(run_scenario(name, tree_options))
+        print >>sys.stderr, '%s: %.2fs' % (name, results[-1]['wall_seconds'])
+
+    output = json.dumps({
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'options': tree_options,
+        'results': results,
+    }, indent=2, sort_keys=True)
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print output
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
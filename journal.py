@@ -0,0 +1,228 @@
+"""Checkpoint journals, so that a big move that dies can be resumed.
+
+A move of a big package can take hours, and if it dies partway through --
+out of memory, a CI timeout, ^C -- the tree is left half-moved.  So as a
+move goes, we write a journal of what we've done.  First comes the move
+we're doing, and our plan for it: things like the (old, new) pairs
+inputs.expand_and_normalize gave us, which we can't recompute from a
+half-moved tree.  Then comes a line for each step we complete (moving each
+pair, fixing references to it, cleaning up, sorting imports), with a content
+hash of each file changed since the last step.  We also note each file as we
+write or rename it, so we know about the files a step changed even if it
+died before it completed.
+
+When resuming, we check that every file the journal hashed still has that
+hash (or still doesn't exist), unless the step that died wrote it, so we
+know nobody's changed the tree since; then we skip the steps that were
+completed, and redo the rest.  Redoing a step that partly completed is
+safe: each step looks at the files as they are now, and there's nothing
+left to change in the files it already did.  The exception is renames: a
+step that moves a module should check renamed() to see if it already
+renamed it.
+Once a move completes, its journal is deleted.
+
+The journal is a file of JSON lines: first
+    {"move": {...the arguments to the move...}, "plan": {...}}
+and then any number of
+    {"step": "fix references 3", "files": {"foo/bar.py": "<sha1>",
+                                           "foo/baz.py": null, ...}}
+    {"written": "foo/bar.py"}
+    {"renamed": ["foo/bar.py", "foo/baz.py"]}
+where a null hash means the file didn't exist.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import threading
+
+
+JOURNAL_NAME = '.slicker-journal'
+
+
+def default_path(project_root):
+    return os.path.join(os.path.abspath(project_root), JOURNAL_NAME)
+
+
+def _hash(root, filename):
+    """The sha1 of the file's contents, or None if it doesn't exist."""
+    try:
+        with open(os.path.join(root, filename), 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError) as e:
+        if e.errno == 2:    # No such file
+            return None
+        raise
+
+
+def _to_str(value):
+    """Convert unicode from JSON to the (utf-8) strs slicker expects."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return [_to_str(item) for item in value]
+    elif isinstance(value, dict):
+        return {_to_str(key): _to_str(item)
+                for (key, item) in value.iteritems()}
+    return value
+
+
+def _files(filenames):
+    """The filenames that aren't directories (which end with a slash)."""
+    return [filename for filename in filenames
+            if not filename.endswith(os.sep)]
+
+
+class Journal(object):
+    """The journal of a single move, in a single project.
+
+    Use start() to begin a new journal, or resume() to pick up an existing
+    one; then checkpoint() after each step, and finish() when done.  While
+    the move runs, the journal should also be one of the frontend's
+    observers, so it hears about each file we write.
+    """
+    def __init__(self, path, root):
+        self.path = path
+        self.root = root
+        # The plan for the move; see start().
+        self.plan = None
+        # The steps we've completed.
+        self._done = set()
+        # Map from filename to its hash, as of the last step completed.
+        self._hashes = {}
+        # Files we've written since the last step completed.
+        self._written = set()
+        # (filename, new_filename) of the renames we've done since the last
+        # step completed.
+        self._renamed = set()
+        self._f = None
+        self._lock = threading.Lock()
+        # Steps may complete on several threads at once (see schedule.py);
+        # we checkpoint them one at a time.
+        self._checkpoint_lock = threading.Lock()
+
+    def start(self, move, plan):
+        """Begin a new journal, for the move with these arguments.
+
+        move is a dict of the move's arguments, and plan a dict of whatever
+        else we need to know to resume it; both must be JSON-able, and
+        tuples in plan will come back as lists.  We overwrite any existing
+        journal.
+        """
+        self.plan = plan
+        self._f = open(self.path, 'w')
+        self._append({'move': move, 'plan': plan}, sync=True)
+
+    def resume(self, move):
+        """Load the existing journal, for the move with these arguments.
+
+        We check that it's for the same move, and that the files it hashed
+        are unchanged (except those the step that died wrote); if not, we
+        raise ValueError.  Returns the files the
+        interrupted move modified, which should count as modified by this
+        one too.
+        """
+        try:
+            f = open(self.path)
+        except IOError:
+            raise ValueError("Cannot resume: there is no journal at %s"
+                             % self.path)
+        with f:
+            lines = [json.loads(line) for line in f if line.endswith('\n')]
+        if not lines or _to_str(lines[0]['move']) != move:
+            raise ValueError("Cannot resume: the journal at %s is for a "
+                             "different move" % self.path)
+        self.plan = _to_str(lines[0]['plan'])
+        for line in lines[1:]:
+            if 'step' in line:
+                self._done.add(_to_str(line['step']))
+                self._hashes.update(_to_str(line['files']))
+                self._written.clear()
+                self._renamed.clear()
+            elif 'renamed' in line:
+                self._renamed.add(tuple(_to_str(line['renamed'])))
+                self._written.update(_files(_to_str(line['renamed'])))
+            else:
+                self._written.add(_to_str(line['written']))
+
+        for filename, expected_hash in sorted(self._hashes.iteritems()):
+            # Files the interrupted step wrote may well have changed since
+            # the last step we completed; that's fine, since we'll redo it.
+            if (filename not in self._written and
+                    _hash(self.root, filename) != expected_hash):
+                raise ValueError("Cannot resume: %s has changed since the "
+                                 "journal at %s was written"
+                                 % (filename, self.path))
+        self._f = open(self.path, 'a')
+        return {filename for (filename, file_hash) in self._hashes.iteritems()
+                if file_hash is not None} | self._written
+
+    def is_done(self, step):
+        """True if the interrupted move we're resuming completed step."""
+        return step in self._done
+
+    def renamed(self, filename, new_filename):
+        """True if the step that died renamed filename to new_filename.
+
+        If so, and new_filename is still there, redoing the step shouldn't
+        rename it again.
+        """
+        return ((filename, new_filename) in self._renamed and
+                not os.path.exists(os.path.join(self.root, filename)) and
+                os.path.exists(os.path.join(self.root, new_filename)))
+
+    def checkpoint(self, step, modified_files):
+        """Note that we completed step.
+
+        modified_files is an iterable of the files (relative to root) the
+        move has modified so far, which must all be on disk.  We hash those
+        we've heard were written since the last step, and any we haven't
+        seen before (say, because they were renamed), so a step costs us time
+        in proportion to what it changed, not to what the whole move has.
+        """
+        with self._checkpoint_lock:
+            with self._lock:
+                filenames = self._written | {
+                    filename for filename in modified_files
+                    if filename not in self._hashes}
+                self._written = set()
+                self._renamed = set()
+            hashes = {}
+            for filename in filenames:
+                file_hash = _hash(self.root, filename)
+                if self._hashes.get(filename, False) != file_hash:
+                    hashes[filename] = self._hashes[filename] = file_hash
+            self._done.add(step)
+            self._append({'step': step, 'files': hashes}, sync=True)
+
+    def __call__(self, event):
+        """Note each file we write or rename; see khodemod.Frontend."""
+        if event.kind == 'file_written':
+            self._append({'written': event.filename})
+            with self._lock:
+                self._written.add(event.filename)
+        elif event.kind == 'file_renamed':
+            self._append({'renamed': [event.filename, event.new_filename]},
+                         sync=True)
+            with self._lock:
+                self._renamed.add((event.filename, event.new_filename))
+                self._written.update(
+                    _files([event.filename, event.new_filename]))
+
+    def _append(self, entry, sync=False):
+        with self._lock:
+            self._f.write(json.dumps(entry, sort_keys=True) + '\n')
+            self._f.flush()
+            if sync:
+                os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def finish(self):
+        """The move is done: delete the journal."""
+        self.close()
+        os.unlink(self.path)
@@ -12,10 +12,15 @@ TERMS:
     accepting a filename (string) and body (string, the text of that file) and
     yielding a series of khodemod.Patch objects, representing the changes to be
     made.  They may also yield khodemod.WarningInfo objects, which will be
-    displayed to the user as warnings, or raise khodemod.FatalError exceptions,
-    to refuse to process the given file.  Note that these changes will not be
-    applied until the suggestor completes operation.  For an example, see
-    regex_suggestor() below, which implements a simple find-and-replace.
+    displayed to the user as warnings, or khodemod.Rename objects, to move a
+    file (or directory) without rewriting its contents, or raise
+    khodemod.FatalError exceptions, to refuse to process the given file.  Note
+    that these changes will not be applied until the suggestor completes
+    operation.  For an example, see regex_suggestor() below, which implements
+    a simple find-and-replace.
+    A suggestor may also have a "needles" attribute: a list of strings, at
+    least one of which appears in every file the suggestor could possibly
+    change.  Frontends use it to skip files without even decoding them.
 "frontend": These are responsible for applying the changes given by a
     suggestor, perhaps displaying output to the user (or even prompting for
     input) as they go.  Currently, only one is implemented,
@@ -35,8 +40,23 @@ TODO(benkraft): Implement a commandline interface for the regex suggestors.
 """
 from __future__ import absolute_import
 
+import Queue
+import cProfile
 import collections
+import contextlib
+import heapq
+import json
+import mmap
+import multiprocessing.pool
 import os
+import re
+import resource
+import signal
+import sys
+import threading
+import time
+import traceback
+import zlib
 
 import tqdm
 
@@ -48,16 +68,69 @@ DEFAULT_EXTENSIONS = ('py',)
 
 
 # Dict from (path-filter function, root) to the actual list of paths.
+# Updates to it hold the lock, so that concurrent writers don't lose each
+# other's changes.
 _RESOLVE_PATHS_CACHE = {}
+_RESOLVE_PATHS_LOCK = threading.Lock()
+
+# Dict from the arguments to default_path_filter to the filter it returned,
+# so that callers asking for the same filter get the same function, and so
+# share _RESOLVE_PATHS_CACHE entries.
+_DEFAULT_PATH_FILTERS = {}
+
+# Dict from absolute path to (token, text) for writes that a frontend has
+# made but that may not be on disk yet: either it has handed them to its
+# background writer, or it's recording changes rather than making them (see
+# PatchRecordingFrontend).  text is None for a deletion; token identifies the
+# write (see _BackgroundWriter).  read_file and friends look here first, so
+# nobody sees stale contents.
+_PENDING_WRITES = {}
+_PENDING_WRITES_LOCK = threading.Lock()
+_NOT_PENDING = object()
+
+# Dict from absolute path to ((mtime, size, inode), text) for files we've
+# read, or None if we're not caching contents.  Long-running callers (see
+# cache_file_contents) use this to avoid re-reading files that haven't changed.
+_CONTENT_CACHE = None
+
+# The Stats we're adding to, or None if we're not collecting stats; and the
+# phase to attribute what we count to.  See collect_stats.  Threads running
+# parts of a job concurrently (see schedule.py) may each be in a different
+# phase: they set _THREAD_STATS_PHASE.phase, which overrides _STATS_PHASE.
+_STATS = None
+_STATS_PHASE = None
+_THREAD_STATS_PHASE = threading.local()
+_STATS_LOCK = threading.Lock()
+
+# The RunStatus describing what we're doing right now, or None if we're not
+# keeping track.  See track_status.
+_STATUS = None
+
+# The SlowestFilesProfiler profiling each file we run a suggestor on, or None
+# if we're not.  See profile_slowest_files.
+_FILE_PROFILER = None
+
+# The FileCosts to record how long each file takes us, or None if we're not
+# recording.  See record_costs.
+_COSTS = None
+
+# Whether we're keeping our memory use down, at some cost in speed.  See
+# low_memory.
+_LOW_MEMORY = False
+
+# Dict from absolute path to the text each file we've written had before our
+# first write to it (None if it didn't exist), or None if we're not keeping
+# track.  See remember_original_contents.
+_ORIGINAL_CONTENTS = None
 
 
 def regex_suggestor(regex, replacement):
     """Replaces regex (object) with replacement.
 
-    Replacment may use backreferences and such.
+    Replacment may use backreferences and such.  If the patches conflict
+    with those of other suggestors, the frontend reports all the conflicts
+    (see PatchSet) rather than applying any of them.
     TODO(benkraft): Support passing a function as a replacement.
-    TODO(benkraft): This won't necessarily work right for overlapping matches;
-    the patches may fail to apply.
     """
     def suggestor(filename, body):
         for match in regex.finditer(body):
@@ -66,6 +139,45 @@ def regex_suggestor(regex, replacement):
     return suggestor
 
 
+def combine_suggestors(suggestors):
+    """Run several suggestors on each file, as a single suggestor.
+
+    Each suggestor sees the file as it was before any of them ran, so this is
+    only useful for suggestors whose changes are independent -- say, each
+    fixing references to a different name.  The advantage is that we only go
+    through the files once.  If several suggestors suggest the same change
+    (for example, adding the same import), we only apply it once; if they
+    suggest conflicting ones, we raise FatalError.  See PatchSet.
+
+    We skip each suggestor on files that don't contain its needles; if every
+    suggestor has needles, the combined suggestor has all of them.
+    """
+    if len(suggestors) == 1:
+        return suggestors[0]
+
+    def suggestor(filename, body):
+        vals = []
+        for sub_suggestor in suggestors:
+            needles = getattr(sub_suggestor, 'needles', None)
+            if needles is not None and not any(n in body for n in needles):
+                continue
+            vals.extend(sub_suggestor(filename, body))
+
+        patch_set = PatchSet(val for val in vals if isinstance(val, Patch))
+        patch_set.check()
+        for val in patch_set:
+            yield val
+        for val in vals:
+            if not isinstance(val, Patch):
+                yield val
+
+    if all(getattr(sub_suggestor, 'needles', None) is not None
+           for sub_suggestor in suggestors):
+        suggestor.needles = [needle for sub_suggestor in suggestors
+                             for needle in sub_suggestor.needles]
+    return suggestor
+
+
 # old/new are unicode;
 # start/end are (unicode) character offsets for the old text.
 # TODO(benkraft): Include context for patching?
@@ -74,9 +186,15 @@ _Patch = collections.namedtuple('Patch',
 # pos is a (unicode) character offset for the warning.
 WarningInfo = collections.namedtuple('WarningInfo',
                                      ['filename', 'pos', 'message'])
+# filename and new_filename are relative to root.  If filename ends with a
+# slash, it names a directory, and the whole directory is moved.
+Rename = collections.namedtuple('Rename', ['filename', 'new_filename'])
 
 
 class Patch(object):
+    # A big move makes a lot of these, so we keep them small.
+    __slots__ = ('filename', 'old', 'new', 'start', 'end', 'permissions')
+
     def __init__(self, filename, old, new, start, end, file_permissions=None):
         """An object representing a change to make to a filename.
 
@@ -110,6 +228,104 @@ class Patch(object):
             return body[:self.start] + self.new + body[self.end:]
 
 
+class PatchSet(object):
+    """A set of patches, to one or more files, that we check for conflicts.
+
+    Patches that make the same change are only kept once.  That includes
+    both identical patches and "nested" ones, where one makes the same
+    change as the other but includes more unchanged text around it.
+
+    Any other two patches conflict if their regions overlap: if one starts
+    strictly inside the other, or they start at the same place and neither
+    is an insertion.  (Insertions at the same place, or at the edge of
+    another patch, are fine.)  A patch deleting a file conflicts with any
+    other patch to that file.  We find conflicts by sorting each file's
+    patches, and sweeping over them keeping track of the one that extends
+    furthest, so we look at each patch only once.
+    """
+    def __init__(self, patches=()):
+        # Map from filename to the list of its patches, in the order added.
+        self._patches_by_file = collections.OrderedDict()
+        # The normalized forms (see _key) of the patches we've kept.
+        self._keys = set()
+        for patch in patches:
+            self.add(patch)
+
+    @staticmethod
+    def _key(patch):
+        """A key identifying the change a patch makes.
+
+        We trim any text that old and new share at the beginning or end, so
+        that nested duplicates have the same key.
+        """
+        if patch.new is None:
+            return (patch.filename, patch.start, patch.end, patch.old, None)
+        old = patch.old or ''
+        new = patch.new
+        prefix = len(os.path.commonprefix([old, new]))
+        suffix = len(os.path.commonprefix([old[prefix:][::-1],
+                                           new[prefix:][::-1]]))
+        return (patch.filename, patch.start + prefix,
+                patch.end - suffix, old[prefix:len(old) - suffix],
+                new[prefix:len(new) - suffix])
+
+    def add(self, patch):
+        """Add a patch, unless it does nothing or we already have it."""
+        if patch.old == patch.new:
+            return
+        key = self._key(patch)
+        if key not in self._keys:
+            self._keys.add(key)
+            self._patches_by_file.setdefault(patch.filename, []).append(
+                patch)
+
+    def filenames(self):
+        """The files we have patches to, in the order we first saw them."""
+        return list(self._patches_by_file)
+
+    def patches_for(self, filename):
+        """Return the patches to filename, ordered by start position.
+
+        At the same position, insertions go first, so that applying the
+        patches in reverse order works; among several insertions at the same
+        position, longer ones go first.
+        """
+        return sorted(self._patches_by_file.get(filename, []),
+                      key=lambda p: (p.start, p.end,
+                                     len(p.old or '') - len(p.new or '')))
+
+    def __iter__(self):
+        for filename in self._patches_by_file:
+            for patch in self.patches_for(filename):
+                yield patch
+
+    def conflicts(self):
+        """Return a list of pairs of conflicting patches."""
+        conflicts = []
+        for filename in self._patches_by_file:
+            patches = self.patches_for(filename)
+            deletions = [p for p in patches if p.new is None]
+            if deletions and len(patches) > 1:
+                conflicts.extend((deletions[0], p) for p in patches
+                                 if p is not deletions[0])
+                continue
+            furthest = None
+            for patch in patches:
+                if furthest is not None and patch.start < furthest.end:
+                    conflicts.append((furthest, patch))
+                if furthest is None or patch.end > furthest.end:
+                    furthest = patch
+        return conflicts
+
+    def check(self):
+        """Raise FatalError describing every conflict, if there are any."""
+        conflicts = self.conflicts()
+        if conflicts:
+            raise FatalError(conflicts[0][1].filename, conflicts[0][1].start,
+                             "Conflicting changes: %s" % '; '.join(
+                                 '%s and %s' % pair for pair in conflicts))
+
+
 class FatalError(RuntimeError):
     """Something went horribly wrong; we should give up patching this file."""
     def __init__(self, filename, pos, message):
@@ -167,14 +383,206 @@ def and_filters(filters):
     return lambda item: all(f(item) for f in filters)
 
 
+def _gitignore_pattern_to_regex(pattern):
+    """Convert a .gitignore pattern to a regex (as a string).
+
+    The regex matches paths relative to the directory containing the
+    .gitignore, using '/' as the separator, with directories (but not files)
+    having a trailing slash.  It also matches everything in a matching
+    directory.  Returns None for blank lines and comments.
+
+    See `man gitignore` for the pattern format.  We don't support trailing
+    spaces escaped with a backslash.
+    """
+    pattern = pattern.rstrip()
+    if not pattern or pattern.startswith('#'):
+        return None
+    if pattern.startswith('\\'):
+        # An escaped '#' or '!'.
+        pattern = pattern[1:]
+
+    dir_only = pattern.endswith('/')
+    pattern = pattern.rstrip('/')
+    # A pattern with a slash anywhere but the end is relative to the
+    # .gitignore's directory; otherwise it may match at any depth.
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+
+    regex = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            regex.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            regex.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            regex.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            contents = pattern[i + 1:end].replace('\\', '\\\\')
+            if contents.startswith('!'):
+                contents = '^' + contents[1:]
+            regex.append('[%s]' % contents)
+            i = end + 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            regex.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            regex.append(re.escape(pattern[i]))
+            i += 1
+
+    return '%s%s%s' % ('' if anchored else '(?:.*/)?',
+                       ''.join(regex),
+                       '/.*' if dir_only else '(?:/.*)?')
+
+
+class _GitignoreRules(object):
+    """The rules from all the .gitignore files under a root.
+
+    We read each directory's .gitignore the first time we're asked about a
+    path in that directory; since we walk top-down, that's before we look at
+    anything in it.  Each file's rules are compiled into a few big regexes:
+    one for each run of consecutive ignore-rules or negated rules, so that
+    we can honor "the last matching rule wins" without checking each rule.
+    """
+    def __init__(self, root):
+        self.root = root
+        # Map from directory (relative to root, '' for root itself) to a
+        # list of (compiled regex, whether a match means "ignore"), in the
+        # order to check them; or None if there's no .gitignore there.
+        self._rules_by_dir = {}
+
+    def _rules_for_dir(self, dirname):
+        if dirname not in self._rules_by_dir:
+            try:
+                with open(os.path.join(self.root, dirname,
+                                       '.gitignore')) as f:
+                    lines = f.read().splitlines()
+            except IOError:
+                lines = []
+
+            runs = []    # lists of [regex-strings, ignore?], in file order
+            for line in lines:
+                ignore = not line.startswith('!')
+                regex = _gitignore_pattern_to_regex(
+                    line if ignore else line[1:])
+                if regex is None:
+                    continue
+                if not runs or runs[-1][1] != ignore:
+                    runs.append([[], ignore])
+                runs[-1][0].append(regex)
+            self._rules_by_dir[dirname] = [
+                (re.compile('^(?:%s)$' % '|'.join(regexes)), run_ignores)
+                for (regexes, run_ignores) in reversed(runs)] or None
+        return self._rules_by_dir[dirname]
+
+    def ignores(self, path):
+        """Return whether path (relative to root) is gitignored.
+
+        As elsewhere, directories should have a trailing slash.
+        """
+        path = path.replace(os.sep, '/')
+        parts = path.rstrip('/').split('/')
+        # .gitignore files in deeper directories take precedence, so we
+        # look at those first.
+        for i in xrange(len(parts) - 1, -1, -1):
+            rules = self._rules_for_dir(os.sep.join(parts[:i]))
+            if rules:
+                relpath = '/'.join(parts[i:]) + ('/' if path.endswith('/')
+                                                 else '')
+                for (regex, ignore) in rules:
+                    if regex.match(relpath):
+                        return ignore
+        return False
+
+
 def default_path_filter(extensions=DEFAULT_EXTENSIONS,
                         include_extensionless=False,
-                        exclude_paths=DEFAULT_EXCLUDE_PATHS):
-    return and_filters([
-        extensions_path_filter(extensions, include_extensionless),
-        dotfiles_path_filter(),
-        exclude_paths_filter(exclude_paths),
-    ])
+                        exclude_paths=DEFAULT_EXCLUDE_PATHS,
+                        root=None):
+    """The path filter most callers want.
+
+    This excludes files without the given extensions, dotfiles, and any
+    file with one of exclude_paths as a component of its path.  If root is
+    given, it also excludes files ignored by the .gitignore files under root
+    (and the path filter must then be used with that root).
+
+    This is equivalent to and_filters() of the individual filters above
+    (plus the .gitignore rules), but it's called on every path in the tree,
+    so we check everything at once, splitting the path only once.
+
+    Calls with the same arguments return the same filter, so they share the
+    cached results of resolve_paths, until forget_resolved_paths(root).
+    """
+    exclude_paths = frozenset(exclude_paths)
+    key = (extensions, include_extensionless, exclude_paths, root)
+    if key not in _DEFAULT_PATH_FILTERS:
+        _DEFAULT_PATH_FILTERS[key] = _default_path_filter(
+            extensions, include_extensionless, exclude_paths, root)
+    return _DEFAULT_PATH_FILTERS[key]
+
+
+def _default_path_filter(extensions, include_extensionless, exclude_paths,
+                         root):
+    gitignore_rules = _GitignoreRules(root) if root is not None else None
+
+    def filter_path(path):
+        is_dir = path.endswith(os.sep)
+        parts = path.split(os.sep)
+        if is_dir:
+            parts.pop()
+        for part in parts:
+            if part in exclude_paths or (
+                    len(part) > 1 and part.startswith('.')):
+                return False
+
+        if not is_dir and extensions != '*':
+            _, ext = os.path.splitext(parts[-1])
+            if ext:
+                if ext.lstrip(os.path.extsep) not in extensions:
+                    return False
+            elif not include_extensionless:
+                return False
+
+        return not (gitignore_rules and gitignore_rules.ignores(path))
+
+    return filter_path
+
+
+def _pending_write(root, filename):
+    """Return the text we're about to write to filename, if any.
+
+    That's None if we're about to delete it, and _NOT_PENDING if there's no
+    write to it in flight.
+    """
+    if not _PENDING_WRITES:    # the common case; don't bother with abspath
+        return _NOT_PENDING
+    abspath = os.path.abspath(os.path.join(root, filename))
+    return _PENDING_WRITES.get(abspath, (None, _NOT_PENDING))[1]
+
+
+def _file_exists(abspath):
+    """Like os.path.exists, but taking into account pending writes."""
+    pending = _PENDING_WRITES.get(abspath)
+    if pending is not None:
+        return pending[1] is not None
+    return os.path.exists(abspath)
+
+
+def file_exists(root, filename):
+    """Whether filename exists, taking into account pending writes.
+
+    filename is taken relative to root.  Suggestors should use this (and
+    read_file) rather than looking at the disk, since a file we've written
+    may not have made it there yet; see _BackgroundWriter.
+    """
+    return _file_exists(os.path.abspath(os.path.join(root, filename)))
 
 
 def read_file(root, filename):
@@ -182,16 +590,891 @@ def read_file(root, filename):
 
     filename is taken relative to root.
     """
-    # TODO(benkraft): Cache contents.
+    pending = _pending_write(root, filename)
+    if pending is not _NOT_PENDING:
+        return pending
     try:
+        if _CONTENT_CACHE is not None:
+            return _read_file_cached(root, filename)
         with open(os.path.join(root, filename)) as f:
-            return unicode_util.decode(filename, f.read())
-    except IOError as e:
+            data = f.read()
+        count('files_read')
+        count('bytes_read', len(data))
+        return unicode_util.decode(filename, data)
+    except (IOError, OSError) as e:
         if e.errno == 2:    # No such file
             return None     # empty file
         raise
 
 
+def _read_file_cached(root, filename):
+    """Like read_file, but use _CONTENT_CACHE if the file hasn't changed."""
+    abspath = os.path.abspath(os.path.join(root, filename))
+    stat = os.stat(abspath)
+    key = (stat.st_mtime, stat.st_size, stat.st_ino)
+    cached = _CONTENT_CACHE.get(abspath)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(abspath) as f:
+        data = f.read()
+    count('files_read')
+    count('bytes_read', len(data))
+    text = unicode_util.decode(filename, data)
+    _CONTENT_CACHE[abspath] = (key, text)
+    return text
+
+
+@contextlib.contextmanager
+def cache_file_contents(cache=None):
+    """Within this context, read_file caches what it reads.
+
+    This is for long-running processes that may read the same files many
+    times.  We check the file's mtime, size and inode on every read, and
+    re-read it if any have changed.  To keep the cache across several
+    contexts, pass the same dict as cache to each; otherwise we start empty.
+    """
+    global _CONTENT_CACHE
+    old_cache = _CONTENT_CACHE
+    _CONTENT_CACHE = {} if cache is None else cache
+    try:
+        yield
+    finally:
+        _CONTENT_CACHE = old_cache
+
+
+class LRUCache(object):
+    """A dict-like cache that holds at most max_bytes worth of values.
+
+    sizeof(value) says how many bytes a value costs us.  When the values add
+    up to more than max_bytes, we evict the least recently used.  This
+    supports just what our caches need (get, [], in, pop and len), so it can
+    stand in for the dicts passed to cache_file_contents and
+    util.cache_parses.  It's safe to use from several threads at once.
+    """
+    def __init__(self, max_bytes, sizeof=sys.getsizeof):
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        # Map from key to (value, size), least recently used first.
+        self._data = collections.OrderedDict()
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self._data[key] = item     # it's now the most recently used
+            return item[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __setitem__(self, key, value):
+        size = self._sizeof(value)
+        evictions = 0
+        with self._lock:
+            old_item = self._data.pop(key, None)
+            if old_item is not None:
+                self.size -= old_item[1]
+            # A value bigger than the whole cache would just evict
+            # everything else, so we don't keep it.
+            if size <= self.max_bytes:
+                self._data[key] = (value, size)
+                self.size += size
+            while self.size > self.max_bytes:
+                (_, (_, evicted_size)) = self._data.popitem(last=False)
+                self.size -= evicted_size
+                evictions += 1
+        if evictions:
+            count('cache_evictions', evictions)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            if item is None:
+                return default
+            self.size -= item[1]
+            return item[0]
+
+
+@contextlib.contextmanager
+def low_memory(enabled=True):
+    """Within this context, keep our memory use down, at some cost in speed.
+
+    resolve_paths doesn't keep the list of files: it walks the tree each
+    time, yielding paths as it finds them, so a tree of millions of files
+    needn't fit in memory.  (Likewise, progress reports don't list the files
+    up front, so give no ETA for passes over the whole tree.)  Callers
+    should also bound their caches; see LRUCache.  If enabled is false,
+    we don't: we work as we would outside the context.
+    """
+    global _LOW_MEMORY
+    old_low_memory = _LOW_MEMORY
+    _LOW_MEMORY = enabled
+    try:
+        yield
+    finally:
+        _LOW_MEMORY = old_low_memory
+
+
+@contextlib.contextmanager
+def remember_original_contents(originals=None):
+    """Within this context, remember what the files we write used to say.
+
+    Yields a dict from absolute path to the text each file had before the
+    first write to it in this context, or None if it didn't exist.  (If we
+    renamed it before writing it, that's the text it had after the rename.)
+    We usually just read the file before patching it, so this costs us
+    little but the memory.  Pass originals to add to an existing dict.
+    """
+    global _ORIGINAL_CONTENTS
+    old_originals = _ORIGINAL_CONTENTS
+    _ORIGINAL_CONTENTS = {} if originals is None else originals
+    try:
+        yield _ORIGINAL_CONTENTS
+    finally:
+        _ORIGINAL_CONTENTS = old_originals
+
+
+class Stats(object):
+    """Counts of the work we did, by phase.
+
+    These are the stages of the funnel each file goes through -- was it
+    enumerated, rejected by the prefilter, read, parsed, patched, written --
+    and how much I/O we did, which is what we need to judge whether caches
+    and prefilters are doing their job.  We also count writes per file, to
+    spot files we rewrite over and over.
+    """
+    # The counters, in funnel order, with their descriptions.
+    COUNTERS = (
+        ('files_enumerated', 'files enumerated'),
+        ('files_prefiltered', 'files rejected by prefilter'),
+        ('files_read', 'files read'),
+        ('bytes_read', 'bytes read'),
+        ('files_parsed', 'files parsed'),
+        ('tokens_built', 'asttokens builds'),
+        ('patches', 'patches generated'),
+        ('files_written', 'files written'),
+        ('rewrites', 'rewrites of the same file'),
+        ('bytes_written', 'bytes written'),
+        ('cache_evictions', 'cache evictions'),
+    )
+
+    def __init__(self):
+        # The phases we've seen, in order.
+        self.phases = []
+        # Map from phase to a Counter of the above counters.
+        self._counts = {}
+        # Map from phase to a Counter of writes to each absolute path.
+        self._writes = {}
+        # The process's peak memory use, as of the end of collect_stats.
+        self.peak_rss_bytes = None
+
+    def _phase(self, phase):
+        if phase not in self._counts:
+            self.phases.append(phase)
+            self._counts[phase] = collections.Counter()
+            self._writes[phase] = collections.Counter()
+        return phase
+
+    def add(self, counter, n=1, phase=None):
+        self._counts[self._phase(phase)][counter] += n
+
+    def add_write(self, abspath, nbytes, phase=None):
+        self._writes[self._phase(phase)][abspath] += 1
+        self._counts[phase]['bytes_written'] += nbytes
+
+    def get(self, counter, phase=None):
+        """Return the value of a counter, in one phase or (by default) all."""
+        phases = self.phases if phase is None else [phase]
+        if counter in ('files_written', 'rewrites'):
+            writes = collections.Counter()
+            for phase in phases:
+                writes.update(self._writes.get(phase, {}))
+            if counter == 'files_written':
+                return len(writes)
+            return sum(writes.values()) - len(writes)
+        return sum(self._counts.get(phase, {}).get(counter, 0)
+                   for phase in phases)
+
+    def most_rewritten(self, n=5):
+        """Return the n files written most often, as (abspath, count)."""
+        writes = collections.Counter()
+        for phase in self.phases:
+            writes.update(self._writes[phase])
+        return [(path, count) for (path, count) in writes.most_common(n)
+                if count > 1]
+
+    def to_dict(self):
+        """Return the counters as a JSON-able dict.
+
+        It maps each phase, and 'total', to a dict from counter to value.
+        Phases are strs; None, the phase outside of any stats_phase, becomes
+        'other'.
+        """
+        result = {
+            'other' if phase is None else str(phase): {
+                counter: self.get(counter, phase)
+                for (counter, _) in self.COUNTERS}
+            for phase in self.phases}
+        result['total'] = {counter: self.get(counter)
+                           for (counter, _) in self.COUNTERS}
+        return result
+
+    def format(self):
+        """Return a table of the counters, by phase, as a string."""
+        headers = [str(phase) for phase in self.phases] + ['total']
+        rows = [[description] + [str(self.get(counter, phase))
+                                 for phase in self.phases] +
+                [str(self.get(counter))]
+                for (counter, description) in self.COUNTERS]
+        widths = [max(len(row[0]) for row in rows)] + [
+            max(len(headers[i]), max(len(row[i + 1]) for row in rows))
+            for i in xrange(len(headers))]
+        lines = ['  '.join([' ' * widths[0]] +
+                           [h.rjust(w) for (h, w) in zip(headers,
+                                                         widths[1:])])]
+        for row in rows:
+            lines.append('  '.join(
+                [row[0].ljust(widths[0])] +
+                [cell.rjust(w) for (cell, w) in zip(row[1:], widths[1:])]))
+        for (path, count) in self.most_rewritten():
+            lines.append('%s written %s times' % (path, count))
+        if self.peak_rss_bytes is not None:
+            lines.append('peak memory use: %.1f MB'
+                         % (self.peak_rss_bytes / 1024.0 / 1024.0))
+        return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def collect_stats(stats=None):
+    """Within this context, count the work we do; yields the Stats.
+
+    Pass stats to add to an existing Stats object.  Use stats_phase to
+    say what phase of the job we're in.  When we're done, we note the
+    process's peak memory use so far in the Stats.
+    """
+    global _STATS
+    old_stats = _STATS
+    _STATS = Stats() if stats is None else stats
+    try:
+        yield _STATS
+    finally:
+        _STATS.peak_rss_bytes = peak_rss_bytes()
+        _STATS = old_stats
+
+
+def peak_rss_bytes():
+    """The most memory (resident set size) this process has used so far."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes; OS X, bytes.
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+@contextlib.contextmanager
+def stats_phase(phase):
+    """Attribute the work done within this context to phase.
+
+    The phase is also shown in progress reports; see RunStatus.
+    """
+    global _STATS_PHASE
+    old_phase = _STATS_PHASE
+    old_thread_phase = getattr(_THREAD_STATS_PHASE, 'phase', _NO_PHASE)
+    _STATS_PHASE = _THREAD_STATS_PHASE.phase = phase
+    try:
+        yield
+    finally:
+        _STATS_PHASE = old_phase
+        if old_thread_phase is _NO_PHASE:
+            del _THREAD_STATS_PHASE.phase
+        else:
+            _THREAD_STATS_PHASE.phase = old_thread_phase
+
+
+_NO_PHASE = object()
+
+
+def current_phase():
+    """The phase this thread's work counts towards; see stats_phase."""
+    return getattr(_THREAD_STATS_PHASE, 'phase', _STATS_PHASE)
+
+
+@contextlib.contextmanager
+def _in_phase(phase):
+    """Like stats_phase, but only for this thread.
+
+    This is for helper threads, so their work counts towards the phase of
+    the thread they're helping.
+    """
+    old_thread_phase = getattr(_THREAD_STATS_PHASE, 'phase', _NO_PHASE)
+    _THREAD_STATS_PHASE.phase = phase
+    try:
+        yield
+    finally:
+        if old_thread_phase is _NO_PHASE:
+            del _THREAD_STATS_PHASE.phase
+        else:
+            _THREAD_STATS_PHASE.phase = old_thread_phase
+
+
+def count(counter, n=1):
+    """Add n to the given counter (see Stats), if we're collecting stats."""
+    if _STATS is not None:
+        phase = current_phase()
+        with _STATS_LOCK:
+            _STATS.add(counter, n, phase)
+
+
+class RunStatus(object):
+    """What we're doing right now, for progress reports.  See track_status.
+
+    Callers may set task to describe the overall job (say, what we're moving
+    where); frontends keep track of which file they're on, and how far they
+    are through the current pass over the files.  A job may make any number
+    of passes, which we can't know up front, so the ETA we give is for the
+    current pass only, and says so.
+    """
+    def __init__(self):
+        self.task = None
+        self.filename = None
+        # How many passes we've started, including the current one.
+        self.passes = 0
+        self.files_done = 0
+        # None if we don't know how many files this pass will look at.
+        self.files_total = None
+        self.pass_started = None
+        # If we know how long each file took in the past (see FileCosts),
+        # the total of those costs for this pass, and for the files done.
+        self.cost_total = None
+        self.cost_done = 0
+
+    def start_pass(self, filenames, costs=None):
+        """Start a pass over filenames.
+
+        If passed, costs are the estimated costs of the files; then we base
+        the ETA on those, rather than treating every file the same.
+        """
+        self.filename = None
+        self.passes += 1
+        self.files_done = 0
+        self.files_total = (len(filenames) if hasattr(filenames, '__len__')
+                            else None)
+        self.cost_total = None if costs is None else sum(costs)
+        self.cost_done = 0
+        self.pass_started = time.time()
+
+    def file_done(self, cost=None):
+        """Note that we're done with a file, with the given estimated cost."""
+        self.files_done += 1
+        self.cost_done += cost or 0
+
+    def eta(self):
+        """Return the seconds until we're done with this pass, or None."""
+        elapsed = max(time.time() - self.pass_started, 1e-6)
+        if self.cost_total is not None and self.cost_done:
+            return (self.cost_total - self.cost_done) * elapsed / (
+                self.cost_done)
+        if not self.files_done or self.files_total is None:
+            return None
+        rate = self.files_done / elapsed
+        return (self.files_total - self.files_done) / rate
+
+    def format(self):
+        parts = []
+        if _STATS_PHASE:
+            parts.append('[%s]' % _STATS_PHASE)
+        if self.task:
+            parts.append(self.task)
+        if self.pass_started is not None:
+            parts.append('pass %s: %s/%s files' % (
+                self.passes, self.files_done,
+                '?' if self.files_total is None else self.files_total))
+            eta = self.eta()
+            if eta is not None:
+                parts.append('pass ETA %d:%02d' % divmod(int(eta), 60))
+        if self.filename:
+            parts.append(self.filename)
+        return ' '.join(parts)
+
+
+@contextlib.contextmanager
+def track_status():
+    """Within this context, keep track of what we're doing; yields RunStatus.
+
+    See also report_progress and dump_status_on_signal, which tell the user.
+    """
+    global _STATUS
+    old_status = _STATUS
+    _STATUS = RunStatus()
+    try:
+        yield _STATUS
+    finally:
+        _STATUS = old_status
+
+
+def _start_status_pass(filenames, root=None):
+    """Tell _STATUS, if we're tracking, that we're starting a pass.
+
+    filenames are the files the pass will look at, relative to root; or if
+    root is None, (root, filename) pairs.
+    """
+    if _STATUS is None:
+        return
+    if _COSTS is None or not hasattr(filenames, '__len__'):
+        _STATUS.start_pass(filenames)
+        return
+    if root is None:
+        pairs = filenames
+    else:
+        pairs = [(root, filename) for filename in filenames]
+    _STATUS.start_pass(filenames, [_COSTS.cost(file_root, filename)
+                                   for (file_root, filename) in pairs])
+
+
+def _status_file_done(root, filename):
+    """Tell _STATUS, if we're tracking, that we're done with filename."""
+    if _STATUS is not None:
+        _STATUS.file_done(None if _COSTS is None
+                          else _COSTS.cost(root, filename))
+
+
+def set_status_task(task):
+    """Describe the overall job, for progress reports, if we're tracking."""
+    if _STATUS is not None:
+        _STATUS.task = task
+
+
+@contextlib.contextmanager
+def report_progress(stream=None, interval=1.0):
+    """Within this context, print the RunStatus every interval seconds.
+
+    We print on a background thread, to stream (default: stderr), whenever
+    we're within track_status; if stream is a terminal, we keep overwriting
+    the same line.
+    """
+    stream = stream or sys.stderr
+    is_tty = hasattr(stream, 'isatty') and stream.isatty()
+    done = threading.Event()
+
+    def report():
+        last_line = None
+        while not done.wait(interval):
+            status = _STATUS
+            line = status and status.format()
+            if not line or line == last_line:
+                continue
+            last_line = line
+            if is_tty:
+                stream.write('\r\x1b[K' + line)
+            else:
+                stream.write(line + '\n')
+            stream.flush()
+        if is_tty and last_line is not None:
+            stream.write('\r\x1b[K')
+
+    thread = threading.Thread(target=report)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield
+    finally:
+        done.set()
+        thread.join()
+
+
+def dump_status_on_signal(signum=getattr(signal, 'SIGUSR1', None),
+                          stream=None):
+    """When we get signum, print the RunStatus and every thread's stack.
+
+    This lets one see what a long run is up to -- and where it's stuck, if
+    it's hung -- without stopping it.  Suggestors may run on the main thread
+    or, with several workers (see schedule.py), on others, so we print the
+    stacks of all of them, the main thread's first.  Must be called from the
+    main thread.  Does nothing on platforms without the signal.
+    """
+    if signum is None:
+        return
+
+    def handler(signum, frame):
+        out = stream or sys.stderr
+        if _STATUS is not None:
+            out.write('Status: %s\n' % _STATUS.format())
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        # Signal handlers run on the main thread; we start its stack at the
+        # frame we interrupted, so as to leave out the handler itself.
+        main_ident = threading.current_thread().ident
+        frames[main_ident] = frame
+        for ident in sorted(frames, key=lambda i: (i != main_ident, i)):
+            out.write('Stack of thread %s (most recent call last):\n'
+                      % names.get(ident, ident))
+            out.write(''.join(traceback.format_stack(frames[ident])))
+        out.flush()
+
+    signal.signal(signum, handler)
+
+
+class SlowestFilesProfiler(object):
+    """Profiles each file we run a suggestor on, keeping the n slowest.
+
+    When one file takes much longer than the rest, a profile of just that
+    file is much easier to make sense of than one of the whole run.
+    """
+    def __init__(self, n):
+        self.n = n
+        # A min-heap of (seconds, sequence number, filename, cProfile.Profile)
+        # for the n slowest files so far.
+        self._heap = []
+        self._count = 0
+        # Several threads may run suggestors at once; see schedule.py.
+        self._lock = threading.Lock()
+
+    def runcall(self, filename, fn, *args):
+        """Call fn(*args), profiling it, on behalf of filename."""
+        profiler = cProfile.Profile()
+        start = time.time()
+        try:
+            return profiler.runcall(fn, *args)
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self._count += 1
+                item = (elapsed, self._count, filename, profiler)
+                if len(self._heap) < self.n:
+                    heapq.heappush(self._heap, item)
+                elif elapsed > self._heap[0][0]:
+                    heapq.heapreplace(self._heap, item)
+
+    def slowest(self):
+        """Return a list of (seconds, filename, profile), slowest first."""
+        with self._lock:
+            heap = list(self._heap)
+        return [(elapsed, filename, profiler)
+                for (elapsed, _, filename, profiler)
+                in sorted(heap, reverse=True)]
+
+    def dump(self, prefix):
+        """Write the profiles to prefix.1 (the slowest), prefix.2, etc.
+
+        Returns a list of (path, seconds, filename).
+        """
+        retval = []
+        for (i, (elapsed, filename, profiler)) in enumerate(self.slowest()):
+            path = '%s.%s' % (prefix, i + 1)
+            profiler.dump_stats(path)
+            retval.append((path, elapsed, filename))
+        return retval
+
+
+@contextlib.contextmanager
+def profile_slowest_files(n):
+    """Within this context, profile each file we run a suggestor on.
+
+    Yields a SlowestFilesProfiler, which keeps the profiles of the n slowest.
+    A file counts once for each suggestor run on it.
+    """
+    global _FILE_PROFILER
+    old_profiler = _FILE_PROFILER
+    _FILE_PROFILER = SlowestFilesProfiler(n)
+    try:
+        yield _FILE_PROFILER
+    finally:
+        _FILE_PROFILER = old_profiler
+
+
+class FileCosts(object):
+    """How long each file in a project took us to process, in past runs.
+
+    A few big files can take much longer than the rest; if we leave them for
+    last, the whole job waits on them.  So we keep a small file of how long
+    each file took us (and how big it was), and use it the next time: to do
+    the costliest work first, to pack cheap files together into batches,
+    and to estimate how long a pass will take (see RunStatus).
+
+    The file is JSON, mapping each filename (relative to root) to
+    [seconds, bytes]: the seconds are the most a single suggestor took on
+    the file in a run, averaged with the runs before it.  What we record
+    during a run only counts once we save(), so that estimates stay the same
+    throughout a run.
+    """
+    def __init__(self, root, path=None):
+        """Load the costs for the project at root from path, if it exists."""
+        self.root = os.path.abspath(root)
+        self.path = path
+        # Map from filename to (seconds, bytes), from past runs.
+        self._history = {}
+        # The same, for this run.
+        self._recorded = {}
+        # Map from each root we've been asked about to its path relative to
+        # self.root; see _relpath.
+        self._root_relpaths = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                try:
+                    history = json.load(f)
+                except ValueError:
+                    history = {}    # a corrupt file is no worse than none
+            self._history = {filename.encode('utf-8'): tuple(cost)
+                             for (filename, cost) in history.iteritems()}
+        self._default = self._mean_seconds()
+
+    def _mean_seconds(self):
+        if not self._history:
+            return 1.0
+        return (sum(seconds for (seconds, _) in self._history.itervalues())
+                / len(self._history))
+
+    def _relpath(self, root, filename):
+        """filename, relative to root, made relative to self.root.
+
+        filename must be normalized, as resolve_paths gives it.  We're asked
+        about every file on every pass, almost always with root being
+        self.root, so we only work out where root is once.
+        """
+        root_relpath = self._root_relpaths.get(root)
+        if root_relpath is None:
+            root_relpath = self._root_relpaths[root] = os.path.relpath(
+                os.path.abspath(root), self.root)
+        if root_relpath == os.curdir:
+            return filename
+        return os.path.normpath(os.path.join(root_relpath, filename))
+
+    def record(self, root, filename, seconds, size):
+        """Note that a suggestor took seconds on filename, of size bytes."""
+        relpath = self._relpath(root, filename)
+        with self._lock:
+            old_seconds = self._recorded.get(relpath, (0, 0))[0]
+            self._recorded[relpath] = (max(seconds, old_seconds), size)
+
+    def cost(self, root, filename):
+        """Estimate the seconds filename (relative to root) will take us.
+
+        For a file we've never seen, we guess the mean.
+        """
+        cost = self._history.get(self._relpath(root, filename))
+        return self._default if cost is None else cost[0]
+
+    def longest_first(self, root, filenames):
+        """Return the filenames, costliest first."""
+        return [filename for (_, filename)
+                in self._longest_first(root, filenames)]
+
+    def _longest_first(self, root, filenames):
+        """Return (cost, filename) pairs for the filenames, costliest first.
+        """
+        return sorted(((self.cost(root, filename), filename)
+                       for filename in filenames),
+                      key=lambda (cost, _): -cost)
+
+    def batches(self, root, filenames, size):
+        """Split the filenames into batches, each costing about size seconds.
+
+        We go costliest first, so a file costing at least size gets a batch
+        to itself, and the cheap files at the end are packed together.
+        Returns a list of lists of filenames, costliest first.
+        """
+        batches = []
+        batch = []
+        batch_cost = 0
+        for (cost, filename) in self._longest_first(root, filenames):
+            batch.append(filename)
+            batch_cost += cost
+            if batch_cost >= size:
+                batches.append(batch)
+                batch = []
+                batch_cost = 0
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def save(self):
+        """Add what we recorded this run to the history, and write it out."""
+        with self._lock:
+            recorded, self._recorded = self._recorded, {}
+        for (filename, (seconds, size)) in recorded.iteritems():
+            old_cost = self._history.get(filename)
+            if old_cost is not None:
+                seconds = (seconds + old_cost[0]) / 2.0
+            self._history[filename] = (seconds, size)
+        self._default = self._mean_seconds()
+        if self.path:
+            with open(self.path, 'w') as f:
+                json.dump({filename: list(cost) for (filename, cost)
+                           in self._history.iteritems()},
+                          f, sort_keys=True)
+
+
+@contextlib.contextmanager
+def record_costs(costs):
+    """Within this context, record how long each file takes in costs.
+
+    costs is a FileCosts.  We record the time each suggestor takes on each
+    file it reads, and also use the costs to estimate how long each pass
+    will take, if we're tracking status (see RunStatus).
+    """
+    global _COSTS
+    old_costs = _COSTS
+    _COSTS = costs
+    try:
+        yield costs
+    finally:
+        _COSTS = old_costs
+
+
+def file_contains_any(root, filename, needles):
+    """Return whether the file's raw bytes contain any of the needles.
+
+    filename is taken relative to root.  We memory-map the file rather
+    than reading it, and search the bytes directly, without decoding, so
+    this is much cheaper than read_file.  Needles should be ascii; any
+    encoding python allows for source is a superset of ascii, so an ascii
+    needle is found exactly when it's in the decoded text.  A file that
+    doesn't exist (or is empty) contains no needles.
+    """
+    with _mapped_file(root, filename) as contents:
+        return any(contents.find(needle) != -1
+                   for needle in _encode_needles(needles))
+
+
+def needles_in_file(root, filename, needles):
+    """Return the set of the needles the file contains.
+
+    This is like file_contains_any, but tells us which needles, so one look
+    at each file can serve many needles.
+    """
+    with _mapped_file(root, filename) as contents:
+        return {needle for (needle, encoded)
+                in zip(needles, _encode_needles(needles))
+                if contents.find(encoded) != -1}
+
+
+def _encode_needles(needles):
+    return [n.encode('utf-8') if isinstance(n, unicode) else n
+            for n in needles]
+
+
+@contextlib.contextmanager
+def _mapped_file(root, filename):
+    """Yield the contents of the file, as something with a find() method.
+
+    That's the pending write if there is one, or else the file memory-mapped.
+    A file that doesn't exist (or is empty) yields ''.
+    """
+    pending = _pending_write(root, filename)
+    if pending is not _NOT_PENDING:
+        yield pending or u''
+        return
+
+    try:
+        with open(os.path.join(root, filename), 'rb') as f:
+            try:
+                contents = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:    # mmap refuses to map an empty file
+                contents = None
+    except IOError as e:
+        if e.errno != 2:    # No such file
+            raise
+        contents = None
+    if contents is None:
+        yield ''
+        return
+    try:
+        yield contents
+    finally:
+        contents.close()
+
+
+def _write_to_disk(abspath, data, file_permissions=None):
+    """Write data (a string) to abspath, or delete it if data is None."""
+    if data is None:
+        try:
+            os.unlink(abspath)
+        except OSError as e:
+            if e.errno != 2:   # No such file: already deleted
+                raise
+        # TODO(csilvers): delete our parent dirs if they're empty?
+    else:
+        try:
+            os.makedirs(os.path.dirname(abspath))
+        except (IOError, OSError):  # hopefully "directory already exists"
+            pass
+        with open(abspath, 'w') as f:
+            f.write(data)
+        if file_permissions:
+            os.chmod(abspath, file_permissions)
+
+
+class _BackgroundWriter(object):
+    """Writes files to disk on a background thread.
+
+    Until a write has made it to disk, it's listed in _PENDING_WRITES, so
+    read_file will still see it.  At most max_pending writes may be queued
+    at once; beyond that, write() blocks until the writer catches up.
+    """
+    def __init__(self, max_pending):
+        self._queue = Queue.Queue(max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, abspath, text, data, file_permissions=None):
+        """Queue up writing data, the encoded form of text, to abspath."""
+        # We may write the same file several times before any of the writes
+        # finish; the token lets us know which one is in _PENDING_WRITES.
+        token = object()
+        with _PENDING_WRITES_LOCK:
+            _PENDING_WRITES[abspath] = (token, text)
+        self._queue.put((abspath, token, data, file_permissions))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                abspath, token, data, file_permissions = item
+                # After an error, we just drain the queue; flush() will
+                # report the error.
+                if self._error is None:
+                    try:
+                        _write_to_disk(abspath, data, file_permissions)
+                    except Exception:
+                        self._error = sys.exc_info()
+                with _PENDING_WRITES_LOCK:
+                    if _PENDING_WRITES.get(abspath, (None,))[0] is token:
+                        del _PENDING_WRITES[abspath]
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Wait until all queued writes are on disk; raise if any failed."""
+        self._queue.join()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error[0], error[1], error[2]
+
+    def close(self):
+        """Flush, then stop the background thread."""
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
+
+def _intern(path):
+    """Intern path, if it's a str, so each path is only in memory once."""
+    return intern(path) if type(path) is str else path
+
+
 def _resolve_paths(path_filter, root='.'):
     """Actually resolve the paths, and update the cache.
 
@@ -200,8 +1483,10 @@ def _resolve_paths(path_filter, root='.'):
     operation.
     TODO(benkraft): There's probably a cleaner way, e.g. we could own our own
     progress bar, or accept a progress-bar fn.
+    In low-memory mode (see low_memory), we don't cache anything.
     """
-    paths = []
+    # The paths so far, to cache, or None if we won't.
+    paths = None if _LOW_MEMORY else []
     for dirpath, dirnames, filenames in os.walk(root):
         # Prune directories to traverse according to the path filter.
         # Go in reverse order to keep indexes the same as we delete things.
@@ -215,11 +1500,14 @@ def _resolve_paths(path_filter, root='.'):
         for name in filenames:
             relname = os.path.relpath(os.path.join(dirpath, name), root)
             if path_filter(relname):
-                paths.append(relname)
+                relname = _intern(relname)
+                if paths is not None:
+                    paths.append(relname)
                 yield relname
 
     # We're done; we can cache the result now.
-    _RESOLVE_PATHS_CACHE[(path_filter, root)] = paths
+    if paths is not None:
+        _RESOLVE_PATHS_CACHE[(path_filter, root)] = paths
 
 
 def resolve_paths(path_filter, root='.'):
@@ -227,7 +1515,9 @@ def resolve_paths(path_filter, root='.'):
 
     This is cached across runs over the same path_filter function,
     although note that if you iterate only partway through the
-    returned iterable the cache may not get populated.
+    returned iterable the cache may not get populated.  In low-memory mode
+    (see low_memory), it isn't cached: we return a generator that walks
+    the tree anew.
     """
     cached_value = _RESOLVE_PATHS_CACHE.get((path_filter, root))
     if cached_value is not None:
@@ -237,6 +1527,81 @@ def resolve_paths(path_filter, root='.'):
         return _resolve_paths(path_filter, root)
 
 
+def _included_by_path_filter(path_filter, relpath):
+    """Return whether _resolve_paths would include relpath.
+
+    That's the case if the path filter accepts it, and all of its parent
+    directories (since _resolve_paths doesn't descend into those it rejects).
+    """
+    parts = relpath.split(os.sep)
+    for i in xrange(1, len(parts)):
+        if not path_filter(os.path.join(os.sep.join(parts[:i]), '')):
+            return False
+    return path_filter(relpath)
+
+
+def _update_resolve_paths_cache(added=(), removed=()):
+    """Update the cached path-lists when files are created or deleted.
+
+    added and removed are absolute paths of files that now exist, or no
+    longer exist, respectively.  We check each against the path filter and
+    root of each cached list, rather than clearing the cache, so we don't
+    have to walk the tree again.  Note that we replace the lists rather than
+    modifying them, since a caller may be iterating over one.
+    """
+    with _RESOLVE_PATHS_LOCK:
+        _update_resolve_paths_cache_locked(added, removed)
+
+
+def _update_resolve_paths_cache_locked(added, removed):
+    for key, paths in _RESOLVE_PATHS_CACHE.items():
+        (path_filter, root) = key
+        abs_root = os.path.abspath(root)
+
+        def relpaths(abspaths):
+            for abspath in abspaths:
+                relpath = os.path.relpath(abspath, abs_root)
+                if (not relpath.startswith(os.pardir + os.sep)
+                        and _included_by_path_filter(path_filter, relpath)):
+                    yield relpath
+
+        relpaths_added = list(relpaths(added))
+        relpaths_removed = set(relpaths(removed))
+        if not relpaths_added and not relpaths_removed:
+            continue
+        new_paths = [path for path in paths if path not in relpaths_removed]
+        existing_paths = set(new_paths)
+        new_paths.extend(path for path in relpaths_added
+                         if path not in existing_paths)
+        _RESOLVE_PATHS_CACHE[key] = new_paths
+
+
+def _forget_resolve_paths_under(abs_dir):
+    """Drop cached path-lists whose root is (inside) the given directory."""
+    for key in _RESOLVE_PATHS_CACHE.keys():
+        abs_root = os.path.abspath(key[1])
+        if abs_root == abs_dir or abs_root.startswith(abs_dir + os.sep):
+            del _RESOLVE_PATHS_CACHE[key]
+
+
+def forget_resolved_paths(root):
+    """Drop the cached results of resolve_paths for root (and inside it).
+
+    Frontends keep the cache up to date as they write files, but if
+    something else changes the tree, callers should call this.  Since that
+    includes the .gitignore files, we also forget the default path filters
+    for root, so the next one reads them anew.
+    """
+    abs_dir = os.path.abspath(root)
+    _forget_resolve_paths_under(abs_dir)
+    for key in _DEFAULT_PATH_FILTERS.keys():
+        if key[-1] is None:
+            continue
+        abs_root = os.path.abspath(key[-1])
+        if abs_root == abs_dir or abs_root.startswith(abs_dir + os.sep):
+            del _DEFAULT_PATH_FILTERS[key]
+
+
 def pos_to_line_col(text, pos):
     """Accept a character position in text, return (lineno, colno).
 
@@ -263,11 +1628,197 @@ def line_col_to_pos(text, line, col):
         raise RuntimeError("Invalid line number %s!" % line)
 
 
-class Frontend(object):
+# An event a frontend tells its observers about.
+#   kind: one of run_start, run_end, file_read, suggestor_start,
+#       suggestor_end, patches_applied, warning, error, file_written,
+#       file_renamed.
+#   time: when it happened (as from time.time()).
+#   filename: the file it's about (relative to root), if any.  For
+#       file_renamed, that's the old name; it may be a directory, ending
+#       with a slash.
+#   seconds: for run_end, file_read, suggestor_end and file_written, how
+#       long it took.  (For a background write, that's to queue it.)
+#   size: for file_read, the size of the file in bytes; for file_written,
+#       the number of bytes written (0 for a deletion).
+#   count: for run_start, the number of files we'll look at (if we know);
+#       for suggestor_end, the number of things the suggestor suggested;
+#       for patches_applied, the number of patches.
+#   new_filename: for file_renamed, the new name.
+# Fields that don't apply are None.
+Event = collections.namedtuple(
+    'Event', ['kind', 'time', 'filename', 'seconds', 'size', 'count',
+              'new_filename'])
+
+
+class JSONTraceObserver(object):
+    """An observer that writes each event to a file, as a line of JSON."""
+    def __init__(self, f):
+        self.f = f
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        line = json.dumps({key: value for (key, value)
+                           in event._asdict().iteritems()
+                           if value is not None})
+        with self._lock:
+            self.f.write(line + '\n')
+
+
+class AggregatingObserver(object):
+    """An observer that totals up the events of each kind.
+
+    totals maps each kind of event to a dict with the number of events,
+    and the sum of their seconds, sizes and counts.
+    """
     def __init__(self):
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        with self._lock:
+            totals = self.totals.setdefault(
+                event.kind, {'events': 0, 'seconds': 0, 'size': 0,
+                             'count': 0})
+            totals['events'] += 1
+            for field in ('seconds', 'size', 'count'):
+                totals[field] += getattr(event, field) or 0
+
+
+class _FileSet(collections.Set):
+    """A set of (root, filename) pairs, kept compactly.
+
+    Rather than a tuple per file, we keep a set of interned filenames per
+    root; on a tree of millions of files that's a good deal less memory.
+    It's safe to use from several threads at once: iterating gives a
+    snapshot of the files as of when we started.  To do that without
+    copying the files up front, we copy a root's set only if a file is
+    added to it while someone is iterating over it.
+    """
+    def __init__(self, pairs=()):
+        # Map from root to the set of filenames (relative to it).
+        self._filenames = {}
+        # Map from id() of a set in _filenames to how many iterators are
+        # using it; we mustn't change those sets.
+        self._readers = collections.Counter()
+        self._lock = threading.Lock()
+        self.update(pairs)
+
+    def add(self, pair):
+        (root, filename) = pair
+        with self._lock:
+            filenames = self._filenames.get(root)
+            if filenames is None:
+                filenames = self._filenames[root] = set()
+            elif self._readers[id(filenames)]:
+                filenames = self._filenames[root] = set(filenames)
+            filenames.add(_intern(filename))
+
+    def update(self, pairs):
+        for pair in pairs:
+            self.add(pair)
+
+    def __contains__(self, pair):
+        (root, filename) = pair
+        return filename in self._filenames.get(root, ())
+
+    def __iter__(self):
+        with self._lock:
+            snapshot = self._filenames.items()
+            for (_, filenames) in snapshot:
+                self._readers[id(filenames)] += 1
+        try:
+            for (root, filenames) in snapshot:
+                for filename in filenames:
+                    yield (root, filename)
+        finally:
+            with self._lock:
+                for (_, filenames) in snapshot:
+                    self._readers[id(filenames)] -= 1
+                    if not self._readers[id(filenames)]:
+                        del self._readers[id(filenames)]
+
+    def __len__(self):
+        return sum(len(filenames) for filenames in self._filenames.values())
+
+
+class Frontend(object):
+    def __init__(self, io_threads=0, observers=()):
+        """If io_threads is nonzero, overlap disk I/O with suggestors.
+
+        In that case, when running a suggestor over many files, we read
+        upcoming files on a pool of io_threads threads, and write files on
+        another background thread.  See _run_suggestor_on_files_pipelined.
+
+        observers are functions to call with an Event each time something
+        happens, for tracing and metrics; see JSONTraceObserver and
+        AggregatingObserver.  If io_threads is nonzero, or several threads
+        run suggestors at once, they may be called from several threads at
+        once.
+
+        Several threads may run suggestors at once, so long as they don't
+        touch the same files; see schedule.py.
+        """
         # (root, filename) of files we've modified.
         # filename is relative to root.
-        self._modified_files = set()
+        self._modified_files = _FileSet()
+        self.io_threads = io_threads
+        # Each thread's background writer, set while it's running pipelined;
+        # see _writer.
+        self._local = threading.local()
+        # Map from absolute path to the number of times we've written it,
+        # so we can tell if a file changed after we started reading it.
+        self._write_generations = collections.Counter()
+        self.observers = list(observers)
+
+    @property
+    def _writer(self):
+        """This thread's background writer, if it's running pipelined."""
+        return getattr(self._local, 'writer', None)
+
+    @_writer.setter
+    def _writer(self, writer):
+        self._local.writer = writer
+
+    def _notify(self, kind, filename=None, seconds=None, size=None,
+                count=None, new_filename=None):
+        """Tell our observers about an event; see Event for the arguments."""
+        if self.observers:
+            event = Event(kind, time.time(), filename, seconds, size, count,
+                          new_filename)
+            for observer in self.observers:
+                observer(event)
+
+    def _handle_error(self, root, error):
+        self._notify('error', error.filename)
+        self.handle_error(root, error)
+
+    def pop_modified_files(self):
+        """Return the files we've modified so far, and forget about them.
+
+        This is for callers that use one frontend for several separate
+        jobs: after each, they call this, so that the next job's
+        run_suggestor_on_modified_files sees only the files it modified.
+        Returns a set-like collection of (root, filename) pairs.
+        """
+        modified_files, self._modified_files = self._modified_files, _FileSet()
+        return modified_files
+
+    def modified_files(self):
+        """Return the files we've modified so far, as for pop_modified_files.
+
+        Unlike pop_modified_files, we keep them.  This is a view, not a
+        copy: it includes files we modify later, but iterating over it is
+        safe while we do.
+        """
+        return self._modified_files
+
+    def add_modified_files(self, root, filenames):
+        """Count filenames, relative to root, as modified by us.
+
+        This is for callers resuming a job an earlier process started, so
+        that run_suggestor_on_modified_files sees the files it modified.
+        """
+        self._modified_files.update((root, filename) for filename in filenames)
 
     def handle_patches(self, root, filename, patches):
         """Accept a list of patches for a file, and apply them.
@@ -293,6 +1844,14 @@ class Frontend(object):
         """Accept a fatal error, and tell the user we'll skip this file."""
         raise NotImplementedError("Subclasses must override.")
 
+    def handle_rename(self, root, rename):
+        """Accept a rename of a file or directory, and apply it.
+
+        This will be called before any patches suggested alongside it are
+        handled, so those patches may refer to the new filename.
+        """
+        raise NotImplementedError("Subclasses must override.")
+
     def write_file(self, root, filename, text, file_permissions=None):
         """filename is taken to be relative to root.
 
@@ -300,31 +1859,89 @@ class Frontend(object):
         list of modified files), but not to read them.
 
         If file_permissions is not None, set the perms of filename.
+
+        If we're running pipelined, the write happens in the background, but
+        read_file will see the new contents right away.
         """
         abspath = os.path.abspath(os.path.join(root, filename))
         if text is None:    # it means we want to delete filename
-            try:
-                os.unlink(abspath)
-                # We changed what files exist: clear the cache.
-                _RESOLVE_PATHS_CACHE.clear()
-            except OSError as e:
-                if e.errno == 2:   # No such file: already deleted
-                    pass
-                raise
-            # TODO(csilvers): delete our parent dirs if they're empty?
+            data = None
+            if _file_exists(abspath):
+                # We changed what files exist: update the cache.
+                _update_resolve_paths_cache(removed=[abspath])
         else:
-            try:
-                os.makedirs(os.path.dirname(abspath))
-            except (IOError, OSError):  # hopefully "directory already exists"
-                pass
-            if not os.path.exists(abspath):
-                # We changed what files exist: clear the cache.
-                _RESOLVE_PATHS_CACHE.clear()
-            with open(abspath, 'w') as f:
-                f.write(unicode_util.encode(filename, text))
-                self._modified_files.add((root, filename))
-            if file_permissions:
-                os.chmod(abspath, file_permissions)
+            data = unicode_util.encode(filename, text)
+            if not _file_exists(abspath):
+                # We changed what files exist: update the cache.
+                _update_resolve_paths_cache(added=[abspath])
+            self._modified_files.add((root, filename))
+
+        if (_ORIGINAL_CONTENTS is not None and
+                abspath not in _ORIGINAL_CONTENTS):
+            _ORIGINAL_CONTENTS[abspath] = read_file(root, filename)
+        if _CONTENT_CACHE is not None:
+            _CONTENT_CACHE.pop(abspath, None)
+        if _STATS is not None:
+            with _STATS_LOCK:
+                _STATS.add_write(abspath, len(data or ''), current_phase())
+        self._write_generations[abspath] += 1
+        start = time.time()
+        self._write_contents(abspath, text, data, file_permissions)
+        self._notify('file_written', filename, time.time() - start,
+                     len(data or ''))
+
+    def _write_contents(self, abspath, text, data, file_permissions):
+        """Write data, the encoded form of text, to abspath.
+
+        Subclasses may override, to put the contents somewhere else.
+        """
+        if self._writer:
+            self._writer.write(abspath, text, data, file_permissions)
+        else:
+            _write_to_disk(abspath, data, file_permissions)
+
+    def rename_file(self, root, filename, new_filename,
+                    path_filter=default_path_filter()):
+        """Move filename to new_filename; both are taken relative to root.
+
+        This is a filesystem rename, so the file keeps its mode (and inode),
+        and its contents are never read.  If filename ends with a slash, it is
+        a directory, which is moved as a whole; in that case, every file in
+        it that matches path_filter counts as modified.
+        """
+        if self._writer:
+            # Make sure anything we're renaming is on disk first.
+            self._writer.flush()
+        abspath = os.path.abspath(os.path.join(root, filename))
+        new_abspath = os.path.abspath(os.path.join(root, new_filename))
+        try:
+            os.makedirs(os.path.dirname(new_abspath))
+        except (IOError, OSError):  # hopefully "directory already exists"
+            pass
+        os.rename(abspath, new_abspath)
+        self._notify('file_renamed', filename, new_filename=new_filename)
+
+        if new_filename.endswith(os.sep):
+            # Paths, relative to the directory, of the files we moved.
+            moved_files = [
+                os.path.relpath(os.path.join(dirpath, name), new_abspath)
+                for dirpath, _, filenames in os.walk(new_abspath)
+                for name in filenames]
+            for moved_file in moved_files:
+                relname = os.path.join(new_filename, moved_file)
+                if path_filter(relname):
+                    self._modified_files.add((root, relname))
+            # We changed what files exist: update the cache.
+            _forget_resolve_paths_under(abspath)
+            _forget_resolve_paths_under(new_abspath)
+            _update_resolve_paths_cache(
+                added=[os.path.join(new_abspath, f) for f in moved_files],
+                removed=[os.path.join(abspath, f) for f in moved_files])
+        else:
+            self._modified_files.add((root, new_filename))
+            # We changed what files exist: update the cache.
+            _update_resolve_paths_cache(added=[new_abspath],
+                                        removed=[abspath])
 
     def progress_bar(self, paths):
         """Return the passed iterable of paths, and perhaps update progress.
@@ -333,70 +1950,212 @@ class Frontend(object):
         """
         return paths
 
-    def _run_suggestor_on_file(self, suggestor, filename, root):
-        """filename is relative to root."""
+    def _read_for_suggestor(self, suggestor, root, filename):
+        """Return the body to run suggestor on, or None to skip the file.
+
+        filename is relative to root.
+        """
+        count('files_enumerated')
+        needles = getattr(suggestor, 'needles', None)
+        if needles and not file_contains_any(root, filename, needles):
+            # The suggestor has told us it can't do anything with this
+            # file, so we don't bother to read it.
+            count('files_prefiltered')
+            return None
+        start = time.time()
+        body = read_file(root, filename) or ''
+        if self.observers:
+            # body is decoded; the size is in bytes, as for file_written.
+            self._notify('file_read', filename, time.time() - start,
+                         len(unicode_util.encode(filename, body)))
+        return body
+
+    def _run_suggestor_on_file(self, suggestor, filename, root, body=None):
+        """filename is relative to root.
+
+        If body is passed, it's the contents of filename; otherwise we read
+        it ourselves.
+        """
+        if _STATUS is not None:
+            _STATUS.filename = filename
+        if _FILE_PROFILER is not None:
+            _FILE_PROFILER.runcall(filename, self._process_file,
+                                   suggestor, filename, root, body)
+        else:
+            self._process_file(suggestor, filename, root, body)
+        _status_file_done(root, filename)
+
+    def _process_file(self, suggestor, filename, root, body):
+        """Do the work of _run_suggestor_on_file."""
+        process_start = time.time()
         try:
+            if body is None:
+                body = self._read_for_suggestor(suggestor, root, filename)
+                if body is None:
+                    return
             # Ensure the entire suggestor runs before we start patching.
-            vals = list(
-                suggestor(filename, read_file(root, filename) or ''))
-            patches = [p for p in vals if isinstance(p, Patch)
-                       and p.old != p.new]
-            # HACK: consider addition-ish before deletion-ish.
-            patches.sort(key=lambda p: (p.start,
-                                        len(p.old or '') - len(p.new or '')))
+            self._notify('suggestor_start', filename)
+            start = time.time()
+            vals = list(suggestor(filename, body))
+            self._notify('suggestor_end', filename, time.time() - start,
+                         count=len(vals))
+            count('patches', sum(1 for v in vals if isinstance(v, Patch)))
+            # Make sure the patches are consistent before we apply any.
+            patch_set = PatchSet(p for p in vals if isinstance(p, Patch))
+            patch_set.check()
             warnings = [w for w in vals if isinstance(w, WarningInfo)]
             warnings.sort(key=lambda w: w.pos)
+            renames = [r for r in vals if isinstance(r, Rename)]
+
+            # Renames go first, so that patches to the renamed file (or to
+            # files in the renamed directory) find it at its new location.
+            for rename in renames:
+                self.handle_rename(root, rename)
 
             # Typically when you run a suggestor on a file, all the
             # patches it suggests will be for that file as well, but
             # it's possible for a suggestor to suggest changes to
             # another file (e.g. when moving code from one file to
             # another).  So we group by file-to-change here.
-            patches_by_file = {}
             warnings_by_file = {}
-            for patch in patches:
-                patches_by_file.setdefault(patch.filename, []).append(patch)
             for warning in warnings:
                 warnings_by_file.setdefault(warning.filename, []).append(
                     warning)
 
-            seen_filenames = list(set(patches_by_file) | set(warnings_by_file))
+            seen_filenames = list(set(patch_set.filenames()) |
+                                  set(warnings_by_file))
             seen_filenames.sort(key=lambda f: (0 if f == filename else 1, f))
-            for filename in seen_filenames:
-                if filename in warnings_by_file:
-                    self.handle_warnings(root, filename,
-                                         warnings_by_file[filename])
-                if filename in patches_by_file:
-                    self.handle_patches(root, filename,
-                                        patches_by_file[filename])
+            for seen_filename in seen_filenames:
+                if seen_filename in warnings_by_file:
+                    for _ in warnings_by_file[seen_filename]:
+                        self._notify('warning', seen_filename)
+                    self.handle_warnings(root, seen_filename,
+                                         warnings_by_file[seen_filename])
+                patches = patch_set.patches_for(seen_filename)
+                if patches:
+                    self.handle_patches(root, seen_filename, patches)
+                    self._notify('patches_applied', seen_filename,
+                                 count=len(patches))
+            if _COSTS is not None:
+                _COSTS.record(root, filename, time.time() - process_start,
+                              len(body))
+        except FatalError as e:
+            self._handle_error(root, e)
+
+    def _run_prefetched(self, suggestor, filename, root, abspath,
+                        generation, result):
+        """Run the suggestor on a file read by _read_for_suggestor.
+
+        result is the AsyncResult from the reader; generation is what
+        self._write_generations said for the file when we started reading.
+        """
+        if self._write_generations[abspath] != generation:
+            # We've written this file since we started reading it, so what
+            # we read may be stale; read it again.
+            self._run_suggestor_on_file(suggestor, filename, root)
+            return
+        try:
+            body = result.get()
         except FatalError as e:
-            self.handle_error(root, e)
+            self._handle_error(root, e)
+            body = None
+        if body is not None:
+            self._run_suggestor_on_file(suggestor, filename, root, body)
+        else:
+            # We're done with this file without running the suggestor.
+            _status_file_done(root, filename)
+
+    def _run_suggestor_on_files_pipelined(self, suggestor, filenames, root):
+        """Like run_suggestor_on_files, but with I/O on background threads.
+
+        We have three stages: a pool of reader threads, which read (and
+        prefilter) the next few files; this thread, which runs the suggestor
+        and handles what it suggests; and a writer thread, which writes the
+        results to disk.  The stages are connected by bounded queues, so we
+        never hold more than a few files' worth of contents at once.
+        """
+        readahead = 4 * self.io_threads
+        readers = multiprocessing.pool.ThreadPool(self.io_threads)
+        self._writer = _BackgroundWriter(max_pending=readahead)
+        # (filename, abspath, generation, AsyncResult) for files being read.
+        prefetched = collections.deque()
+        phase = current_phase()
+
+        def read(filename):
+            with _in_phase(phase):
+                return self._read_for_suggestor(suggestor, root, filename)
+
+        try:
+            for filename in self.progress_bar(filenames):
+                abspath = os.path.abspath(os.path.join(root, filename))
+                prefetched.append((
+                    filename, abspath, self._write_generations[abspath],
+                    readers.apply_async(read, (filename,))))
+                if len(prefetched) > readahead:
+                    self._run_prefetched(suggestor, prefetched[0][0], root,
+                                         *prefetched.popleft()[1:])
+            while prefetched:
+                self._run_prefetched(suggestor, prefetched[0][0], root,
+                                     *prefetched.popleft()[1:])
+        finally:
+            readers.close()
+            readers.join()
+            writer, self._writer = self._writer, None
+            writer.close()
 
     def run_suggestor_on_files(self, suggestor, filenames, root='.'):
         """Like run_suggestor, but on exactly the given files."""
-        for filename in self.progress_bar(filenames):
-            self._run_suggestor_on_file(suggestor, filename, root)
+        _start_status_pass(filenames, root)
+        start = time.time()
+        self._notify('run_start', count=(len(filenames)
+                                         if hasattr(filenames, '__len__')
+                                         else None))
+        try:
+            if self.io_threads:
+                self._run_suggestor_on_files_pipelined(suggestor, filenames,
+                                                       root)
+            else:
+                for filename in self.progress_bar(filenames):
+                    self._run_suggestor_on_file(suggestor, filename, root)
+        finally:
+            self._notify('run_end', seconds=time.time() - start)
 
     def run_suggestor(self, suggestor,
                       path_filter=default_path_filter(), root='.'):
         """Run the suggestor on all files matching the path_filter."""
-        self.run_suggestor_on_files(
-            suggestor, resolve_paths(path_filter, root), root)
-
-    def run_suggestor_on_modified_files(self, suggestor):
+        filenames = resolve_paths(path_filter, root)
+        if (_STATUS is not None and not _LOW_MEMORY and
+                not isinstance(filenames, list)):
+            # Find all the files up front, so we can give an ETA.
+            filenames = list(filenames)
+        self.run_suggestor_on_files(suggestor, filenames, root)
+
+    def run_suggestor_on_modified_files(self, suggestor, only=None):
         """Like run_suggestor, but only on files we've modified.
 
         Useful for fixups after the fact that we don't want to apply to the
-        whole codebase, only the files we touched.
+        whole codebase, only the files we touched.  If only is set, we
+        further restrict to the filenames in it.
 
         Note that this doesn't take a root, because we use the one from
         when we first modified the file.
         """
-        for (root, filename) in self.progress_bar(self._modified_files):
-            # If we modified a file by deleting it, no more
-            # suggestions for you!
-            if os.path.exists(os.path.join(root, filename)):
-                self._run_suggestor_on_file(suggestor, filename, root)
+        # Take a copy: another thread may be modifying files as we go.
+        modified_files = [(root, filename)
+                          for (root, filename) in self._modified_files
+                          if only is None or filename in only]
+        _start_status_pass(modified_files)
+        start = time.time()
+        self._notify('run_start', count=len(modified_files))
+        try:
+            for (root, filename) in self.progress_bar(modified_files):
+                # If we modified a file by deleting it, no more
+                # suggestions for you!
+                if _file_exists(os.path.abspath(os.path.join(root,
+                                                             filename))):
+                    self._run_suggestor_on_file(suggestor, filename, root)
+        finally:
+            self._notify('run_end', seconds=time.time() - start)
 
 
 class AcceptingFrontend(Frontend):
@@ -428,18 +2187,277 @@ class AcceptingFrontend(Frontend):
         if body != new_body:
             self.write_file(root, filename, new_body, new_file_perms)
 
+    def handle_rename(self, root, rename):
+        self.rename_file(root, rename.filename, rename.new_filename)
+
     def handle_warnings(self, root, filename, warnings):
-        body = read_file(root, filename) or ''
         for warning in warnings:
             assert filename == warning.filename, warning
-            lineno, _ = pos_to_line_col(body, warning.pos)
-            line = body.splitlines()[lineno - 1]
-            emit("WARNING:%s\n    on %s:%s --> %s"
-                 % (warning.message, filename, lineno, line))
+            self._report('WARNING', root, filename, warning.pos,
+                         warning.message)
 
     def handle_error(self, root, error):
-        body = read_file(root, error.filename) or ''
-        lineno, _ = pos_to_line_col(body, error.pos)
+        self._report('ERROR', root, error.filename, error.pos, error.message)
+
+    def _report(self, kind, root, filename, pos, message):
+        """Tell the user about a warning or error at pos in filename."""
+        body = read_file(root, filename) or ''
+        lineno, _ = pos_to_line_col(body, pos)
         line = body.splitlines()[lineno - 1]
-        emit("ERROR:%s\n    on %s:%s --> %s"
-             % (error.message, error.filename, lineno, line))
+        emit(_format_report(kind, message, filename, lineno, line))
+
+
+def _format_report(kind, message, filename, lineno, line):
+    return ("%s:%s\n    on %s:%s --> %s"
+            % (kind, message, filename, lineno, line))
+
+
+def in_shard(filename, shard_index, num_shards):
+    """Return whether filename belongs to the given shard.
+
+    This partitions files into num_shards shards, numbered from 0, by a
+    hash of their name (relative to root), so every process computes the
+    same partition no matter the order in which it finds the files.
+    """
+    key = filename.replace(os.sep, '/')
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    return (zlib.crc32(key) & 0xffffffff) % num_shards == shard_index
+
+
+def _read_from_disk(abspath):
+    """Return the contents of abspath, ignoring pending writes."""
+    try:
+        with open(abspath) as f:
+            return unicode_util.decode(abspath, f.read())
+    except IOError as e:
+        if e.errno == 2:    # No such file
+            return None
+        raise
+
+
+class PatchRecordingFrontend(AcceptingFrontend):
+    """A frontend that records the changes it would make, to apply later.
+
+    We make the changes as AcceptingFrontend would, except that we keep the
+    new contents in memory (in _PENDING_WRITES, so read_file sees them)
+    rather than on disk.  At the end, records() describes how to get from
+    what's on disk to what we have, as a series of renames and patches, plus
+    the warnings and errors we saw; see write_records and
+    apply_patch_records.  Call close() when done, to discard the changes.
+
+    To split up the work, one can run several of these, each with a
+    different shard_index.  Each only runs run_suggestor on (and only
+    records changes to) its share of the files; see in_shard.  Suggestors
+    run via run_suggestor_on_files and run_suggestor_on_modified_files run
+    on every file in every shard: they typically set things up for (or clean
+    up after) a run_suggestor, and every shard needs their changes.  Note
+    that this only works if a suggestor's changes to a file depend only on
+    that file (and the changes of earlier suggestors).
+    """
+    def __init__(self, shard_index=0, num_shards=1, **kwargs):
+        super(PatchRecordingFrontend, self).__init__(**kwargs)
+        self.shard_index = shard_index
+        self.num_shards = num_shards
+        self._token = object()
+        # Map from absolute path to (root, filename) for each file whose
+        # contents we've changed (including by renaming it).
+        self._changed_files = {}
+        # Map from absolute path to the absolute path on disk whose contents
+        # it will have once our renames are done, or None if it won't exist;
+        # for files we haven't renamed, that's the path itself.
+        self._sources = {}
+        self._permissions = {}
+        self._renames = []
+        # Dicts describing the warnings and errors in our shard.
+        self._reports = []
+
+    def _in_shard(self, filename):
+        return in_shard(filename, self.shard_index, self.num_shards)
+
+    def run_suggestor(self, suggestor,
+                      path_filter=default_path_filter(), root='.'):
+        self.run_suggestor_on_files(
+            suggestor,
+            [filename for filename in resolve_paths(path_filter, root)
+             if self._in_shard(filename)],
+            root)
+
+    def write_file(self, root, filename, text, file_permissions=None):
+        abspath = os.path.abspath(os.path.join(root, filename))
+        self._changed_files[abspath] = (root, filename)
+        if file_permissions:
+            self._permissions[abspath] = file_permissions
+        super(PatchRecordingFrontend, self).write_file(
+            root, filename, text, file_permissions)
+
+    def _write_contents(self, abspath, text, data, file_permissions):
+        with _PENDING_WRITES_LOCK:
+            _PENDING_WRITES[abspath] = (self._token, text)
+
+    def _move_contents(self, root, filename, new_filename):
+        abspath = os.path.abspath(os.path.join(root, filename))
+        new_abspath = os.path.abspath(os.path.join(root, new_filename))
+        text = read_file(root, filename)
+        self._sources[new_abspath] = self._sources.get(abspath, abspath)
+        self._sources[abspath] = None
+        for (path, relname, path_text) in ((abspath, filename, None),
+                                           (new_abspath, new_filename, text)):
+            self._changed_files[path] = (root, relname)
+            if _CONTENT_CACHE is not None:
+                _CONTENT_CACHE.pop(path, None)
+            self._write_generations[path] += 1
+            self._write_contents(path, path_text, None, None)
+
+    def rename_file(self, root, filename, new_filename,
+                    path_filter=default_path_filter()):
+        self._renames.append(Rename(filename, new_filename))
+        abspath = os.path.abspath(os.path.join(root, filename))
+        new_abspath = os.path.abspath(os.path.join(root, new_filename))
+        if new_filename.endswith(os.sep):
+            # Paths, relative to the directory, of the files we moved.  We
+            # only keep track of the ones matching path_filter: suggestors
+            # won't look at the others, which needn't even be text.
+            moved_files = set(
+                os.path.relpath(os.path.join(dirpath, name), abspath)
+                for dirpath, _, filenames in os.walk(abspath)
+                for name in filenames)
+            moved_files.update(
+                os.path.relpath(path, abspath)
+                for (path, (_, text)) in _PENDING_WRITES.items()
+                if path.startswith(abspath + os.sep) and text is not None)
+            moved_files = sorted(
+                f for f in moved_files
+                if path_filter(os.path.join(new_filename, f)))
+            for moved_file in moved_files:
+                relname = os.path.join(new_filename, moved_file)
+                self._move_contents(root, os.path.join(filename, moved_file),
+                                    relname)
+                self._modified_files.add((root, relname))
+            _forget_resolve_paths_under(abspath)
+            _forget_resolve_paths_under(new_abspath)
+            _update_resolve_paths_cache(
+                added=[os.path.join(new_abspath, f) for f in moved_files],
+                removed=[os.path.join(abspath, f) for f in moved_files])
+        else:
+            self._move_contents(root, filename, new_filename)
+            self._modified_files.add((root, new_filename))
+            _update_resolve_paths_cache(added=[new_abspath],
+                                        removed=[abspath])
+
+    def _report(self, kind, root, filename, pos, message):
+        if not self._in_shard(filename):
+            return
+        body = read_file(root, filename) or ''
+        lineno, _ = pos_to_line_col(body, pos)
+        self._reports.append({'type': kind.lower(), 'filename': filename,
+                              'pos': pos, 'message': message,
+                              'lineno': lineno,
+                              'line': body.splitlines()[lineno - 1]})
+
+    def records(self):
+        """Yield dicts describing the changes we would have made.
+
+        These are, in order: the renames (every shard records all of them),
+        then a patch for each file in our shard whose contents differ from
+        what the renames would leave there, then the warnings and errors.
+        Positions in a patch are relative to the file after the renames.
+        Warnings and errors are for display only; their positions may be
+        relative to an intermediate state of the file.
+        """
+        for rename in self._renames:
+            yield {'type': 'rename', 'filename': rename.filename,
+                   'new_filename': rename.new_filename}
+
+        for abspath in sorted(self._changed_files):
+            (_, filename) = self._changed_files[abspath]
+            if not self._in_shard(filename):
+                continue
+            source = self._sources.get(abspath, abspath)
+            old_text = _read_from_disk(source) if source else None
+            new_text = _PENDING_WRITES[abspath][1]
+            if old_text == new_text:
+                continue
+            if new_text is None:
+                start, end, new = 0, len(old_text), None
+            else:
+                # Only include the part that changed.
+                old_text = old_text or ''
+                start = len(os.path.commonprefix([old_text, new_text]))
+                suffix = len(os.path.commonprefix(
+                    [old_text[start:][::-1], new_text[start:][::-1]]))
+                end = len(old_text) - suffix
+                new = new_text[start:len(new_text) - suffix]
+            yield {'type': 'patch', 'filename': filename,
+                   'old': old_text[start:end], 'new': new,
+                   'start': start, 'end': end,
+                   'permissions': self._permissions.get(abspath)}
+
+        for report in self._reports:
+            yield report
+
+    def write_records(self, f):
+        """Write records() to the file-object f, as JSON, one per line."""
+        for record in self.records():
+            f.write(json.dumps(record) + '\n')
+
+    def close(self):
+        """Discard the changes we've recorded."""
+        with _PENDING_WRITES_LOCK:
+            for abspath in self._changed_files:
+                if _PENDING_WRITES.get(abspath, (None,))[0] is self._token:
+                    del _PENDING_WRITES[abspath]
+        if _CONTENT_CACHE is not None:
+            for abspath in self._changed_files:
+                _CONTENT_CACHE.pop(abspath, None)
+        # The cached lists of files include what we created, and not what we
+        # deleted.
+        for root in set(root for (root, _) in self._changed_files.values()):
+            forget_resolved_paths(root)
+
+
+def read_records(f):
+    """Read records written by PatchRecordingFrontend.write_records."""
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            for key in ('filename', 'new_filename'):
+                if key in record:
+                    record[key] = record[key].encode('utf-8')
+            yield record
+
+
+def apply_patch_records(frontend, records, root='.'):
+    """Apply records from one or more PatchRecordingFrontends.
+
+    records may include those from several shards of the same job, in any
+    order.  We print the warnings and errors, do the renames, then apply the
+    patches to each file (via frontend).  If any patches conflict, we raise
+    FatalError, describing all the conflicts, before changing anything.
+    """
+    renames = []
+    patches = []
+    for record in records:
+        if record['type'] == 'rename':
+            rename = Rename(record['filename'], record['new_filename'])
+            if rename not in renames:    # every shard records every rename
+                renames.append(rename)
+        elif record['type'] == 'patch':
+            patches.append(Patch(record['filename'], record['old'],
+                                 record['new'], record['start'],
+                                 record['end'], record['permissions']))
+        else:
+            emit(_format_report(record['type'].upper(), record['message'],
+                                record['filename'], record['lineno'],
+                                record['line']))
+    patch_set = PatchSet(patches)
+    patch_set.check()
+
+    for rename in renames:
+        frontend.handle_rename(root, rename)
+    for filename in patch_set.filenames():
+        try:
+            frontend.handle_patches(root, filename,
+                                    patch_set.patches_for(filename))
+        except FatalError as e:
+            frontend.handle_error(root, e)
@@ -2,8 +2,8 @@
 from __future__ import absolute_import
 
 import ast
+import collections
 import os
-import stat
 
 import khodemod
 import util
@@ -19,12 +19,20 @@ def _add_init_py(filename):
         dirname = os.path.dirname(dirname)
 
 
-def move_module_suggestor(project_root, old_fullname, new_fullname):
+def move_module_suggestor(project_root, old_fullname, new_fullname,
+                          already_renamed=False):
     """Move a module from old_fullname to new_fullname.
 
     old_fullname and new_fullname should be dotted names.  Their paths
     are taken to be relative to project_root.  The destination must
-    not already exist.
+    not already exist, unless already_renamed is set: that means we already
+    renamed the file (say, in a move that died partway through), and just
+    need to do the rest.  In that case, the suggestor operates on the new
+    file, rather than the old one.
+
+    The module's contents don't change, so we move it with a rename rather
+    than by rewriting it; this keeps its permissions, and means we never
+    have to copy it.  (References to it are fixed up separately.)
     """
     def filename_for(mod):
         return os.path.join(project_root, util.filename_for_module_name(mod))
@@ -37,23 +45,18 @@ def move_module_suggestor(project_root, old_fullname, new_fullname):
         # patch for the new one as well).  Caller should ensure this but we
         # check to be safe.
         if (os.path.normpath(os.path.join(project_root, filename)) !=
-                os.path.normpath(old_pathname)):
+                os.path.normpath(new_pathname if already_renamed
+                                 else old_pathname)):
             return
-        # We don't expect new_pathname to exist, but we allow it if
-        # it's an empty file.  This can happen with __init__.py
-        # files, which we create sometimes.
-        assert (not os.path.exists(new_pathname) or
-                os.stat(new_pathname).st_size == 0), new_pathname
-
-        # Make sure new_filename has the same permissions as the old.
-        # This is most important to keep the executable bit.
-        # TODO(csilvers): don't have low-level file ops here.
-        # TODO(csilvers): also change uid/gid?
-        file_permissions = stat.S_IMODE(os.stat(old_pathname).st_mode)
-
-        yield khodemod.Patch(filename, body, None, 0, len(body))
-        yield khodemod.Patch(new_filename, None, body, 0, 0,
-                             file_permissions=file_permissions)
+        if not already_renamed:
+            # We don't expect new_pathname to exist, but we allow it if
+            # it's an empty file.  This can happen with __init__.py
+            # files, which we create sometimes.
+            assert (not khodemod.file_exists(project_root, new_filename) or
+                    not khodemod.read_file(project_root, new_filename)), (
+                new_pathname)
+
+            yield khodemod.Rename(filename, new_filename)
 
         for patch in _add_init_py(new_filename):
             yield patch
@@ -61,6 +64,127 @@ def move_module_suggestor(project_root, old_fullname, new_fullname):
     return suggestor
 
 
+def move_package_suggestor(project_root, old_fullname, new_fullname,
+                           already_renamed=False):
+    """Move a package from old_fullname to new_fullname, all at once.
+
+    old_fullname and new_fullname should be dotted names of packages.
+    We move the whole package directory with a single rename -- including
+    any non-python files in it -- so this should only be used when every
+    module in the package is moving to the corresponding place in the new
+    package.  The destination directory must not already exist, unless
+    already_renamed is set, as for move_module_suggestor.
+
+    This operates on the __init__.py of the old package (or, if
+    already_renamed is set, the new one).
+    """
+    old_init_filename = util.filename_for_module_name(
+        old_fullname + '.__init__')
+    new_init_filename = util.filename_for_module_name(
+        new_fullname + '.__init__')
+
+    def suggestor(filename, body):
+        # We only need to operate on the old __init__.py.  Caller should
+        # ensure this but we check to be safe.
+        if os.path.normpath(filename) != os.path.normpath(
+                new_init_filename if already_renamed else old_init_filename):
+            return
+        if not already_renamed:
+            old_dirname = os.path.dirname(old_init_filename)
+            new_dirname = os.path.dirname(new_init_filename)
+            assert not os.path.exists(
+                os.path.join(project_root, new_dirname)), new_dirname
+
+            yield khodemod.Rename(os.path.join(old_dirname, ''),
+                                  os.path.join(new_dirname, ''))
+
+        # The new package brings its own __init__.py; this takes care of its
+        # parents.
+        for patch in _add_init_py(new_init_filename):
+            yield patch
+
+    return suggestor
+
+
+def _region_to_move(file_info, old_module, old_symbol, new_symbol,
+                    old_module_toplevel):
+    """Find the definition of old_symbol, and what it should become.
+
+    old_module_toplevel should be util.toplevel_names(file_info).
+
+    Returns (start, end, definition_region, new_definition_region): the
+    region of the file to move, and its text before and after renaming it to
+    new_symbol.
+    """
+    filename = file_info.filename
+    body = file_info.body
+
+    # Find where old_symbol is defined in old_module.
+    # TODO(csilvers): traverse try/except, for, etc, and complain
+    # if we see the symbol defined inside there.
+    # TODO(csilvers): look for ast.AugAssign and complain if our
+    # symbol is in there.
+    if old_symbol not in old_module_toplevel:
+        raise khodemod.FatalError(filename, 0,
+                                  "Could not find symbol '%s' in '%s': "
+                                  "maybe it's in a try/finally or if?"
+                                  % (old_symbol, old_module))
+
+    # Now get the startpos and endpos of this symbol's definition.
+    node_to_move = old_module_toplevel[old_symbol]
+    start, end = util.get_area_for_ast_node(
+        node_to_move, file_info, include_previous_comments=True)
+    definition_region = body[start:end]
+
+    # Decide what text to add, which may require a rename.
+    if old_symbol == new_symbol:
+        return (start, end, definition_region, definition_region)
+
+    # Find the token with the name of the symbol, and update it.
+    if isinstance(node_to_move, (ast.FunctionDef, ast.ClassDef)):
+        for token in file_info.tokens.get_tokens(node_to_move):
+            if token.string in ('def', 'class'):
+                break
+        else:
+            raise khodemod.FatalError(
+                filename, 0,
+                "Could not find symbol '%s' in "
+                "'%s': maybe it's defined weirdly?"
+                % (old_symbol, old_module))
+        # We want the token after the def.
+        name_token = file_info.tokens.next_token(token)
+    else:  # isinstance(node_to_move, ast.Assign)
+        # The name should be a single token, if we get here.
+        name_token, = list(file_info.tokens.get_tokens(
+            node_to_move.targets[0]))
+
+    if name_token.string != old_symbol:
+        raise khodemod.FatalError(filename, 0,
+                                  "Could not find symbol '%s' in "
+                                  "'%s': maybe it's defined weirdly?"
+                                  % (old_symbol, old_module))
+    new_definition_region = (
+        body[start:name_token.startpos] + new_symbol
+        + body[name_token.endpos:end])
+    return (start, end, definition_region, new_definition_region)
+
+
+def _region_to_append(file_body, region):
+    """Return region, with the right leading newlines to append to file_body.
+    """
+    # Mess about with leading newlines.  First, we strip any existing
+    # ones.  Then, if we are adding to an existing file, we add enough
+    # to satisfy pep8.
+    region = region.lstrip('\r\n')
+    if file_body:
+        current_newlines = (
+            len(file_body) - len(file_body.rstrip('\r\n'))
+            + len(region) - len(region.lstrip('\r\n')))
+        if current_newlines < 3:
+            region = '\n' * (3 - current_newlines) + region
+    return region
+
+
 def move_symbol_suggestor(project_root, old_fullname, new_fullname):
     """Move a symbol from old_fullname to new_fullname.
 
@@ -68,106 +192,80 @@ def move_symbol_suggestor(project_root, old_fullname, new_fullname):
     the form module.symbol.  The destination fullname should not
     already exist (though the destination module may).
     """
-    def suggestor(filename, body):
-        (old_module, old_symbol) = old_fullname.rsplit('.', 1)
-        (new_module, new_symbol) = new_fullname.rsplit('.', 1)
+    return move_symbols_suggestor(project_root,
+                                  [(old_fullname, new_fullname)])
 
-        # We only need to operate on the old file (although we'll generate a
-        # patch for the new one as well).  Caller should ensure this but we
-        # check to be safe.
+
+def move_symbols_suggestor(project_root, old_new_fullname_pairs):
+    """Move several symbols out of a module at once.
+
+    old_new_fullname_pairs is a list of (old_fullname, new_fullname) pairs,
+    each as for move_symbol_suggestor.  The old_fullnames must all be in the
+    same module, but the new_fullnames may be in any modules.  We find all
+    the definitions with a single parse of the old module, and add them to
+    each new module in a single patch, in the order they were in the old one.
+    """
+    (old_module, _) = old_new_fullname_pairs[0][0].rsplit('.', 1)
+    assert all(old_fullname.rsplit('.', 1)[0] == old_module
+               for (old_fullname, _) in old_new_fullname_pairs), (
+        old_new_fullname_pairs)
+
+    def suggestor(filename, body):
+        # We only need to operate on the old file (although we'll generate
+        # patches for the new ones as well).  Caller should ensure this but
+        # we check to be safe.
         if filename != util.filename_for_module_name(old_module):
             return
 
         file_info = util.File(filename, body)
-
-        # Find where old_fullname is defined in old_module.
-        # TODO(csilvers): traverse try/except, for, etc, and complain
-        # if we see the symbol defined inside there.
-        # TODO(csilvers): look for ast.AugAssign and complain if our
-        # symbol is in there.
         old_module_toplevel = util.toplevel_names(file_info)
-        if old_symbol not in old_module_toplevel:
-            raise khodemod.FatalError(filename, 0,
-                                      "Could not find symbol '%s' in '%s': "
-                                      "maybe it's in a try/finally or if?"
-                                      % (old_symbol, old_module))
-
-        # Now get the startpos and endpos of this symbol's definition.
-        node_to_move = old_module_toplevel[old_symbol]
-        start, end = util.get_area_for_ast_node(
-            node_to_move, file_info, include_previous_comments=True)
-        definition_region = body[start:end]
-
-        # Decide what text to add, which may require a rename.
-        if old_symbol == new_symbol:
-            new_definition_region = definition_region
-        else:
-            # Find the token with the name of the symbol, and update it.
-            if isinstance(node_to_move, (ast.FunctionDef, ast.ClassDef)):
-                for token in file_info.tokens.get_tokens(node_to_move):
-                    if token.string in ('def', 'class'):
-                        break
-                else:
-                    raise khodemod.FatalError(
-                        filename, 0,
-                        "Could not find symbol '%s' in "
-                        "'%s': maybe it's defined weirdly?"
-                        % (old_symbol, old_module))
-                # We want the token after the def.
-                name_token = file_info.tokens.next_token(token)
-            else:  # isinstance(node_to_move, ast.Assign)
-                # The name should be a single token, if we get here.
-                name_token, = list(file_info.tokens.get_tokens(
-                    node_to_move.targets[0]))
-
-            if name_token.string != old_symbol:
-                raise khodemod.FatalError(filename, 0,
-                                          "Could not find symbol '%s' in "
-                                          "'%s': maybe it's defined weirdly?"
-                                          % (old_symbol, old_module))
-            new_definition_region = (
-                body[start:name_token.startpos] + new_symbol
-                + body[name_token.endpos:end])
-
-        if old_module == new_module:
-            # Just patch the module in place.
-            yield khodemod.Patch(
-                filename, definition_region, new_definition_region, start, end)
-        else:
-            # Remove the region from the old file.
-            # (If we've removed the remainder of the file,
-            # _remove_empty_files_suggestor will clean up.)
-            yield khodemod.Patch(filename, definition_region, '', start, end)
 
-            # Add the region to the new file.
+        # Map from new module to the regions to add to it, as
+        # (start-in-old-file, text) pairs.
+        regions_by_new_module = collections.OrderedDict()
+        for (old_fullname, new_fullname) in old_new_fullname_pairs:
+            (_, old_symbol) = old_fullname.rsplit('.', 1)
+            (new_module, new_symbol) = new_fullname.rsplit('.', 1)
+            start, end, definition_region, new_definition_region = (
+                _region_to_move(file_info, old_module, old_symbol,
+                                new_symbol, old_module_toplevel))
+
+            if old_module == new_module:
+                # Just patch the module in place.
+                yield khodemod.Patch(filename, definition_region,
+                                     new_definition_region, start, end)
+            else:
+                # Remove the region from the old file.
+                # (If we've removed the remainder of the file,
+                # _remove_empty_files_suggestor will clean up.)
+                yield khodemod.Patch(filename, definition_region, '',
+                                     start, end)
+                regions_by_new_module.setdefault(new_module, []).append(
+                    (start, new_definition_region))
+
+        for (new_module, regions) in regions_by_new_module.iteritems():
+            # Now we need to add the new symbols to new_module.
+            # TODO(benkraft): Allow, as an option, adding them after a
+            # specific other symbol in new_module.
             new_filename = util.filename_for_module_name(new_module)
             new_file_body = khodemod.read_file(
                 project_root, new_filename) or ''
-
-            # Mess about with leading newlines.  First, we strip any existing
-            # ones.  Then, if we are adding to an existing file, we add enough
-            # to satisfy pep8.
-            new_definition_region = new_definition_region.lstrip('\r\n')
-            if new_file_body:
-                current_newlines = (
-                    len(new_file_body) - len(new_file_body.rstrip('\r\n'))
-                    + len(new_definition_region)
-                    - len(new_definition_region.lstrip('\r\n')))
-                if current_newlines < 3:
-                    new_definition_region = ('\n' * (3 - current_newlines)
-                                             + new_definition_region)
-
-            # Now we need to add the new symbol to new_module.
-            # TODO(benkraft): Allow, as an option, adding it after a specific
-            # other symbol in new_module.
-            yield khodemod.Patch(new_filename, '', new_definition_region,
+            new_text = ''
+            for (_, region) in sorted(regions):
+                new_text += _region_to_append(new_file_body + new_text,
+                                              region)
+            yield khodemod.Patch(new_filename, '', new_text,
                                  len(new_file_body), len(new_file_body))
 
             # TODO(benkraft): Fix up imports in the new and old modules.
 
-        new_filename = util.filename_for_module_name(new_module)
-        for patch in _add_init_py(new_filename):
-            yield patch
-
+        seen_init_py_patches = set()
+        for (_, new_fullname) in old_new_fullname_pairs:
+            (new_module, _) = new_fullname.rsplit('.', 1)
+            new_filename = util.filename_for_module_name(new_module)
+            for patch in _add_init_py(new_filename):
+                if patch.filename not in seen_init_py_patches:
+                    seen_init_py_patches.add(patch.filename)
+                    yield patch
 
     return suggestor
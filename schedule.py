@@ -0,0 +1,122 @@
+"""Running the steps of a job concurrently, when they don't conflict.
+
+A move is a series of steps -- move this module, fix references to it, move
+that one, and so on -- which we'd do one after another.  But many of them
+have nothing to do with each other: moving foo.py to bar.py doesn't care
+whether we've fixed references to some other module yet, so long as those
+fixes don't touch foo.py or bar.py.  So each step (a Task) says which files
+it reads and which it writes; two tasks conflict if either writes a file the
+other reads or writes.  We run each task as soon as every earlier task it
+conflicts with is done, so every file sees the same changes in the same
+order it would if we ran the tasks one after another, and the results are
+the same.  Among the tasks ready to run, we start the costliest first (see
+khodemod.FileCosts), so a slow task doesn't hold everything up at the end.
+
+Note that python threads only run one at a time, so this mostly helps when
+tasks spend their time on I/O; but that's often the case for steps like
+renaming files.
+"""
+from __future__ import absolute_import
+
+import multiprocessing.pool
+import Queue
+import sys
+
+
+class Task(object):
+    """A step of a job.
+
+    fn is the function to call to do it.  reads and writes are the sets of
+    files it may read and write, or None if it may read or write anything;
+    a file written but not read still counts as written.  cost is an
+    estimate of how long it will take, in any units.
+    """
+    def __init__(self, name, fn, reads=None, writes=None, cost=0):
+        self.name = name
+        self.fn = fn
+        self.reads = None if reads is None else frozenset(reads)
+        self.writes = None if writes is None else frozenset(writes)
+        self.cost = cost
+
+    def __repr__(self):
+        return 'Task(%r)' % self.name
+
+
+def _overlap(files, other_files):
+    if files is None:
+        return other_files is None or bool(other_files)
+    elif other_files is None:
+        return bool(files)
+    return not files.isdisjoint(other_files)
+
+
+def conflicts(task, other_task):
+    """Whether the order in which we run these tasks matters."""
+    return (_overlap(task.writes, other_task.writes) or
+            _overlap(task.writes, other_task.reads) or
+            _overlap(task.reads, other_task.writes))
+
+
+def dependencies(tasks):
+    """Return, for each task, the indexes of the earlier tasks it must follow.
+
+    We only include the tasks it conflicts with directly; any it must follow
+    because of those it follows anyway.
+    """
+    return [{j for j in xrange(i) if conflicts(tasks[j], task)}
+            for (i, task) in enumerate(tasks)]
+
+
+def run_tasks(tasks, workers=1):
+    """Run the tasks, on up to workers threads, in an order that's safe.
+
+    That is, each task runs once every earlier task it conflicts with is done.
+    (With one worker, that's just in order.)  Whenever a worker is free, we
+    give it the costliest of the tasks ready to run (the earliest, if there's
+    a tie).  If a task raises, we start no more tasks, wait for those running
+    to finish, and then re-raise the first exception.
+    """
+    if workers <= 1:
+        for task in tasks:
+            task.fn()
+        return
+
+    deps = dependencies(tasks)
+    finished = Queue.Queue()
+
+    def run(i):
+        try:
+            tasks[i].fn()
+            finished.put((i, None))
+        except BaseException:
+            finished.put((i, sys.exc_info()))
+
+    pool = multiprocessing.pool.ThreadPool(workers)
+    waiting = set(xrange(len(tasks)))
+    done = set()
+    running = 0
+    error = None
+    try:
+        while True:
+            if error is None:
+                # Start what's ready, costliest first, while we have workers
+                # free.  We choose again each time a task finishes, since
+                # that may make a costlier one ready.
+                ready = sorted((i for i in waiting if deps[i] <= done),
+                               key=lambda i: (-tasks[i].cost, i))
+                for i in ready[:workers - running]:
+                    waiting.remove(i)
+                    pool.apply_async(run, (i,))
+                    running += 1
+            if not running:
+                break
+            (i, exc_info) = finished.get()
+            running -= 1
+            done.add(i)
+            if exc_info is not None and error is None:
+                error = exc_info
+    finally:
+        pool.close()
+        pool.join()
+    if error is not None:
+        raise error[0], error[1], error[2]
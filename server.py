@@ -0,0 +1,298 @@
+"""A server that keeps slicker's view of a project warm between moves.
+
+Each run of slicker.py starts from scratch: it walks the tree, and reads and
+parses every file that might refer to what it's moving.  In a refactoring
+session, where one does many moves back to back, that's mostly the same work
+every time.  `slicker.py serve` starts a server that keeps the list of files,
+their contents, and their ASTs in memory, and listens on a Unix socket in the
+project root; while it's running, slicker.py sends its moves there instead of
+doing them itself.
+
+The server is a thin layer over a slicker.Project, which does the caching.  It
+doesn't trust its caches blindly: khodemod re-reads a file if its mtime, size
+or inode have changed.  And before each move, we check the mtime of each
+directory we know about (and its .gitignore): files can't be added, removed or
+renamed without changing one of those, so if none have changed, the list of
+files is still good.
+
+Like slicker.py, the server keeps a journal of each move (see journal.py), so
+if it dies partway through one, `slicker.py --resume` can finish the move.
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import socket
+import StringIO
+import sys
+import traceback
+
+import journal
+import khodemod
+import slicker
+
+
+SOCKET_NAME = '.slicker.sock'
+
+
+def socket_path(project_root):
+    return os.path.join(os.path.abspath(project_root), SOCKET_NAME)
+
+
+def _mtime(path):
+    """The mtime of path, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def _take_snapshot(root, path_filter, top=None):
+    """Return a dict from directories (and .gitignores) to their mtimes.
+
+    We look at every directory under top (default: root) that path_filter
+    includes.
+    """
+    snapshot = {}
+    for dirpath, dirnames, _ in os.walk(top or root):
+        dirnames[:] = [
+            name for name in dirnames
+            if path_filter(os.path.join(
+                os.path.relpath(os.path.join(dirpath, name), root), ''))]
+        snapshot[dirpath] = _mtime(dirpath)
+        gitignore = os.path.join(dirpath, '.gitignore')
+        snapshot[gitignore] = _mtime(gitignore)
+    return snapshot
+
+
+def _snapshot_is_current(snapshot):
+    return all(_mtime(path) == mtime for path, mtime in snapshot.iteritems())
+
+
+def _update_snapshot(snapshot, root, path_filter):
+    """Update snapshot in place to account for changes we made.
+
+    This is much faster than taking a new snapshot: we only need to list the
+    directories whose mtimes changed, to see if they have new subdirectories.
+    """
+    for path, mtime in snapshot.items():
+        new_mtime = _mtime(path)
+        if new_mtime == mtime:
+            continue
+        elif new_mtime is None:
+            del snapshot[path]
+        elif os.path.basename(path) == '.gitignore':
+            snapshot[path] = new_mtime
+        else:
+            snapshot[path] = new_mtime
+            for name in os.listdir(path):
+                subdir = os.path.join(path, name)
+                if (subdir not in snapshot and os.path.isdir(subdir) and
+                        path_filter(os.path.join(
+                            os.path.relpath(subdir, root), ''))):
+                    snapshot.update(_take_snapshot(root, path_filter, subdir))
+
+
+def _to_str(value):
+    """Convert unicode from JSON to the (utf-8) strs slicker expects."""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, list):
+        return [_to_str(item) for item in value]
+    return value
+
+
+class Server(object):
+    """Does moves in a single project, keeping what it can between them."""
+    def __init__(self, project_root='.'):
+        project_root = os.path.abspath(project_root)
+        self.project = slicker.Project(
+            project_root, journal_path=journal.default_path(project_root))
+        self._snapshot = None
+
+    def _refresh(self):
+        """Have the project forget the list of files if the tree changed."""
+        if self._snapshot is not None and _snapshot_is_current(self._snapshot):
+            return
+        self.project.invalidate()
+        self._snapshot = None
+
+    def _record_changes(self):
+        """Update our snapshot of the tree to include our own changes."""
+        if self._snapshot is None:
+            self._snapshot = _take_snapshot(self.project.root,
+                                            self.project.path_filter)
+        else:
+            _update_snapshot(self._snapshot, self.project.root,
+                             self.project.path_filter)
+
+    def warm_up(self):
+        """Compute the list of files, so the first move needn't."""
+        for _ in khodemod.resolve_paths(self.project.path_filter,
+                                        root=self.project.root):
+            pass
+        self._record_changes()
+
+    def move(self, old_fullnames, new_fullname, import_alias=None,
+             automove=True, verbose=False, io_threads=0, workers=1,
+             stats=False):
+        """Do a move, as slicker.make_fixes would.
+
+        If stats is set, print the move's khodemod.Stats when done.  Returns
+        a pair (output, error): the text the move printed, and the traceback
+        if it raised, or None if it succeeded.
+        """
+        self._refresh()
+        self.project.frontend.verbose = verbose
+        self.project.frontend.io_threads = io_threads
+        self.project.workers = workers
+        output = StringIO.StringIO()
+        old_stdout, old_stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output
+        try:
+            move_stats = self.project.move(old_fullnames, new_fullname,
+                                           alias=import_alias,
+                                           automove=automove)
+            if stats:
+                print move_stats.format()
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        finally:
+            sys.stdout, sys.stderr = old_stdout, old_stderr
+        self._record_changes()
+        return output.getvalue(), error
+
+    def _handle_connection(self, conn):
+        """Handle a single request; return False if we should stop serving.
+
+        Requests and responses are each a single line of JSON.  A request is
+        either {"stop": true} or the keyword arguments to move().
+        """
+        f = conn.makefile('rw')
+        try:
+            line = f.readline()
+            if not line:    # someone just checking we're here
+                return True
+            request = json.loads(line)
+            if request.get('stop'):
+                response = {'stopped': True}
+            else:
+                output, error = self.move(**{
+                    str(key): _to_str(value)
+                    for key, value in request.iteritems()})
+                response = {'output': output, 'error': error}
+            f.write(json.dumps(response) + '\n')
+            f.flush()
+        finally:
+            f.close()
+        return not request.get('stop')
+
+    def serve_forever(self):
+        """Listen for requests on the project's socket until told to stop."""
+        path = socket_path(self.project.root)
+        if os.path.exists(path):
+            sock = _connect(self.project.root)
+            if sock is not None:
+                sock.close()
+                raise RuntimeError("There's already a slicker server for %s"
+                                   % self.project.root)
+            os.unlink(path)     # left over from a server that died
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        try:
+            listener.listen(5)
+            self.warm_up()
+            while True:
+                conn, _ = listener.accept()
+                try:
+                    keep_going = self._handle_connection(conn)
+                finally:
+                    conn.close()
+                if not keep_going:
+                    break
+        finally:
+            listener.close()
+            os.unlink(path)
+
+
+def _connect(project_root):
+    """Connect to the server for project_root; None if there isn't one."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path(project_root))
+    except socket.error:
+        sock.close()
+        return None
+    return sock
+
+
+def _request(project_root, request):
+    """Send request to the server; return its response, or None if no server.
+    """
+    sock = _connect(project_root)
+    if sock is None:
+        return None
+    f = sock.makefile('rw')
+    try:
+        f.write(json.dumps(request) + '\n')
+        f.flush()
+        response = f.readline()
+    finally:
+        f.close()
+        sock.close()
+    if not response:
+        raise RuntimeError("The slicker server for %s exited unexpectedly"
+                           % os.path.abspath(project_root))
+    return json.loads(response)
+
+
+def send_move(project_root, old_fullnames, new_fullname, **kwargs):
+    """Ask the server for project_root to do a move, if one is running.
+
+    kwargs are as for Server.move.
+    Returns a pair (output, error) as for Server.move, or None if there's no
+    server running.
+    """
+    kwargs.update(old_fullnames=old_fullnames, new_fullname=new_fullname)
+    response = _request(project_root, kwargs)
+    if response is None:
+        return None
+    return response['output'], response['error']
+
+
+def stop(project_root):
+    """Stop the server for project_root; return False if none was running."""
+    return _request(project_root, {'stop': True}) is not None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        prog='slicker.py serve',
+        description=('Keep the state of a project in memory, so that '
+                     'slicker.py can do moves in it faster.  While this is '
+                     'running, slicker.py sends moves under ROOT to it.'))
+    parser.add_argument('--root', default='.',
+                        help=('The project-root of the directory-tree to '
+                              'serve.  Moves must use the same root.'))
+    parser.add_argument('--stop', action='store_true',
+                        help='Stop the server for ROOT, if there is one.')
+    parsed_args = parser.parse_args(argv)
+
+    if parsed_args.stop:
+        if not stop(parsed_args.root):
+            sys.exit("No slicker server is running for %s"
+                     % os.path.abspath(parsed_args.root))
+        return
+
+    server = Server(parsed_args.root)
+    khodemod.dump_status_on_signal()
+    print "Serving %s on %s" % (server.project.root,
+                                socket_path(server.project.root))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -72,7 +72,9 @@ from __future__ import absolute_import
 
 import argparse
 import ast
+import cProfile
 import collections
+import contextlib
 import difflib
 import itertools
 import os
@@ -83,11 +85,23 @@ import tokenize
 
 import fix_python_imports
 import inputs
+import journal
 import khodemod
 import moves
+import schedule
 import util
+import verify
 
 
+# With a cache budget (see Project), roughly how many times the size of its
+# text a parsed file takes, once we have its AST and tokens.
+_PARSED_FILE_SIZE_FACTOR = 50
+
+# The cache budget (see Project) for make_fixes.  A single move only needs
+# its caches to avoid redoing work between its own passes, so they needn't
+# hold the whole project.
+_ONE_MOVE_CACHE_BUDGET = 16 * 1024 * 1024
+
 _FILENAME_EXTENSIONS = ('.py', '.js', '.jsx', '.png', '.jpg', '.svg', '.html',
                         '.less', '.handlebars', '.json', '.txt', '.css')
 _FILENAME_EXTENSIONS_RE_STRING = '|'.join(re.escape(e)
@@ -135,12 +149,23 @@ def _re_for_path(path):
     return re.compile(r'(?<!/)\b%s\b' % re.escape(path))
 
 
+def _intern(name):
+    """Intern a dotted name, so comparing and hashing it again is cheap.
+
+    Names from the AST are strs; we leave anything else (say, unicode)
+    alone.
+    """
+    return intern(name) if type(name) is str else name
+
+
 def _dotted_starts_with(string, prefix):
     """Like string.startswith(prefix), but in the dotted sense.
 
     That is, abc is a prefix of abc.de but not abcde.ghi.
     """
-    return prefix == string or string.startswith('%s.' % prefix)
+    # We're called a lot, so we avoid building the string prefix + '.'.
+    return string.startswith(prefix) and (len(string) == len(prefix) or
+                                          string[len(prefix)] == '.')
 
 
 def _dotted_prefixes(string, proper_only=False):
@@ -151,9 +176,13 @@ def _dotted_prefixes(string, proper_only=False):
 
     If proper_prefixes is True, do not include string itself.
     """
-    string_parts = string.split('.')
-    for i in xrange(len(string_parts) - (1 if proper_only else 0)):
-        yield '.'.join(string_parts[:i + 1])
+    # Slicing at each dot is much cheaper than splitting and re-joining.
+    dot = string.find('.')
+    while dot != -1:
+        yield string[:dot]
+        dot = string.find('.', dot + 1)
+    if not proper_only:
+        yield string
 
 
 class FakeOptions(object):
@@ -173,15 +202,22 @@ class Import(object):
 
     So for example, 'from foo import bar' would result in an Import with
     name='foo.bar' and alias='bar'.  See test cases for more examples.
+
+    We make a lot of these, and put them in a lot of sets, so they're
+    slotted, and compute their hash just once; they mustn't be modified.
     """
+    __slots__ = ('name', 'alias', 'node', '_file_info', '_span', '_hash')
+
     def __init__(self, name, alias, node, file_info):
         # TODO(benkraft): Perhaps this class should also own extracting
         # name/alias from node.
-        self.name = name
-        self.alias = alias
+        self.name = _intern(name)
+        self.alias = _intern(alias)
         self.node = node
         self._file_info = file_info
         self._span = None  # computed lazily
+        # self._span is computed from the other properties so we exclude it.
+        self._hash = hash((self.name, self.alias, self.node, self._file_info))
 
     @property
     def span(self):
@@ -202,14 +238,15 @@ class Import(object):
         return "Import(name=%r, alias=%r)" % (self.name, self.alias)
 
     def __hash__(self):
-        # self._span is computed from the other properties so we exclude it.
-        return hash((self.name, self.alias, self.node, self._file_info))
+        return self._hash
 
     def __eq__(self, other):
         # self._span is computed from the other properties so we exclude it.
-        return (isinstance(other, Import) and self.name == other.name
-                and self.alias == other.alias and self.node == other.node
-                and self._file_info == other._file_info)
+        return (self is other or
+                (isinstance(other, Import) and self._hash == other._hash
+                 and self.name == other.name and self.alias == other.alias
+                 and self.node == other.node
+                 and self._file_info == other._file_info))
 
 
 # LocalName: how a particular name (symbol or module) is referenced
@@ -321,7 +358,10 @@ def _localnames_from_fullnames(file_info, fullnames, imports=None):
 
     imports_by_name = {}
     unaliased_imports_by_name_prefix = {}
-    for imp in imports:
+    # imports is a set, so we sort it: callers that want the "best" import
+    # (see _resolve_import_alias) shouldn't depend on hash-order.
+    for imp in sorted(imports,
+                      key=lambda imp: (imp.node.lineno, imp.node.col_offset)):
         name_prefix = imp.name.split('.', 1)[0]
         imports_by_name.setdefault(imp.name, []).append(imp)
         if imp.name == imp.alias:
@@ -552,11 +592,25 @@ def _check_import_conflicts(file_info, old_fullname, added_name, is_alias):
                 if _dotted_starts_with(added_name, imp.alias)}
 
 
-def _unused_imports(imports, old_fullname, file_info, within_node=None):
+def _renamed(name, renames):
+    """Return name, after the first of renames that applies to it.
+
+    renames is a list of (old, new) pairs; (foo.bar, baz) renames foo.bar.qux
+    to baz.qux.
+    """
+    for (old, new) in renames:
+        if _dotted_starts_with(name, old):
+            return new + name[len(old):]
+    return name
+
+
+def _unused_imports(imports, old_fullname, file_info, within_node=None,
+                    renames=(), added_aliases=()):
     """Decide what imports we can remove.
 
     Note that this should be run after the patches to references in the file
-    have been applied, i.e. in a separate suggestor.
+    have been applied, i.e. in a separate suggestor -- unless you just want
+    to predict what it would do (see renames).
 
     Arguments:
         imports: set of imports to consider removing.  These should likely be
@@ -569,6 +623,11 @@ def _unused_imports(imports, old_fullname, file_info, within_node=None):
         file_info: the util.File object.
         within_node: if set, only consider imports within this AST node.
             (Useful for deciding whether to remove imports in that node.)
+        renames, added_aliases: to predict what we'd decide once the
+            references in the file have been fixed, without fixing them:
+            renames is a list of the (old_localname, new_localname) pairs
+            we'd replace, and added_aliases the aliases of any imports we'd
+            add.
 
     Returns (set of imports we can remove,
              set of imports that may be used implicitly).
@@ -586,8 +645,13 @@ def _unused_imports(imports, old_fullname, file_info, within_node=None):
         # This includes all names that we might be *implicitly*
         # accessing via this import (special case (1) of the
         # module docstring, e.g. 'import foo.bar; foo.baz.myfunc()'.
-        implicitly_used_names = _names_starting_with(
-            imp.alias.split('.', 1)[0], within_node)
+        prefix = imp.alias.split('.', 1)[0]
+        implicitly_used_names = _names_starting_with(prefix, within_node)
+        if renames:
+            implicitly_used_names = [
+                name for name in (_renamed(name, renames)
+                                  for name in implicitly_used_names)
+                if _dotted_starts_with(name, prefix)]
         # This is only those names that we are explicitly accessing
         # via this import, i.e. not via such an "implicit import".
         explicitly_referenced_names = [
@@ -621,11 +685,12 @@ def _unused_imports(imports, old_fullname, file_info, within_node=None):
     else:
         all_imports = _compute_all_imports(file_info, within_node=within_node)
 
-    kept_imports = all_imports - unused_imports - implicitly_used_imports
+    kept_aliases = [imp.alias for imp in all_imports - unused_imports -
+                    implicitly_used_imports] + list(added_aliases)
     for maybe_removable_imp in list(implicitly_used_imports):
         prefix = maybe_removable_imp.alias.split('.')[0]
-        for kept_imp in kept_imports:
-            if _dotted_starts_with(kept_imp.alias, prefix):
+        for kept_alias in kept_aliases:
+            if _dotted_starts_with(kept_alias, prefix):
                 implicitly_used_imports.remove(maybe_removable_imp)
                 unused_imports.add(maybe_removable_imp)
                 break
@@ -633,6 +698,24 @@ def _unused_imports(imports, old_fullname, file_info, within_node=None):
     return (unused_imports, implicitly_used_imports)
 
 
+def _unused_imports_for_all(imports, old_fullnames, file_info,
+                            within_node=None):
+    """Like _unused_imports, but for several old fullnames at once.
+
+    An import is unused if _unused_imports says so for any of the
+    old_fullnames.  (Its answer only depends on old_fullname for imports of
+    exactly that name.)
+    """
+    unused_imports = set()
+    implicitly_used_imports = set()
+    for old_fullname in old_fullnames:
+        unused, implicitly_used = _unused_imports(
+            imports, old_fullname, file_info, within_node)
+        unused_imports |= unused
+        implicitly_used_imports |= implicitly_used
+    return (unused_imports, implicitly_used_imports - unused_imports)
+
+
 def _choose_best_localname(file_info, fullname, name_to_import, import_alias):
     """Decide what localname we should refer to fullname by in this file.
 
@@ -780,45 +863,18 @@ def _replace_in_string(node, regex, replacement, file_info):
             deletion_start, deletion_end)
 
 
-def _replace_in_file(file_info, old_fullname, old_localnames,
-                     new_fullname, new_localname, node_to_fix=None):
-    """Replace old name with new name in file, everywhere.
+def _regexes_to_check(old_fullname, old_localnames,
+                      new_fullname, new_localname):
+    """Return what to replace in strings and comments, when fixing a file.
 
-    Arguments:
-        old_fullname, new_fullname: as in _fix_uses_suggestor.
-        old_localnames: the localnames to look for when replacing, as strings.
-        new_localname: the localname to replace with, as a string.
-        node_to_fix: if set, we only fix up references inside this AST node,
-            rather than in the whole file.
+    Arguments are as for _replace_in_file.  We look for both the
+    fully-qualified name (if it changed) and any aliases in use in this file,
+    as well as the filename if we are moving a module.  We always replace
+    fully-qualified references with fully-qualified references; references to
+    aliases get replaced with whatever we're using for the rest of the file.
 
-    Returns (list of patches, set of old_localnames we found in code).  Note
-    that the old_localnames we found in code may not all have been patched, in
-    the case where new_localname was one of them.  (For example if you are
-    moving 'foo.myfunc' to 'bar.myfunc' and had 'import foo as bar' in the old
-    file.)  We return those anyway, since you may want to fix their imports.
+    Returns a list of (regex, replacement) pairs.
     """
-    patches = []
-    used_localnames = set()
-    node_to_fix = node_to_fix or file_info.tree
-
-    # First, fix up normal references in code.
-    for localname in old_localnames:
-        for (name, ast_nodes) in (
-                _names_starting_with(localname, node_to_fix).iteritems()):
-            for node in ast_nodes:
-                start, end = file_info.tokens.get_text_range(node)
-                used_localnames.add(localname)
-                if localname != new_localname:
-                    patches.append(khodemod.Patch(
-                        file_info.filename, file_info.body[start:end],
-                        new_localname + name[len(localname):],
-                        start, end))
-
-    # Fix up references in strings and comments.  We look for both the
-    # fully-qualified name (if it changed) and any aliases in use in this file,
-    # as well as the filename if we are moving a module.  We always replace
-    # fully-qualified references with fully-qualified references; references to
-    # aliases get replaced with whatever we're using for the rest of the file.
     regexes_to_check = []
     # If we are just updating the localname, and not actually moving the symbol
     # -- which happens in _fix_moved_region_suggestor -- we don't need to
@@ -841,28 +897,113 @@ def _replace_in_file(file_info, old_fullname, old_localnames,
         # flags.flags, not plain 'flags', in this case.
         if not _dotted_starts_with(old_fullname, localname):
             regexes_to_check.append((_re_for_name(localname), new_localname))
+    return regexes_to_check
+
+
+class _References(collections.namedtuple(
+        '_References', ['code', 'strings', 'comment_regexes'])):
+    """The references to a name that _replace_in_file would replace.
+
+    code is a dict from each old localname used in code to its uses, as
+    _names_starting_with returns them; strings is a list of (ast.Str node,
+    regex, replacement) for each regex that matches each string; and
+    comment_regexes is the (regex, replacement) pairs that might match in
+    comments.  See _find_references.
+    """
+
+
+def _find_references(file_info, old_fullname, old_localnames,
+                     new_fullname, new_localname, node_to_fix=None):
+    """Find the references to old name in file, for _replace_in_file.
+
+    Arguments are as for _replace_in_file.  This needs only the file's AST,
+    not its tokens, which are much slower to compute, so it's also how
+    Project.report() predicts what we'd replace.
+
+    Returns a _References.
+    """
+    node_to_fix = node_to_fix or file_info.tree
+
+    # Normal references in code.
+    code = {}
+    for localname in old_localnames:
+        names = _names_starting_with(localname, node_to_fix)
+        if names:
+            code[localname] = names
+
+    # References in strings and comments.
+    regexes_to_check = _regexes_to_check(old_fullname, old_localnames,
+                                         new_fullname, new_localname)
 
     # Strings
-    for node in ast.walk(node_to_fix):
-        if isinstance(node, ast.Str):
-            # We compute str_tokens only if any of the regexes match
-            for regex, replacement in regexes_to_check:
-                patches.extend(
-                    _replace_in_string(node, regex, replacement, file_info))
+    strings = [(node, regex, replacement)
+               for node in ast.walk(node_to_fix)
+               if isinstance(node, ast.Str)
+               for (regex, replacement) in regexes_to_check
+               if regex.search(node.s)]
 
     # Comments
     # HACK: to avoid touching file_info.tokens unnecessarily, which is slow, we
     # first check to see if the regexes appear *anywhere* in the body.  If not,
     # they certainly can't be in a comment!  So we skip the extra parsing.
-    for regex, replacement in regexes_to_check:
-        if regex.search(file_info.body):
-            break
+    if any(regex.search(file_info.body) for (regex, _) in regexes_to_check):
+        comment_regexes = regexes_to_check
     else:
-        return patches, used_localnames
+        comment_regexes = []
+
+    return _References(code, strings, comment_regexes)
+
+
+def _replace_in_file(file_info, old_fullname, old_localnames,
+                     new_fullname, new_localname, node_to_fix=None,
+                     references=None):
+    """Replace old name with new name in file, everywhere.
+
+    Arguments:
+        old_fullname, new_fullname: as in _fix_uses_suggestor.
+        old_localnames: the localnames to look for when replacing, as strings.
+        new_localname: the localname to replace with, as a string.
+        node_to_fix: if set, we only fix up references inside this AST node,
+            rather than in the whole file.
+        references: what _find_references returned for these arguments, if
+            the caller already has it.
+
+    Returns (list of patches, set of old_localnames we found in code).  Note
+    that the old_localnames we found in code may not all have been patched, in
+    the case where new_localname was one of them.  (For example if you are
+    moving 'foo.myfunc' to 'bar.myfunc' and had 'import foo as bar' in the old
+    file.)  We return those anyway, since you may want to fix their imports.
+    """
+    if references is None:
+        references = _find_references(file_info, old_fullname,
+                                      old_localnames, new_fullname,
+                                      new_localname, node_to_fix)
+    patches = []
+    node_to_fix = node_to_fix or file_info.tree
+
+    # First, fix up normal references in code.
+    for (localname, names) in references.code.iteritems():
+        if localname == new_localname:
+            continue
+        for (name, ast_nodes) in names.iteritems():
+            for node in ast_nodes:
+                start, end = file_info.tokens.get_text_range(node)
+                patches.append(khodemod.Patch(
+                    file_info.filename, file_info.body[start:end],
+                    new_localname + name[len(localname):],
+                    start, end))
+
+    # Fix up references in strings and comments.
+    for (node, regex, replacement) in references.strings:
+        patches.extend(
+            _replace_in_string(node, regex, replacement, file_info))
+
+    if not references.comment_regexes:
+        return patches, set(references.code)
 
     for token in file_info.tokens.get_tokens(node_to_fix, include_extra=True):
         if token.type == tokenize.COMMENT:
-            for regex, replacement in regexes_to_check:
+            for regex, replacement in references.comment_regexes:
                 # TODO(benkraft): Handle names broken across multiple lines
                 # of comments.
                 for match in regex.finditer(token.string):
@@ -872,7 +1013,7 @@ def _replace_in_file(file_info, old_fullname, old_localnames,
                         token.startpos + match.start(),
                         token.startpos + match.end()))
 
-    return patches, used_localnames
+    return patches, set(references.code)
 
 
 def _new_import_stmt(name, alias=None):
@@ -1030,6 +1171,81 @@ def _resolve_import_alias(import_alias, name_to_import, old_localnames):
         return import_alias
 
 
+class _UseFixes(collections.namedtuple(
+        '_UseFixes', ['old_localnames', 'import_alias', 'new_localname',
+                      'references', 'import_stmt', 'explicit_imports',
+                      'conflicting_imports'])):
+    """What _fix_uses_suggestor would do to a file: see _analyze_uses."""
+
+
+def _analyze_uses(file_info, old_fullname, new_fullname, name_to_import,
+                  import_alias):
+    """Decide how to fix the references to old_fullname in a file.
+
+    Arguments are as for _fix_uses_suggestor.  This is the analysis that
+    _fix_uses_suggestor does before it builds any patches, which
+    Project.report() also uses to predict what it would do; so, like
+    _find_references, it needs the file's AST but not its tokens.
+
+    Returns a _UseFixes, whose
+        old_localnames: the LocalNames for old_fullname in the file, best
+            first.
+        import_alias: the alias to use for the new import in this file.
+        new_localname: what to call new_fullname in this file.
+        references: the _References to old_fullname we'd replace.
+        import_stmt: the import we'd add, or None if we don't need one.
+        explicit_imports: the existing imports of the old name, after
+            each of which we'd add import_stmt; if there are none, we'd add
+            it at the top of the file.
+        conflicting_imports: imports that import_stmt would conflict with;
+            if there are any, we can't fix the file.
+    """
+    old_localnames = list(  # so we can re-use it
+        _localnames_from_fullnames(file_info, {old_fullname}))
+    old_localname_strings = {ln.localname for ln in old_localnames}
+
+    # Figure out what alias to use for the new import.
+    import_alias_for_this_file = _resolve_import_alias(
+        import_alias, name_to_import, old_localnames)
+
+    new_localname, need_new_import = _choose_best_localname(
+        file_info, new_fullname, name_to_import,
+        import_alias_for_this_file)
+
+    references = _find_references(
+        file_info, old_fullname, old_localname_strings,
+        new_fullname, new_localname)
+
+    if not (need_new_import and references.code):
+        return _UseFixes(old_localnames, import_alias_for_this_file,
+                         new_localname, references, None, set(), set())
+
+    conflicting_imports = _check_import_conflicts(
+        file_info, old_fullname,
+        import_alias_for_this_file or name_to_import,
+        bool(import_alias_for_this_file))
+
+    # Decide what the import will say.
+    import_stmt = _new_import_stmt(name_to_import, import_alias_for_this_file)
+
+    # Decide where to add it.  The issue here is that we may be replacing a
+    # "late import" (an import inside a function) in which case we want the
+    # new import to be inside the same function at the same place.  In fact,
+    # we might be late-importing the same module in *several* functions, and
+    # each one has to get replaced properly.
+    explicit_imports = {
+        ln.imp for ln in old_localnames
+        # TODO(benkraft): This is too weak -- we should only call an import
+        # explicit if it is of the symbol's module (see special case (2) in
+        # module docstring).
+        if ln.imp is not None and _dotted_starts_with(old_fullname,
+                                                      ln.imp.name)}
+
+    return _UseFixes(old_localnames, import_alias_for_this_file,
+                     new_localname, references, import_stmt,
+                     explicit_imports, conflicting_imports)
+
+
 # TODO(benkraft): Once slicker can do it relatively easily, move the
 # use-fixing suggestors and helpers to their own file.
 def _fix_uses_suggestor(old_fullname, new_fullname,
@@ -1059,9 +1275,10 @@ def _fix_uses_suggestor(old_fullname, new_fullname,
                "AUTO": if the import we're fixing used `from` or `as`,
                        we do too, otherwise we use name_to_import.
     """
+    old_last_part = old_fullname.rsplit('.', 1)[-1]
+
     def suggestor(filename, body):
         """filename is relative to the value of --root."""
-        old_last_part = old_fullname.rsplit('.', 1)[-1]
         if old_last_part not in body:
             # As an optimization, don't operate on files that definitely don't
             # mention the moved symbol at all.  (For many moves, that's most of
@@ -1081,62 +1298,31 @@ def _fix_uses_suggestor(old_fullname, new_fullname,
             "%s isn't a valid name to import -- not a prefix of %s" % (
                 name_to_import, new_fullname))
 
-        old_localnames = list(  # so we can re-use it
-            _localnames_from_fullnames(file_info, {old_fullname}))
-        old_localname_strings = {ln.localname for ln in old_localnames}
-
-        # Figure out what alias to use for the new import.
-        import_alias_for_this_file = _resolve_import_alias(
-            import_alias, name_to_import, old_localnames)
-
-        new_localname, need_new_import = _choose_best_localname(
-            file_info, new_fullname, name_to_import,
-            import_alias_for_this_file)
+        fixes = _analyze_uses(file_info, old_fullname, new_fullname,
+                              name_to_import, import_alias)
 
         # Now, patch references -- _replace_in_file does all the work.
-        patches, used_localnames = _replace_in_file(
-            file_info, old_fullname, old_localname_strings,
-            new_fullname, new_localname)
+        patches, _ = _replace_in_file(
+            file_info, old_fullname,
+            {ln.localname for ln in fixes.old_localnames},
+            new_fullname, fixes.new_localname,
+            references=fixes.references)
         for patch in patches:
             yield patch
 
         # Finally, add a new import, if necessary.
-        if need_new_import and used_localnames:
-            conflicting_imports = _check_import_conflicts(
-                file_info, old_fullname,
-                import_alias_for_this_file or name_to_import,
-                bool(import_alias_for_this_file))
-            if conflicting_imports:
+        if fixes.import_stmt:
+            if fixes.conflicting_imports:
                 raise khodemod.FatalError(
-                    file_info.filename, conflicting_imports.pop().start,
+                    file_info.filename, fixes.conflicting_imports.pop().start,
                     "Your alias will conflict with imports in this file.")
 
-            # Decide what the import will say.
-            import_stmt = _new_import_stmt(name_to_import,
-                                           import_alias_for_this_file)
-
-            old_imports = {ln.imp for ln in old_localnames
-                           if ln.imp is not None}
-
-            # Decide where to add it.  The issue here is that we may
-            # be replacing a "late import" (an import inside a
-            # function) in which case we want the new import to be
-            # inside the same function at the same place.  In fact, we
-            # might be late-importing the same module in *several*
-            # functions, and each one has to get replaced properly.
-            explicit_imports = {
-                imp for imp in old_imports
-                # TODO(benkraft): This is too weak -- we should only
-                # call an import explicit if it is of the symbol's module
-                # (see special case (2) in module docstring).
-                if _dotted_starts_with(old_fullname, imp.name)}
-
-            if not explicit_imports:
+            if not fixes.explicit_imports:
                 # We need to add a totally new toplevel import, not
                 # corresponding to an existing one.  (So we also don't
                 # need to worry about copying comments or indenting.)
                 yield _add_contextless_import_patch(
-                    file_info, ['%s\n' % import_stmt])
+                    file_info, ['%s\n' % fixes.import_stmt])
             else:
                 # There were existing imports of the old name,
                 # so we try to match those.
@@ -1146,7 +1332,7 @@ def _fix_uses_suggestor(old_fullname, new_fullname,
                 # outside the scope of the late import.  To handle this
                 # case, we'll need to do much more careful tracing of which
                 # imports exist in which scopes.
-                for imp in explicit_imports:
+                for imp in fixes.explicit_imports:
                     # Copy the old import's context, such as opening indent
                     # and trailing newline.
                     # TODO(benkraft): If the context we copy is a comment, and
@@ -1160,22 +1346,27 @@ def _fix_uses_suggestor(old_fullname, new_fullname,
                     # Now we can add the new import and have the same context
                     # as the import we are taking the place of!
                     text_to_add = ''.join(
-                        [pre_context, import_stmt, post_context])
+                        [pre_context, fixes.import_stmt, post_context])
                     yield khodemod.Patch(filename, '', text_to_add,
                                          start, start)
 
+    # Let the frontend do the check above on the raw bytes, so it can skip
+    # reading and decoding most files entirely.  The last part of the name is
+    # the only needle we need: the old path contains it, and so does any
+    # import that makes an alias for it available.
+    suggestor.needles = [old_last_part]
     return suggestor
 
 
-def _remove_imports_suggestor(old_fullname):
+def _remove_imports_suggestor(old_fullnames):
     """The suggestor to remove imports for now-changed references.
 
     Note that this should run after _fix_uses_suggestor.
 
     Arguments:
-        old_fullname: the pre-move fullname (module when moving a module,
+        old_fullnames: the pre-move fullnames (module when moving a module,
             module.symbol when moving a symbol) that we're moving.  (We
-            only remove imports that could have gotten us that symbol.)
+            only remove imports that could have gotten us those symbols.)
     """
     def suggestor(filename, body):
         file_info = util.File(filename, body)
@@ -1183,12 +1374,13 @@ def _remove_imports_suggestor(old_fullname):
         # First, set things up, and do some checks.
         # TODO(benkraft): Don't recompute these; _fix_uses_suggestor has
         # already done so.
-        old_localnames = _localnames_from_fullnames(file_info, {old_fullname})
+        old_localnames = _localnames_from_fullnames(file_info,
+                                                    set(old_fullnames))
         old_imports = {ln.imp for ln in old_localnames if ln.imp is not None}
 
         # Next, remove imports, if any are now unused.
-        unused_imports, implicitly_used_imports = _unused_imports(
-            old_imports, old_fullname, file_info)
+        unused_imports, implicitly_used_imports = _unused_imports_for_all(
+            old_imports, old_fullnames, file_info)
 
         for imp in implicitly_used_imports:
             yield khodemod.WarningInfo(
@@ -1199,8 +1391,142 @@ def _remove_imports_suggestor(old_fullname):
     return suggestor
 
 
-def _fix_moved_region_suggestor(project_root, old_fullname, new_fullname):
-    """Suggestor to fix up all the references to symbols in the moved region.
+class ImpactReport(object):
+    """What a move would do, as predicted by Project.report().
+
+    For each file the move would change, we count how many changes of each
+    of KINDS it would make there; and we note each warning it would give.
+    """
+    KINDS = ('code references', 'string references', 'comment references',
+             'imports added', 'imports removed')
+
+    def __init__(self, old_new_fullname_pairs):
+        self.old_new_fullname_pairs = old_new_fullname_pairs
+        # Map from filename to a Counter of kind -> number of changes.
+        self.counts = collections.defaultdict(collections.Counter)
+        # List of (filename, lineno, message).
+        self.warnings = []
+        # The khodemod.Stats for the work we did to make the report.
+        self.stats = None
+
+    def add(self, filename, counts):
+        self.counts[filename].update(counts)
+
+    def warn(self, filename, lineno, message):
+        self.warnings.append((filename, lineno, message))
+
+    def format(self):
+        """A summary of the report, for the user."""
+        num_symbols = sum(1 for (_, _, is_symbol)
+                          in self.old_new_fullname_pairs if is_symbol)
+        num_modules = len(self.old_new_fullname_pairs) - num_symbols
+        totals = collections.Counter()
+        for counts in self.counts.itervalues():
+            totals.update(counts)
+        lines = ['Moving %s modules and %s symbols would change %s files, '
+                 'and give %s warnings.'
+                 % (num_modules, num_symbols, len(self.counts),
+                    len(self.warnings))]
+        lines.extend('    %-20s %8s' % (kind, totals[kind])
+                     for kind in self.KINDS)
+        if self.counts:
+            lines.append('By file:')
+        for (filename, counts) in sorted(self.counts.iteritems()):
+            lines.append('    %s: %s' % (filename, ', '.join(
+                '%s %s' % (counts[kind], kind)
+                for kind in self.KINDS if counts[kind])))
+        if self.warnings:
+            lines.append('Warnings:')
+        for (filename, lineno, message) in sorted(self.warnings):
+            lines.append('    %s:%s: %s' % (filename, lineno, message))
+        return '\n'.join(lines)
+
+
+def _comments(body):
+    """Return the text of each comment in body."""
+    return [token_string for (token_type, token_string, _, _, _)
+            in tokenize.generate_tokens(iter(body.splitlines(True)).next)
+            if token_type == tokenize.COMMENT]
+
+
+def _impact_suggestor(old_fullname, new_fullname, name_to_import,
+                      import_alias, report):
+    """The suggestor to predict what fixing references to a name would do.
+
+    Arguments are as for _fix_uses_suggestor, plus the ImpactReport to add
+    to.  We do the analysis _fix_uses_suggestor (see _analyze_uses) and then
+    _remove_imports_suggestor would, but instead of building patches, we
+    just count the changes they'd make, and note where they'd warn.  That
+    means we need the AST of each file that mentions the name, but not its
+    tokens, which are much slower; and we never write anything.  (So this
+    suggestor never suggests anything.)  We assume each file that would
+    change changes only because of this name; so if a file mentions several
+    of the names being moved, we may miss an import we'd remove because the
+    file doesn't use it for any of them.
+    """
+    old_last_part = old_fullname.rsplit('.', 1)[-1]
+
+    def suggestor(filename, body):
+        """filename is relative to the value of --root."""
+        if old_last_part not in body:
+            return []
+        file_info = util.File(filename, body)
+        fixes = _analyze_uses(file_info, old_fullname, new_fullname,
+                              name_to_import, import_alias)
+        references = fixes.references
+        renamed_localnames = [localname for localname in references.code
+                              if localname != fixes.new_localname]
+
+        # What _replace_in_file would replace.
+        counts = collections.Counter()
+        counts['code references'] += sum(
+            len(ast_nodes) for localname in renamed_localnames
+            for ast_nodes in references.code[localname].itervalues())
+        counts['string references'] += sum(
+            len(regex.findall(node.s))
+            for (node, regex, _) in references.strings)
+        if references.comment_regexes:
+            counts['comment references'] += sum(
+                len(regex.findall(comment)) for comment in _comments(body)
+                for (regex, _) in references.comment_regexes)
+
+        # What imports _fix_uses_suggestor would add.
+        added_aliases = []
+        if fixes.import_stmt:
+            if fixes.conflicting_imports:
+                # We'd give up on this file.
+                report.warn(filename,
+                            min(imp.node.lineno
+                                for imp in fixes.conflicting_imports),
+                            "Your alias will conflict with imports in this "
+                            "file.")
+                return []
+            counts['imports added'] += len(fixes.explicit_imports) or 1
+            added_aliases.append(fixes.import_alias or name_to_import)
+        if not any(counts.itervalues()):
+            return []
+
+        # What imports _remove_imports_suggestor would then remove.
+        old_imports = {ln.imp for ln in fixes.old_localnames
+                       if ln.imp is not None}
+        unused_imports, implicitly_used_imports = _unused_imports(
+            old_imports, old_fullname, file_info,
+            renames=[(localname, fixes.new_localname)
+                     for localname in renamed_localnames],
+            added_aliases=added_aliases)
+        counts['imports removed'] += len(unused_imports)
+        for imp in implicitly_used_imports:
+            report.warn(filename, imp.node.lineno,
+                        "This import may be used implicitly.")
+        report.add(filename, counts)
+        return []
+
+    suggestor.needles = [old_last_part]
+    return suggestor
+
+
+def _fix_moved_region_suggestor(project_root, old_new_fullname_pairs):
+    """Suggestor to fix up all the references to symbols in the moved regions.
 
     When we move the definition of a symbol, it may reference other things in
     the source and/or destination modules as well as itself.  We need to fix up
@@ -1212,175 +1538,205 @@ def _fix_moved_region_suggestor(project_root, old_fullname, new_fullname):
     the old file.
 
     Note that this should run after move_symbol_suggestor; it operates on the
-    definition in its new location.  It only makes sense for symbols; when
+    definitions in their new locations.  It only makes sense for symbols; when
     moving modules we don't encounter this issue.
 
     Arguments:
         project_root: as elsewhere
-        old_fullname, new_module: the fullname of the symbol we are
-            moving, before and after the move.
+        old_new_fullname_pairs: (old_fullname, new_fullname) pairs for each
+            symbol we moved, before and after the move.  The old_fullnames
+            must all be in the same module.  Run this on each new module; we
+            fix up the symbols that were moved there.
     """
-    old_module, old_symbol = old_fullname.rsplit('.', 1)
-    new_module, new_symbol = new_fullname.rsplit('.', 1)
+    old_module, _ = old_new_fullname_pairs[0][0].rsplit('.', 1)
+    old_filename = util.filename_for_module_name(old_module)
+    new_fullname_for = dict(old_new_fullname_pairs)
 
     def suggestor(filename, body):
         """filename is relative to the value of --root."""
-        # We only need to operate on the new file; that's where the moved
-        # region will be by now.  (But we do look at both old and new.)
+        # We only need to operate on the new files; that's where the moved
+        # regions will be by now.  (But we do look at both old and new.)
         # Caller should ensure this but we check to be safe.
-        if util.module_name_for_filename(filename) != new_module:
+        new_module = util.module_name_for_filename(filename)
+        pairs_to_fix = [
+            (old_fullname, new_fullname)
+            for (old_fullname, new_fullname) in old_new_fullname_pairs
+            if new_fullname.rsplit('.', 1)[0] == new_module]
+        if not pairs_to_fix:
             return
 
         file_info = util.File(filename, body)
-        old_filename = util.filename_for_module_name(old_module)
         old_file_info = util.File(
             old_filename,
             khodemod.read_file(project_root, old_filename) or '')
-
-        # Find the region we moved.
         toplevel_names_in_new_file = util.toplevel_names(file_info)
-        if new_symbol not in toplevel_names_in_new_file:
-            raise khodemod.FatalError(filename, 0,
-                                      "Could not find symbol '%s' in "
-                                      "'%s': maybe it's defined weirdly?"
-                                      % (new_symbol, new_module))
-        node_to_fix = toplevel_names_in_new_file[new_symbol]
-
-        # The moved region is full of localnames that make sense in the context
-        # of old_file, but not new_file (since a localname depends on the
-        # imports of the file, plus on whether it is a reference to something
-        # in the current file).  For instance, if the code reegion had the text
-        # `return oldfile_func() + newfile.newfile_func()` we want to rewrite
-        # that to say `return oldfile.oldfile_func() + newfile_func()`, as well
-        # as adding `import oldfile` to newfile.
-
-        # Here, we make a LocalName object for each such localname, which will
-        # help us rewrite them and add imports later.
-        names_in_moved_code = {name for name, node in _all_names(node_to_fix)}
-        # To construct the LocalNames, we typically need to associate an import
-        # with them.  These imports live in the old file, if they're toplevel,
-        # because that's where this code snippet used to live, or in the moved
-        # region itself, if they're late.
-        old_imports = itertools.chain(
-            _compute_all_imports(old_file_info, toplevel_only=True),
-            _compute_all_imports(file_info, within_node=node_to_fix))
-        # Now construct the localnames.  The only special case is the moved
-        # symbol itself, because it's already been moved to the new file, so
-        # when we look at the old file we won't find it.
-        localnames_in_old_file = list(_localnames_from_localnames(
-            old_file_info, names_in_moved_code, old_imports))
-        localnames_in_old_file.append(
-            LocalName(old_fullname, old_symbol, None))
-        # We construct a dict where, for each localname we've found above, we
-        # map from the new fullname associated with the localname to the
-        # LocalName object (containing the old fullname and its localname in
-        # the old file).  (Note that for every symbol except the moved symbol,
-        # those two fullnames are the same.)  Usually there will be only one
-        # such localname for each fullname, but in case there are multiple (for
-        # reasons described in the docstring of _localnames_from_fullnames), we
-        # actually store a set of such LocalName objects.
-        names_to_fix = {}
-        for localname in localnames_in_old_file:
-            if localname.fullname == old_fullname:
-                # This is the moved symbol; we found it under its old fullname
-                # but we want to track it under its new fullname.
-                names_to_fix.setdefault(new_fullname, set()).add(localname)
-            else:
-                names_to_fix.setdefault(localname.fullname, set()).add(
-                    localname)
-
-        # If name-to-fix A is a prefix of name-to-fix B, then we can remove
-        # B: it will get fixed when A does!  This happens for code like:
-        #   fn(module_to_move.myclass, module_to_move.myclass.classvar)
-        names_to_fix = {
-            name: value for (name, value) in names_to_fix.iteritems()
-            if not any(prefix in names_to_fix
-                       for prefix in _dotted_prefixes(name, proper_only=True))
-        }
-
-        # Now, we fix up each name in turn.  This is the part that follows
-        # _fix_uses_suggestor fairly closely.
+
         imports_to_add = set()
-        for new_fullname_to_fix, old_localnames_to_fix in (
-                names_to_fix.iteritems()):
-            old_localname_strings = {
-                ln.localname for ln in old_localnames_to_fix}
-            # Find the old fullname (which should be the fullname in each item
-            # of old_localnames_to_fix) and choose an import that we got it
-            # from -- we choose the one with the shortest alias to minimize
-            # line-wrapping.
-            old_fullname_to_fix, _, imp = min(
-                old_localnames_to_fix,
-                key=lambda ln: -1 if ln.imp is None else len(ln.imp.alias))
-
-            # Figure out by what name we'll refer to new_fullname_to_fix in the
-            # new file.  _choose_best_localname does most of the work, but we
-            # have to figure out what module we want to tell
-            # _choose_best_localname to import if necessary.
-            if imp and _dotted_starts_with(new_fullname_to_fix, imp.name):
-                # If we got new_fullname_to_fix from an explicit import in the
-                # old file, we'll do whatever that import did.
-                name_to_import = imp.name
-                import_alias = imp.alias
-            elif imp:
-                # If we got new_fullname_to_fix from an implicit import in the
-                # old file, we'll still do whatever that import did.
-                # TODO(benkraft): If we had an implicit import, we should
-                # probably make it explicit rather than just copying.
-                name_to_import = imp.name
-                import_alias = None
-            else:
-                # If there was no corresponding import, we know this was a
-                # symbol in the old file, so we tell _choose_best_localname to
-                # import the module (where it now lives -- which is different
-                # for the moved symbol itself), with no alias.
-                # TODO(benkraft): Allow specifying an alias for the old module
-                # in the new file.
-                name_to_import, _ = new_fullname_to_fix.rsplit('.', 1)
-                import_alias = None
-
-            new_localname, need_new_import = _choose_best_localname(
-                file_info, new_fullname_to_fix, name_to_import,
-                import_alias)
-
-            # Now, patch references.
-            patches, used_localnames = _replace_in_file(
-                file_info, old_fullname_to_fix, old_localname_strings,
-                new_fullname_to_fix, new_localname, node_to_fix)
-            for patch in patches:
+        for (old_fullname, new_fullname) in pairs_to_fix:
+            for patch in _fix_moved_region(
+                    file_info, old_file_info, old_fullname, new_fullname,
+                    new_fullname_for, toplevel_names_in_new_file,
+                    imports_to_add):
                 yield patch
 
-            # We also *add* imports in this suggestor, because otherwise it's
-            # too hard to tell what imports we need to add by the time we get
-            # to _remove_moved_region_imports_suggestor.  Luckily, that doesn't
-            # complicate things much here.
-            if used_localnames and need_new_import:
-                conflicting_imports = _check_import_conflicts(
-                    file_info, old_fullname, import_alias or name_to_import,
-                    bool(import_alias))
-                if conflicting_imports:
-                    raise khodemod.FatalError(
-                        file_info.filename, conflicting_imports.pop().start,
-                        "Your alias will conflict with imports in this file.")
-
-                if imp:
-                    start, end = util.get_area_for_ast_node(
-                        imp.node, old_file_info,
-                        include_previous_comments=False)
-                    import_stmt = old_file_info.body[start:end]
-                else:
-                    import_stmt = '%s\n' % _new_import_stmt(name_to_import,
-                                                            alias=None)
-                imports_to_add.add(import_stmt)
-
         if imports_to_add:
             yield _add_contextless_import_patch(file_info, imports_to_add)
 
     return suggestor
 
 
-def _remove_old_file_imports_suggestor(project_root, old_fullname):
-    """Suggestor to remove unused imports from old-file after moving a region.
+def _fix_moved_region(file_info, old_file_info, old_fullname, new_fullname,
+                      new_fullname_for, toplevel_names_in_new_file,
+                      imports_to_add):
+    """Fix up the references in one moved region.
+
+    This does the work of _fix_moved_region_suggestor for a single symbol.
+    new_fullname_for maps the old fullname of every symbol we moved to its new
+    fullname.  Returns a generator of patches; adds the import statements the
+    region needs to imports_to_add.
+    """
+    new_module, new_symbol = new_fullname.rsplit('.', 1)
+    filename = file_info.filename
+
+    # Find the region we moved.
+    if new_symbol not in toplevel_names_in_new_file:
+        raise khodemod.FatalError(filename, 0,
+                                  "Could not find symbol '%s' in "
+                                  "'%s': maybe it's defined weirdly?"
+                                  % (new_symbol, new_module))
+    node_to_fix = toplevel_names_in_new_file[new_symbol]
+
+    # The moved region is full of localnames that make sense in the context
+    # of old_file, but not new_file (since a localname depends on the
+    # imports of the file, plus on whether it is a reference to something
+    # in the current file).  For instance, if the code reegion had the text
+    # `return oldfile_func() + newfile.newfile_func()` we want to rewrite
+    # that to say `return oldfile.oldfile_func() + newfile_func()`, as well
+    # as adding `import oldfile` to newfile.
+
+    # Here, we make a LocalName object for each such localname, which will
+    # help us rewrite them and add imports later.
+    names_in_moved_code = {name for name, node in _all_names(node_to_fix)}
+    # To construct the LocalNames, we typically need to associate an import
+    # with them.  These imports live in the old file, if they're toplevel,
+    # because that's where this code snippet used to live, or in the moved
+    # region itself, if they're late.
+    old_imports = itertools.chain(
+        _compute_all_imports(old_file_info, toplevel_only=True),
+        _compute_all_imports(file_info, within_node=node_to_fix))
+    # Now construct the localnames.  The only special cases are the moved
+    # symbols themselves, because they've already been moved out of the old
+    # file, so when we look at the old file we won't find them.
+    localnames_in_old_file = list(_localnames_from_localnames(
+        old_file_info, names_in_moved_code, old_imports))
+    localnames_in_old_file.extend(
+        LocalName(moved_fullname, moved_fullname.rsplit('.', 1)[1], None)
+        for moved_fullname in new_fullname_for)
+    # We construct a dict where, for each localname we've found above, we
+    # map from the new fullname associated with the localname to the
+    # LocalName object (containing the old fullname and its localname in
+    # the old file).  (Note that for every symbol except the moved symbols,
+    # those two fullnames are the same.)  Usually there will be only one
+    # such localname for each fullname, but in case there are multiple (for
+    # reasons described in the docstring of _localnames_from_fullnames), we
+    # actually store a set of such LocalName objects.
+    names_to_fix = {}
+    for localname in localnames_in_old_file:
+        if localname.fullname in new_fullname_for:
+            # This is a moved symbol; we found it under its old fullname
+            # but we want to track it under its new fullname.
+            names_to_fix.setdefault(
+                new_fullname_for[localname.fullname], set()).add(localname)
+        else:
+            names_to_fix.setdefault(localname.fullname, set()).add(
+                localname)
+
+    # If name-to-fix A is a prefix of name-to-fix B, then we can remove
+    # B: it will get fixed when A does!  This happens for code like:
+    #   fn(module_to_move.myclass, module_to_move.myclass.classvar)
+    names_to_fix = {
+        name: value for (name, value) in names_to_fix.iteritems()
+        if not any(prefix in names_to_fix
+                   for prefix in _dotted_prefixes(name, proper_only=True))
+    }
+
+    # Now, we fix up each name in turn.  This is the part that follows
+    # _fix_uses_suggestor fairly closely.
+    for new_fullname_to_fix, old_localnames_to_fix in (
+            names_to_fix.iteritems()):
+        old_localname_strings = {
+            ln.localname for ln in old_localnames_to_fix}
+        # Find the old fullname (which should be the fullname in each item
+        # of old_localnames_to_fix) and choose an import that we got it
+        # from -- we choose the one with the shortest alias to minimize
+        # line-wrapping.
+        old_fullname_to_fix, _, imp = min(
+            old_localnames_to_fix,
+            key=lambda ln: -1 if ln.imp is None else len(ln.imp.alias))
+
+        # Figure out by what name we'll refer to new_fullname_to_fix in the
+        # new file.  _choose_best_localname does most of the work, but we
+        # have to figure out what module we want to tell
+        # _choose_best_localname to import if necessary.
+        if imp and _dotted_starts_with(new_fullname_to_fix, imp.name):
+            # If we got new_fullname_to_fix from an explicit import in the
+            # old file, we'll do whatever that import did.
+            name_to_import = imp.name
+            import_alias = imp.alias
+        elif imp:
+            # If we got new_fullname_to_fix from an implicit import in the
+            # old file, we'll still do whatever that import did.
+            # TODO(benkraft): If we had an implicit import, we should
+            # probably make it explicit rather than just copying.
+            name_to_import = imp.name
+            import_alias = None
+        else:
+            # If there was no corresponding import, we know this was a
+            # symbol in the old file, so we tell _choose_best_localname to
+            # import the module (where it now lives -- which is different
+            # for the moved symbol itself), with no alias.
+            # TODO(benkraft): Allow specifying an alias for the old module
+            # in the new file.
+            name_to_import, _ = new_fullname_to_fix.rsplit('.', 1)
+            import_alias = None
+
+        new_localname, need_new_import = _choose_best_localname(
+            file_info, new_fullname_to_fix, name_to_import,
+            import_alias)
+
+        # Now, patch references.
+        patches, used_localnames = _replace_in_file(
+            file_info, old_fullname_to_fix, old_localname_strings,
+            new_fullname_to_fix, new_localname, node_to_fix)
+        for patch in patches:
+            yield patch
+
+        # We also *add* imports in this suggestor, because otherwise it's
+        # too hard to tell what imports we need to add by the time we get
+        # to _remove_moved_region_imports_suggestor.  Luckily, that doesn't
+        # complicate things much here.
+        if used_localnames and need_new_import:
+            conflicting_imports = _check_import_conflicts(
+                file_info, old_fullname, import_alias or name_to_import,
+                bool(import_alias))
+            if conflicting_imports:
+                raise khodemod.FatalError(
+                    file_info.filename, conflicting_imports.pop().start,
+                    "Your alias will conflict with imports in this file.")
+
+            if imp:
+                start, end = util.get_area_for_ast_node(
+                    imp.node, old_file_info,
+                    include_previous_comments=False)
+                import_stmt = old_file_info.body[start:end]
+            else:
+                import_stmt = '%s\n' % _new_import_stmt(name_to_import,
+                                                        alias=None)
+            imports_to_add.add(import_stmt)
+
+
+def _remove_old_file_imports_suggestor(project_root, old_fullnames):
+    """Suggestor to remove unused imports from old-file after moving regions.
 
     When we move the definition of a symbol, it may have been the only user of
     some imports in its file.  We need to remove those now-unused imports.
@@ -1389,11 +1745,12 @@ def _remove_old_file_imports_suggestor(project_root, old_fullname):
 
     Arguments:
         project_root: as elsewhere
-        old_fullname: the pre-move fullname of the symbol we are moving
+        old_fullnames: the pre-move fullnames of the symbols we are moving,
+            which must all be in the same module
     """
     # TODO(benkraft): Instead of having three suggestors for removing imports
     # that do slightly different things, have options for a single suggestor.
-    old_module, old_symbol = old_fullname.rsplit('.', 1)
+    old_module, _ = old_fullnames[0].rsplit('.', 1)
 
     def suggestor(filename, body):
         """filename is relative to the value of --root."""
@@ -1408,9 +1765,9 @@ def _remove_old_file_imports_suggestor(project_root, old_fullname):
         # Sadly, it's difficult to determine which ones might be at all related
         # to the moved code, so we just remove anything that looks unused.
         # TODO(benkraft): Be more precise so we don't touch unrelated things.
-        unused_imports, implicitly_used_imports = _unused_imports(
+        unused_imports, implicitly_used_imports = _unused_imports_for_all(
             _compute_all_imports(file_info, toplevel_only=True),
-            old_fullname, file_info)
+            old_fullnames, file_info)
         for imp in implicitly_used_imports:
             yield khodemod.WarningInfo(
                 filename, imp.start, "This import may be used implicitly.")
@@ -1420,54 +1777,60 @@ def _remove_old_file_imports_suggestor(project_root, old_fullname):
     return suggestor
 
 
-def _remove_moved_region_late_imports_suggestor(project_root, new_fullname):
-    """Suggestor to remove unused imports after moving a region.
+def _remove_moved_region_late_imports_suggestor(project_root, new_fullnames):
+    """Suggestor to remove unused imports after moving regions.
 
     When we move the definition of a symbol, it may have imported its new
     module as a "late-import"; this suggestor removes any such import.
     It runs after _fix_moved_region_suggestor and
-    _remove_old_file_imports_suggestor, and only operates on the new file.
+    _remove_old_file_imports_suggestor, and only operates on the new files.
     TODO(benkraft): We should also remove late imports if the new file also
     imported the same module at the toplevel.
 
     Arguments:
         project_root: as elsewhere
-        new_fullname: the post-move fullname of the symbol we are moving
+        new_fullnames: the post-move fullnames of the symbols we are moving.
+            Run this on each new module; we look at the symbols that were
+            moved there.
     """
-    new_module, new_symbol = new_fullname.rsplit('.', 1)
-
     def suggestor(filename, body):
         """filename is relative to the value of --root."""
-        # We only need to operate on the new file; that's where the moved
-        # region will be by now.  Caller should ensure this but we check to be
-        # safe.
-        if util.module_name_for_filename(filename) != new_module:
+        # We only need to operate on the new files; that's where the moved
+        # regions will be by now.  Caller should ensure this but we check to
+        # be safe.
+        new_module = util.module_name_for_filename(filename)
+        new_symbols = [new_fullname.rsplit('.', 1)[1]
+                       for new_fullname in new_fullnames
+                       if new_fullname.rsplit('.', 1)[0] == new_module]
+        if not new_symbols:
             return
 
         file_info = util.File(filename, body)
-
-        # Find the region we moved.
         toplevel_names_in_new_file = util.toplevel_names(file_info)
-        if new_symbol not in toplevel_names_in_new_file:
-            raise khodemod.FatalError(filename, 0,
-                                      "Could not find symbol '%s' in "
-                                      "'%s': maybe it's defined weirdly?"
-                                      % (new_symbol, new_module))
-        moved_node = toplevel_names_in_new_file[new_symbol]
-
-        # Remove imports in the moved region itself that are no longer used.
-        # This should probably just be imports of new_module, or things that
-        # got us it, so we only look at those.
-        unused_imports, implicitly_used_imports = _unused_imports(
-            {imp for imp in _compute_all_imports(
-                file_info, within_node=moved_node)
-             if _import_provides_module(imp, new_module)},
-            None, file_info, within_node=moved_node)
-        for imp in implicitly_used_imports:
-            yield khodemod.WarningInfo(
-                filename, imp.start, "This import may be used implicitly.")
-        for imp in unused_imports:
-            yield _remove_import_patch(imp, file_info)
+
+        for new_symbol in new_symbols:
+            # Find the region we moved.
+            if new_symbol not in toplevel_names_in_new_file:
+                raise khodemod.FatalError(filename, 0,
+                                          "Could not find symbol '%s' in "
+                                          "'%s': maybe it's defined weirdly?"
+                                          % (new_symbol, new_module))
+            moved_node = toplevel_names_in_new_file[new_symbol]
+
+            # Remove imports in the moved region itself that are no longer
+            # used.  This should probably just be imports of new_module, or
+            # things that got us it, so we only look at those.
+            unused_imports, implicitly_used_imports = _unused_imports(
+                {imp for imp in _compute_all_imports(
+                    file_info, within_node=moved_node)
+                 if _import_provides_module(imp, new_module)},
+                None, file_info, within_node=moved_node)
+            for imp in implicitly_used_imports:
+                yield khodemod.WarningInfo(
+                    filename, imp.start,
+                    "This import may be used implicitly.")
+            for imp in unused_imports:
+                yield _remove_import_patch(imp, file_info)
 
     return suggestor
 
@@ -1560,104 +1923,942 @@ def _import_sort_suggestor(project_root):
     return suggestor
 
 
-def make_fixes(old_fullnames, new_fullname, import_alias=None,
-               project_root='.', automove=True, verbose=False):
-    """Do all the fixing necessary to move old_fullnames to new_fullname.
+def _package_moves(project_root, old_new_fullname_pairs):
+    """Find the packages that are being moved in their entirety.
+
+    inputs.expand_and_normalize turns a package-move into a move of every
+    module in the package; if every module in some package is in fact moving
+    to the corresponding place under some new package (that doesn't exist
+    yet), we can just move the whole directory at once.
 
-    Arguments: parallel to the commandline -- see there for details.
-
-    We proceed as follows.  Each step runs one or more khodemod suggestors to
-    make its changes.
-    1) Figure out what the inputs mean, in terms of what modules/symbols need
-       to go where (inputs.expand_and_normalize).
-    2) For each moved module or symbol:
-       2a) If automove is set, and we're moving a module, simply move it to its
-           new filename (moves.move_module_suggestor).
-       2b) If automove is set, and we're moving a symbol, first move the
-           definition-region (moves.move_symbol_suggestor), then update
-           it and the imports of the source and destination files to match
-           (_fix_moved_region_suggestor and
-           _remove_moved_region_imports_suggestor).
-    3) Fix references in all other files, including updating their imports
-       (_fix_uses_suggestor and _remove_imports_suggestor).
-    4) Clean up: remove the module(s) we moved things out of, if it is now
-       empty (_remove_empty_files_suggestor), and resort imports in any file we
-       touched (_import_sort_suggestor).
+    Returns a list of (old_package, new_package) pairs.  We don't include
+    subpackages of packages we're already moving.
     """
-    def log(msg):
-        if verbose:
-            print msg
+    module_moves = {oldname: newname
+                    for (oldname, newname, is_symbol) in old_new_fullname_pairs
+                    if not is_symbol}
+    retval = []
+    # We go shortest-first so we see packages before their subpackages.
+    for oldname in sorted(module_moves, key=len):
+        newname = module_moves[oldname]
+        if not (oldname.endswith('.__init__')
+                and newname.endswith('.__init__')):
+            continue
+        old_package = oldname[:-len('.__init__')]
+        new_package = newname[:-len('.__init__')]
+        if any(_dotted_starts_with(old_package, p) for (p, _) in retval):
+            continue
+
+        old_dir = os.path.join(project_root, os.path.dirname(
+            util.filename_for_module_name(oldname)))
+        new_dir = os.path.join(project_root, os.path.dirname(
+            util.filename_for_module_name(newname)))
+        if os.path.exists(new_dir):
+            continue
+
+        modules = [util.module_name_for_filename(path)
+                   for path in khodemod.resolve_paths(
+                       khodemod.default_path_filter(), root=old_dir)]
+        if all(module_moves.get('%s.%s' % (old_package, module)) ==
+               '%s.%s' % (new_package, module)
+               for module in modules):
+            retval.append((old_package, new_package))
+    return retval
 
-    # TODO(benkraft): Support other khodemod frontends.
-    frontend = khodemod.AcceptingFrontend(verbose=verbose)
 
-    # Return a list of (old_fullname, new_fullname) pairs that we can rename.
-    old_new_fullname_pairs = inputs.expand_and_normalize(
-        project_root, old_fullnames, new_fullname)
+class _MoveStep(collections.namedtuple(
+        '_MoveStep', ['kind', 'index', 'oldname', 'newname', 'is_symbol'])):
+    """A step of a move: kind is 'move' or 'fix references'.
 
-    for (oldname, newname, is_symbol) in old_new_fullname_pairs:
-        if automove:
-            log("===== Moving %s to %s =====" % (oldname, newname))
-            if is_symbol:
-                old_filename = util.filename_for_module_name(
-                    oldname.rsplit('.', 1)[0])
-                move_suggestor = moves.move_symbol_suggestor(
-                    project_root, oldname, newname)
+    index is that of the (oldname, newname, is_symbol) triple we're moving,
+    among those the move does.
+    """
+    @property
+    def name(self):
+        """The name of the step, as the journal knows it."""
+        return '%s %s' % (self.kind, self.index)
+
+
+def _moved_files(project_root, step):
+    """The files a 'move' step may read and write, as a pair of sets.
+
+    It reads and writes the files of the module we move from and the module
+    we move to.  It also reads the __init__.py files of the packages
+    containing the latter, and writes those that don't exist yet.
+    """
+    if step.is_symbol:
+        old_module = step.oldname.rsplit('.', 1)[0]
+        new_module = step.newname.rsplit('.', 1)[0]
+    else:
+        (old_module, new_module) = (step.oldname, step.newname)
+    new_filename = util.filename_for_module_name(new_module)
+    writes = {util.filename_for_module_name(old_module), new_filename}
+    reads = set(writes)
+    dirname = os.path.dirname(new_filename)
+    while dirname:
+        init_filename = os.path.join(dirname, '__init__.py')
+        reads.add(init_filename)
+        if not khodemod.file_exists(project_root, init_filename):
+            writes.add(init_filename)
+        dirname = os.path.dirname(dirname)
+    return (reads, writes)
+
+
+def _renamed_names(old_new_fullname_pairs):
+    """Return the (old, new) names a move renames, for verification.
+
+    These are the pairs themselves, plus the packages themselves for each
+    package (i.e. pkg.__init__) we moved.
+    """
+    renames = []
+    for (oldname, newname, _) in old_new_fullname_pairs:
+        renames.append((oldname, newname))
+        if oldname.endswith('.__init__') and newname.endswith('.__init__'):
+            renames.append((oldname[:-len('.__init__')],
+                            newname[:-len('.__init__')]))
+    return renames
+
+
+def _stale_reference_checks(old_new_fullname_pairs):
+    """Return the verify.StaleReferenceChecks to do after a move.
+
+    Nothing should refer to the old fullnames any more, nor to the old
+    filenames of the modules we moved.
+    """
+    renames = _renamed_names(old_new_fullname_pairs)
+    new_names = {newname for (_, newname) in renames}
+    checks = []
+    for (oldname, _) in renames:
+        if oldname.endswith('.__init__'):
+            continue    # we check for the package itself instead
+        checks.append(verify.StaleReferenceCheck(
+            oldname, _re_for_name(oldname), oldname.rsplit('.', 1)[-1],
+            [newname for newname in new_names
+             if _dotted_starts_with(newname, oldname)]))
+    for (oldname, _, is_symbol) in old_new_fullname_pairs:
+        if not is_symbol:
+            old_filename = util.filename_for_module_name(oldname)
+            checks.append(verify.StaleReferenceCheck(
+                old_filename, _re_for_path(old_filename),
+                os.path.basename(old_filename), []))
+    return checks
+
+
+def _toplevel_import_graph(file_infos, renames=()):
+    """Return the graph of toplevel imports among some modules.
+
+    file_infos maps each module's name to its util.File.  We return a map
+    from each module to the set of the others it imports at toplevel, as for
+    verify.find_new_cycles.  If renames, a list of (old, new) names, is
+    passed, we first rename everything the files import accordingly: this
+    lets us express the imports of files from before a move in terms of
+    modules' new names.
+    """
+    # Longest first, so we rename pkg.mod before pkg.
+    renames = sorted(renames, key=lambda (oldname, _): len(oldname),
+                     reverse=True)
+    graph = {module: set() for module in file_infos}
+    for (module, file_info) in file_infos.iteritems():
+        for imp in _compute_all_imports(file_info, toplevel_only=True):
+            name = _renamed(imp.name, renames)
+            # The import is of a module, of a package (i.e. its __init__),
+            # or of a symbol in a module.
+            for candidate in (name, name + '.__init__',
+                              name.rsplit('.', 1)[0]):
+                if candidate in graph:
+                    if candidate != module:
+                        graph[module].add(candidate)
+                    break
+    return graph
+
+
+class Project(object):
+    """A project to do one or more moves in.
+
+    make_fixes does a single move, from scratch.  A Project remembers what it
+    learns about the project -- the list of files, their contents and their
+    ASTs -- between moves, so scripts doing many moves should create a
+    Project once and call move() for each.
+
+    The Project keeps its caches up to date as it changes files, and notices
+    if a file's contents change on disk.  But if files are added, removed or
+    renamed some other way (or a .gitignore changes), call invalidate().
+    (The list of files, unlike the other caches, is shared by all Projects
+    in the process for the same root, as it is by calls to make_fixes.)
+    """
+    def __init__(self, root='.', verbose=False, io_threads=0,
+                 path_filter=None, frontend=None, observers=(),
+                 journal_path=None, workers=1, costs_path=None,
+                 memory_budget=None, cache_budget=None):
+        """Arguments: parallel to the commandline -- see there for details --
+        except:
+            path_filter: which files to look for references in.  It defaults
+                to the python files in root that aren't gitignored.
+            frontend: the khodemod frontend to make changes with.  It
+                defaults to a khodemod.AcceptingFrontend, which simply makes
+                them; if passed, verbose, io_threads and observers are
+                ignored.
+            observers: observers for the frontend to tell about what it's
+                doing; see khodemod.Frontend.
+            journal_path: if set, as each move goes, write a journal of
+                what it's done here, so that if it dies, it can be resumed
+                (see journal.py).  The frontend must write its changes to
+                disk.
+            workers: how many steps of a move to run at once, on separate
+                threads; see _move.
+            costs_path: if set, keep track of how long each file takes us
+                here, and use what we learned in earlier runs to do the
+                costliest work first, and to estimate how long the rest
+                will take (see khodemod.FileCosts).
+            memory_budget: if set, try to keep our memory use within about
+                this many bytes, for projects too big to keep in memory:
+                our caches of file contents and parses evict what we used
+                least recently, to stay within the budget, and we don't
+                keep the list of files in the project (see
+                khodemod.low_memory).  This makes us slower.
+            cache_budget: if set, keep our caches of file contents and
+                parses within about this many bytes, evicting what we used
+                least recently, but otherwise work as usual.  It defaults to
+                memory_budget; if neither is set, we cache every file we
+                look at, which is fastest for many moves, but takes memory
+                in proportion to the size of the project.
+        """
+        self.root = root
+        self.journal_path = journal_path
+        self.workers = workers
+        self.memory_budget = memory_budget
+        self._costs = (khodemod.FileCosts(root, costs_path) if costs_path
+                       else None)
+        # The journal of the move in progress, if any.
+        self._journal = None
+        self.frontend = frontend or khodemod.AcceptingFrontend(
+            verbose=verbose, io_threads=io_threads, observers=observers)
+        self._path_filter = path_filter
+        # We share resolve_paths' list of files in root with other Projects;
+        # see invalidate().
+        self.path_filter = (path_filter or
+                            khodemod.default_path_filter(root=root))
+        # Files (relative to root) that any of our moves have changed.
+        self.modified_files = set()
+        # The caches we hand to khodemod and util while we're working.
+        if cache_budget is None:
+            cache_budget = memory_budget
+        if cache_budget is None:
+            self._file_contents = {}
+            self._parses = {}
+        else:
+            # Parses are much bigger than the text they come from, and save
+            # us more work, so they get most of the budget.
+            self._file_contents = khodemod.LRUCache(
+                cache_budget // 4,
+                sizeof=lambda entry: sys.getsizeof(entry[1]))
+            self._parses = khodemod.LRUCache(
+                cache_budget - cache_budget // 4,
+                sizeof=lambda file_info: (sys.getsizeof(file_info.body) *
+                                          _PARSED_FILE_SIZE_FACTOR))
+
+    def _log(self, msg):
+        if self.frontend.verbose:
+            print msg
+
+    def invalidate(self):
+        """Forget the list of files in the project.
+
+        The list is kept across Projects (and calls to make_fixes) for the
+        same root and path filter, so call this if the tree changed since
+        any of them looked at it.
+        """
+        khodemod.forget_resolved_paths(self.root)
+        # Use a new filter: if it's ours, it will re-read the .gitignores.
+        self.path_filter = (self._path_filter or
+                            khodemod.default_path_filter(root=self.root))
+
+    def move(self, old_fullnames, new_fullname, alias=None, automove=True,
+             resume=False, verify=False):
+        """Move old_fullnames to new_fullname, and fix up references.
+
+        old_fullnames may be a single fullname or a list of them.  The
+        arguments are otherwise parallel to the commandline -- see there for
+        details.  If resume is set, we pick up where the journal (see
+        journal_path) says an earlier, unfinished, move with the same
+        arguments left off.  If verify is set, once the move is done we
+        check it (see verify.py), and raise verify.VerificationError if we
+        find problems; the frontend must write its changes to disk.
+        Returns a khodemod.Stats describing the work we did.
+        """
+        if isinstance(old_fullnames, basestring):
+            old_fullnames = [old_fullnames]
+        try:
+            with self._session() as stats:
+                if verify:
+                    with khodemod.remember_original_contents() as originals:
+                        old_new_fullname_pairs = self._move(
+                            old_fullnames, new_fullname, alias, automove,
+                            resume)
+                    with khodemod.stats_phase('verify'):
+                        self._verify(old_new_fullname_pairs, originals)
+                else:
+                    self._move(old_fullnames, new_fullname, alias, automove,
+                               resume)
+        finally:
+            self._close_journal()
+        return stats
+
+    def report(self, old_fullnames, new_fullname, alias=None):
+        """Predict what move() would do, without doing it.
+
+        Arguments are as for move().  We find the files move() would fix
+        references in, and what it would do there, but we don't build the
+        changes, or write anything.  This takes a fraction of the time the
+        move would.  Returns an ImpactReport.
+        """
+        if isinstance(old_fullnames, basestring):
+            old_fullnames = [old_fullnames]
+        with self._session() as stats:
+            old_new_fullname_pairs = inputs.expand_and_normalize(
+                self.root, old_fullnames, new_fullname)
+            report = ImpactReport(old_new_fullname_pairs)
+            impact_suggestors = []
+            for (oldname, newname, is_symbol) in old_new_fullname_pairs:
+                if is_symbol:
+                    name_to_import = newname.rsplit('.', 1)[0]
+                else:
+                    name_to_import = newname
+                impact_suggestors.append(_impact_suggestor(
+                    oldname, newname, name_to_import, alias, report))
+            with khodemod.stats_phase('report'):
+                self.frontend.run_suggestor(
+                    khodemod.combine_suggestors(impact_suggestors),
+                    path_filter=self.path_filter, root=self.root)
+        report.stats = stats
+        return report
+
+    def split_module(self, old_module, new_fullnames, alias=None):
+        """Move several symbols out of old_module, all at once.
+
+        new_fullnames maps the name of each symbol in old_module we want to
+        move to where it should go, which may be a module or module.symbol
+        (as for new_fullname in move()).  This does the same as calling
+        move() for each symbol, but much faster: we find all the symbols with
+        a single parse of old_module, fix up each destination module once,
+        and fix references to all the symbols in a single pass over the
+        project.  Returns a khodemod.Stats, as for move().
+        """
+        with self._session() as stats:
+            self._split_module(old_module, new_fullnames, alias)
+        return stats
+
+    @contextlib.contextmanager
+    def _session(self):
+        """Use our caches, and note which files we modify, while we work.
+
+        Yields the khodemod.Stats for the work we do.  We also keep track of
+        what we're doing, for progress reports (see khodemod.track_status).
+        """
+        try:
+            with khodemod.cache_file_contents(self._file_contents), \
+                    util.cache_parses(self._parses), \
+                    khodemod.collect_stats() as stats, \
+                    khodemod.track_status(), \
+                    khodemod.record_costs(self._costs), \
+                    khodemod.low_memory(self.memory_budget is not None):
+                yield stats
+        finally:
+            self.modified_files.update(
+                filename
+                for (_, filename) in self.frontend.pop_modified_files())
+            if self._costs is not None:
+                self._costs.save()
+
+    def _start_journal(self, move, make_plan, resume):
+        """Start the journal for a move, if we keep one, or resume it.
+
+        move is a dict of the move's arguments, and make_plan a function
+        that returns the plan for it, as for journal.Journal.start.  Returns
+        the plan: when resuming, the one from the journal.
+        """
+        if resume:
+            if not self.journal_path:
+                raise ValueError("Cannot resume a move without a journal")
+            move_journal = journal.Journal(self.journal_path, self.root)
+            self.frontend.add_modified_files(self.root,
+                                             move_journal.resume(move))
+        else:
+            plan = make_plan()
+            if not self.journal_path:
+                return plan
+            move_journal = journal.Journal(self.journal_path, self.root)
+            move_journal.start(move, plan)
+        self._journal = move_journal
+        self.frontend.observers.append(move_journal)
+        return move_journal.plan
+
+    def _close_journal(self):
+        """Stop writing to the journal; if the move didn't finish, keep it.
+        """
+        if self._journal is not None:
+            self.frontend.observers.remove(self._journal)
+            self._journal.close()
+            self._journal = None
+
+    def _step_done(self, step):
+        """True if the move we're resuming already did step."""
+        return self._journal is not None and self._journal.is_done(step)
+
+    def _checkpoint(self, step):
+        """Note in the journal, if we keep one, that we've done step."""
+        if self._journal is not None:
+            self._journal.checkpoint(
+                step, (filename for (root, filename)
+                       in self.frontend.modified_files() if root == self.root))
+
+    def _move(self, old_fullnames, new_fullname, import_alias, automove,
+              resume):
+        """Do the work of move().
+
+        We proceed as follows.  Each step runs one or more khodemod suggestors
+        to make its changes.
+        1) Figure out what the inputs mean, in terms of what modules/symbols
+           need to go where (inputs.expand_and_normalize).
+        2) If automove is set, and we're moving entire packages, move each
+           package's directory in one go (moves.move_package_suggestor).
+        3) For each moved module or symbol:
+           3a) If automove is set, and we're moving a module, simply move it
+               to its new filename (moves.move_module_suggestor), unless we
+               already moved it along with its package.
+           3b) If automove is set, and we're moving a symbol, first move the
+               definition-region (moves.move_symbol_suggestor), then update
+               it and the imports of the source and destination files to match
+               (_fix_moved_region_suggestor and
+               _remove_moved_region_imports_suggestor).
+           3c) Fix references in all other files, including updating their
+               imports (_fix_uses_suggestor and _remove_imports_suggestor).
+        4) Clean up: remove the module(s) we moved things out of, if it is
+           now empty (_remove_empty_files_suggestor), and resort imports in
+           any file we touched (_import_sort_suggestor).
+        If we keep a journal, we note in it each step we complete: the
+        package moves, each move in 3a or 3b, each 3c, and each part of 4.
+        When resuming, we skip the steps the journal says were done.
+
+        If self.workers is more than 1, we run the steps of 3 on that many
+        threads, running each once the steps before it that touch the same
+        files are done (see schedule.py and _step_files), so the results are
+        the same as if we'd run them in order.
+
+        Returns the (old_fullname, new_fullname, is_symbol) triples we moved.
+        """
+        frontend = self.frontend
+        project_root = self.root
+
+        def make_plan():
+            # A list of (old_fullname, new_fullname) pairs that we can
+            # rename.
+            pairs = inputs.expand_and_normalize(
+                project_root, old_fullnames, new_fullname)
+            return {'pairs': pairs,
+                    'package_moves': (_package_moves(project_root, pairs)
+                                      if automove else [])}
+
+        plan = self._start_journal(
+            {'old_fullnames': old_fullnames, 'new_fullname': new_fullname,
+             'alias': import_alias, 'automove': automove},
+            make_plan, resume)
+        old_new_fullname_pairs = [tuple(pair) for pair in plan['pairs']]
+
+        modules_moved_with_package = set()
+        for (old_package, new_package) in plan['package_moves']:
+            if not self._step_done('move packages'):
+                self._log("===== Moving %s to %s =====" % (
+                    old_package, new_package))
+                khodemod.set_status_task('%s -> %s' % (old_package,
+                                                       new_package))
+                old_init_filename = util.filename_for_module_name(
+                    old_package + '.__init__')
+                new_init_filename = util.filename_for_module_name(
+                    new_package + '.__init__')
+                # If the move we're resuming died after renaming the
+                # package, we mustn't rename it again.
+                already_renamed = (
+                    self._journal is not None and
+                    self._journal.renamed(
+                        os.path.join(os.path.dirname(old_init_filename), ''),
+                        os.path.join(os.path.dirname(new_init_filename), '')))
+                move_package_suggestor = moves.move_package_suggestor(
+                    project_root, old_package, new_package,
+                    already_renamed=already_renamed)
+                with khodemod.stats_phase('move'):
+                    frontend.run_suggestor_on_files(
+                        move_package_suggestor,
+                        [new_init_filename if already_renamed
+                         else old_init_filename],
+                        root=project_root)
+            modules_moved_with_package.update(
+                oldname
+                for (oldname, _, is_symbol) in old_new_fullname_pairs
+                if not is_symbol and
+                _dotted_starts_with(oldname, old_package))
+        if not self._step_done('move packages'):
+            self._checkpoint('move packages')
+
+        steps = []
+        for (i, (oldname, newname, is_symbol)) in enumerate(
+                old_new_fullname_pairs):
+            if automove and oldname not in modules_moved_with_package:
+                steps.append(_MoveStep('move', i, oldname, newname,
+                                       is_symbol))
+            steps.append(_MoveStep('fix references', i, oldname, newname,
+                                   is_symbol))
+        if self.workers > 1:
+            step_files = self._step_files(steps, import_alias)
+        else:
+            step_files = [(None, None)] * len(steps)
+        schedule.run_tasks(
+            [self._step_task(step, len(old_new_fullname_pairs), import_alias,
+                             reads, writes)
+             for (step, (reads, writes)) in zip(steps, step_files)],
+            self.workers)
+
+        self._clean_up()
+        if self._journal is not None:
+            self._journal.finish()
+        return old_new_fullname_pairs
+
+    def _step_task(self, step, num_pairs, import_alias, reads, writes):
+        """Return a schedule.Task to do the given _MoveStep of _move().
+
+        reads and writes are the files it may read and write, as from
+        _step_files, or None if we don't know.
+        """
+        def do_step():
+            khodemod.set_status_task('(%s/%s) %s -> %s' % (
+                step.index + 1, num_pairs, step.oldname, step.newname))
+            if self._step_done(step.name):
+                return
+            if step.kind == 'move':
+                self._log("===== Moving %s to %s ====="
+                          % (step.oldname, step.newname))
+                if step.is_symbol:
+                    with khodemod.stats_phase('move'):
+                        self._move_symbols([(step.oldname, step.newname)])
+                else:
+                    old_filename = util.filename_for_module_name(
+                        step.oldname)
+                    new_filename = util.filename_for_module_name(
+                        step.newname)
+                    # If the move we're resuming died after renaming the
+                    # module, we mustn't rename it again.
+                    already_renamed = (
+                        self._journal is not None and
+                        self._journal.renamed(old_filename, new_filename))
+                    move_suggestor = moves.move_module_suggestor(
+                        self.root, step.oldname, step.newname,
+                        already_renamed=already_renamed)
+                    with khodemod.stats_phase('move'):
+                        self.frontend.run_suggestor_on_files(
+                            move_suggestor,
+                            [new_filename if already_renamed
+                             else old_filename],
+                            root=self.root)
             else:
-                old_filename = util.filename_for_module_name(oldname)
-                move_suggestor = moves.move_module_suggestor(
-                    project_root, oldname, newname)
-            frontend.run_suggestor_on_files(move_suggestor, [old_filename],
-                                            root=project_root)
+                self._log("===== Updating references of %s to %s ====="
+                          % (step.oldname, step.newname))
+                with khodemod.stats_phase('fix references'):
+                    self._fix_uses(
+                        [(step.oldname, step.newname, step.is_symbol)],
+                        import_alias, reads)
+            self._checkpoint(step.name)
+
+        if reads is None or self._costs is None:
+            cost = 0
+        else:
+            cost = sum(self._costs.cost(self.root, filename)
+                       for filename in reads)
+        return schedule.Task(step.name, do_step, reads=reads, writes=writes,
+                             cost=cost)
+
+    def _step_files(self, steps, import_alias):
+        """Return the files each of the _MoveSteps may read and write.
+
+        We return a list of (reads, writes) pairs of sets, one per step.  A
+        'move' step touches just the files it moves between (see
+        _moved_files).  A 'fix references' step fixes references in the
+        files that mention the last part of the old name (as
+        _fix_uses_suggestor does), and then removes imports in the files
+        we've modified that mention its first part (since only those can
+        import something that got them the old name).  We find the files
+        that mention each with a single look at each file in the project.
+        But earlier steps may add mentions: a moved module or symbol brings
+        its code along (and moving a symbol may add an import of its old
+        module), and fixing references to one name adds imports of its new
+        name.  So we also include the files of any earlier step that might,
+        and the files an earlier step might modify that mention the first
+        part.
+        """
+        first_parts = [step.oldname.split('.', 1)[0] for step in steps]
+        last_parts = [step.oldname.rsplit('.', 1)[-1] for step in steps]
+        needles = sorted(set(first_parts) | set(last_parts))
+        # Map from needle to the files that mention it.
+        mentions = collections.defaultdict(set)
+        for filename in khodemod.resolve_paths(self.path_filter, self.root):
+            for needle in khodemod.needles_in_file(self.root, filename,
+                                                   needles):
+                mentions[needle].add(filename)
+        # Files modified before now: by package moves, or by the move we're
+        # resuming.
+        modified_files = {filename for (root, filename)
+                          in self.frontend.modified_files()
+                          if root == self.root}
+
+        step_files = []
+        for (i, step) in enumerate(steps):
+            if step.kind == 'move':
+                step_files.append(_moved_files(self.root, step))
+                continue
+            (first, last) = (first_parts[i], last_parts[i])
+            mentioning = mentions[first] | mentions[last]
+            files = mentions[last] | (modified_files & mentions[first])
+            for (earlier, (_, earlier_writes)) in zip(steps, step_files):
+                added_names = [earlier.newname, import_alias or '']
+                if earlier.kind == 'move':
+                    added_names.append(earlier.oldname)
+                if (any(needle in name for needle in (first, last)
+                        for name in added_names) or
+                        (earlier.kind == 'move' and
+                         not earlier_writes.isdisjoint(mentioning))):
+                    files |= earlier_writes
+                else:
+                    files |= earlier_writes & mentions[first]
+            step_files.append((files, files))
+        return step_files
+
+    def _verify(self, old_new_fullname_pairs, originals):
+        """Check that the move we just did went right; see verify.py.
+
+        originals is as from khodemod.remember_original_contents, for the
+        move.  We raise verify.VerificationError if we find problems.
+        """
+        self._log("===== Verifying the move =====")
+        touched_files = sorted(
+            filename for (root, filename) in self.frontend.modified_files()
+            if root == self.root and
+            os.path.exists(os.path.join(self.root, filename)))
+        old_file_infos = {}
+        new_file_infos = {}
+        for filename in touched_files:
+            if not filename.endswith('.py'):
+                continue
+            module = util.module_name_for_filename(filename)
+            body = khodemod.read_file(self.root, filename)
+            abspath = os.path.abspath(os.path.join(self.root, filename))
+            # If we never wrote the file (we only renamed it), it's as it
+            # was; if it's new, it didn't import anything.
+            old_body = originals.get(abspath, body) or ''
+            new_file_info = util.File(filename, body)
+            old_file_info = util.File(filename, old_body)
+            try:
+                new_file_info.tree, old_file_info.tree
+            except khodemod.FatalError:
+                continue    # verify will say it doesn't compile
+            new_file_infos[module] = new_file_info
+            old_file_infos[module] = old_file_info
+        old_graph = _toplevel_import_graph(
+            old_file_infos, _renamed_names(old_new_fullname_pairs))
+        new_graph = _toplevel_import_graph(new_file_infos)
+
+        result = verify.verify(
+            self.root, touched_files,
+            khodemod.resolve_paths(self.path_filter, self.root),
+            _stale_reference_checks(old_new_fullname_pairs),
+            old_graph, new_graph, costs=self._costs)
+        if result.problems:
+            raise verify.VerificationError(result)
+        self._log(result.format())
+
+    def _split_module(self, old_module, new_fullnames, import_alias):
+        """Do the work of split_module().
+
+        This follows the same steps as _move(), but we do steps 3b and 3c
+        once for all the symbols.
+        """
+        old_new_fullname_pairs = []
+        for (symbol, new_fullname) in sorted(dict(new_fullnames).iteritems()):
+            old_fullname = '%s.%s' % (old_module, symbol)
+            for (oldname, newname, is_symbol) in inputs.expand_and_normalize(
+                    self.root, [old_fullname], new_fullname):
+                if not is_symbol:
+                    raise ValueError("%s is not a symbol in %s"
+                                     % (symbol, old_module))
+                old_new_fullname_pairs.append((oldname, newname))
+        if len({newname for (_, newname) in old_new_fullname_pairs}) < len(
+                old_new_fullname_pairs):
+            raise ValueError("Cannot move two symbols to the same place")
+
+        self._log("===== Moving %s out of %s =====" % (
+            ', '.join(symbol for symbol in sorted(dict(new_fullnames))),
+            old_module))
+        khodemod.set_status_task('splitting %s' % old_module)
+        with khodemod.stats_phase('move'):
+            self._move_symbols(old_new_fullname_pairs)
+
+        self._log("===== Updating references =====")
+        with khodemod.stats_phase('fix references'):
+            self._fix_uses([(oldname, newname, True)
+                            for (oldname, newname) in old_new_fullname_pairs],
+                           import_alias)
+
+        self._clean_up()
+
+    def _move_symbols(self, old_new_fullname_pairs):
+        """Move the definitions of symbols that are all in the same module.
+
+        This is step 3b of _move(): first move the definition-regions
+        (moves.move_symbols_suggestor), then update them and the imports of
+        the source and destination files to match (_fix_moved_region_suggestor
+        and _remove_moved_region_imports_suggestor).  Each of those runs on
+        each file once, no matter how many symbols we are moving.
+        """
+        old_module = old_new_fullname_pairs[0][0].rsplit('.', 1)[0]
+        old_filename = util.filename_for_module_name(old_module)
+        new_filenames = sorted({
+            util.filename_for_module_name(newname.rsplit('.', 1)[0])
+            for (_, newname) in old_new_fullname_pairs})
+        old_fullnames = [oldname for (oldname, _) in old_new_fullname_pairs]
+        new_fullnames = [newname for (_, newname) in old_new_fullname_pairs]
+
+        move_suggestor = moves.move_symbols_suggestor(
+            self.root, old_new_fullname_pairs)
+        self.frontend.run_suggestor_on_files(
+            move_suggestor, [old_filename], root=self.root)
+
+        fix_moved_region_suggestor = _fix_moved_region_suggestor(
+            self.root, old_new_fullname_pairs)
+        self.frontend.run_suggestor_on_files(
+            fix_moved_region_suggestor, new_filenames, root=self.root)
+
+        remove_old_file_imports_suggestor = (
+            _remove_old_file_imports_suggestor(self.root, old_fullnames))
+        self.frontend.run_suggestor_on_files(
+            remove_old_file_imports_suggestor, [old_filename],
+            root=self.root)
+
+        remove_moved_region_late_imports_suggestor = (
+            _remove_moved_region_late_imports_suggestor(
+                self.root, new_fullnames))
+        self.frontend.run_suggestor_on_files(
+            remove_moved_region_late_imports_suggestor, new_filenames,
+            root=self.root)
+
+    def _fix_uses(self, old_new_fullname_triples, import_alias, files=None):
+        """Fix references to the things we moved, in all files.
+
+        This is step 3c of _move() (_fix_uses_suggestor and
+        _remove_imports_suggestor).  old_new_fullname_triples are as returned
+        by inputs.expand_and_normalize; we fix up references to all of them
+        in a single pass over the project.  If files is set, we only look at
+        the files in it; see _step_files.
+        """
+        fix_uses_suggestors = []
+        for (oldname, newname, is_symbol) in old_new_fullname_triples:
             if is_symbol:
-                new_filename = util.filename_for_module_name(
-                    newname.rsplit('.', 1)[0])
-                fix_moved_region_suggestor = _fix_moved_region_suggestor(
-                    project_root, oldname, newname)
-                frontend.run_suggestor_on_files(
-                    fix_moved_region_suggestor, [new_filename],
-                    root=project_root)
-
-                remove_old_file_imports_suggestor = (
-                    _remove_old_file_imports_suggestor(project_root, oldname))
-                frontend.run_suggestor_on_files(
-                    remove_old_file_imports_suggestor, [old_filename],
-                    root=project_root)
-
-                remove_moved_region_late_imports_suggestor = (
-                    _remove_moved_region_late_imports_suggestor(
-                        project_root, newname))
-                frontend.run_suggestor_on_files(
-                    remove_moved_region_late_imports_suggestor, [new_filename],
-                    root=project_root)
-
-        log("===== Updating references of %s to %s =====" % (oldname, newname))
-        if is_symbol:
-            name_to_import = newname.rsplit('.', 1)[0]
+                name_to_import = newname.rsplit('.', 1)[0]
+            else:
+                name_to_import = newname
+            fix_uses_suggestors.append(_fix_uses_suggestor(
+                oldname, newname, name_to_import, import_alias))
+        fix_uses_suggestor = khodemod.combine_suggestors(fix_uses_suggestors)
+        if files is None:
+            self.frontend.run_suggestor(
+                fix_uses_suggestor, path_filter=self.path_filter,
+                root=self.root)
         else:
-            name_to_import = newname
+            self.frontend.run_suggestor_on_files(
+                fix_uses_suggestor,
+                [filename for filename
+                 in khodemod.resolve_paths(self.path_filter, self.root)
+                 if filename in files],
+                root=self.root)
+
+        remove_imports_suggestor = _remove_imports_suggestor(
+            [oldname for (oldname, _, _) in old_new_fullname_triples])
+        self.frontend.run_suggestor_on_modified_files(
+            remove_imports_suggestor, only=files)
+
+    def _clean_up(self):
+        """Clean up after a move: step 4 of _move()."""
+        if not self._step_done('clean up'):
+            self._log("===== Cleaning up empty files & whitespace =====")
+            with khodemod.stats_phase('clean up'):
+                self.frontend.run_suggestor_on_modified_files(
+                    _remove_empty_files_suggestor)
+                self.frontend.run_suggestor_on_modified_files(
+                    _remove_leading_whitespace_suggestor)
+            self._checkpoint('clean up')
+
+        self._log("===== Resorting imports =====")
+        import_sort_suggestor = _import_sort_suggestor(self.root)
+        with khodemod.stats_phase('sort imports'):
+            self.frontend.run_suggestor_on_modified_files(
+                import_sort_suggestor)
+
+        self._log("===== Move complete! =====")
 
-        fix_uses_suggestor = _fix_uses_suggestor(
-            oldname, newname, name_to_import, import_alias)
-        frontend.run_suggestor(fix_uses_suggestor, root=project_root)
 
-        remove_imports_suggestor = _remove_imports_suggestor(oldname)
-        frontend.run_suggestor_on_modified_files(remove_imports_suggestor)
+def make_fixes(old_fullnames, new_fullname, import_alias=None,
+               project_root='.', automove=True, verbose=False, io_threads=0,
+               path_filter=None, observers=(), journal_path=None,
+               resume=False, verify=False, workers=1, costs_path=None,
+               memory_budget=None):
+    """Do all the fixing necessary to move old_fullnames to new_fullname.
 
-    log("===== Cleaning up empty files & whitespace =====")
-    frontend.run_suggestor_on_modified_files(_remove_empty_files_suggestor)
-    frontend.run_suggestor_on_modified_files(
-        _remove_leading_whitespace_suggestor)
+    Arguments: parallel to the commandline, and to Project -- see there for
+    details.  This is just a single move in a new Project, whose caches only
+    hold _ONE_MOVE_CACHE_BUDGET bytes (or memory_budget), and which keeps a
+    journal at journal_path (default: journal.JOURNAL_NAME in project_root)
+    until the move completes, so that if it dies, it can be resumed with
+    resume=True, and keeps track of how long each file takes at costs_path,
+    if it's set.  If verify is set, we then check the move went right, and
+    raise verify.VerificationError if it didn't.  Returns a khodemod.Stats
+    describing the work we did.
+    """
+    return Project(project_root, verbose=verbose, io_threads=io_threads,
+                   path_filter=path_filter, observers=observers,
+                   journal_path=(journal_path or
+                                 journal.default_path(project_root)),
+                   workers=workers,
+                   costs_path=costs_path,
+                   memory_budget=memory_budget,
+                   cache_budget=memory_budget or _ONE_MOVE_CACHE_BUDGET).move(
+        old_fullnames, new_fullname, alias=import_alias, automove=automove,
+        resume=resume, verify=verify)
+
+
+def split_module_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='slicker.py split-module',
+        description=('Move several symbols out of a module at once.  This '
+                     'does the same as running slicker.py once per symbol, '
+                     'but only makes one pass over the project.'))
+    parser.add_argument('old_module',
+                        help='fullname of the module to move symbols out of')
+    parser.add_argument('moves', metavar='symbol=new_fullname', nargs='+',
+                        help=('a symbol in old_module, and where to move it: '
+                              'a module, or a module and a new name for the '
+                              'symbol (e.g. foo=newmod or foo=newmod.bar)'))
+    parser.add_argument('-a', '--alias', default='AUTO',
+                        help='As for slicker.py.  Default is %(default)s')
+    parser.add_argument('-f', '--use-from', action='store_true',
+                        help='Convenience flag for `-a FROM`')
+    parser.add_argument('--root', default='.',
+                        help=('The project-root of the directory-tree you '
+                              'want to do the renaming in.'))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Print some information about what we're doing.")
+    parser.add_argument('--io-threads', type=int, default=0,
+                        help='As for slicker.py.')
+    parser.add_argument('--stats', action='store_true',
+                        help='As for slicker.py.')
+    parsed_args = parser.parse_args(argv)
+
+    new_fullnames = {}
+    for move in parsed_args.moves:
+        symbol, sep, new_fullname = move.partition('=')
+        if not sep or not symbol or not new_fullname:
+            parser.error('Expected symbol=new_fullname, not %s' % move)
+        if symbol in new_fullnames:
+            parser.error('Cannot move %s twice' % symbol)
+        new_fullnames[symbol] = new_fullname
 
-    log("===== Resorting imports =====")
-    import_sort_suggestor = _import_sort_suggestor(project_root)
-    frontend.run_suggestor_on_modified_files(import_sort_suggestor)
+    if parsed_args.use_from:
+        alias = 'FROM'
+    else:
+        alias = parsed_args.alias or 'NONE'    # empty string is same as NONE
 
-    log("===== Move complete! =====")
+    stats = Project(parsed_args.root, verbose=parsed_args.verbose,
+                    io_threads=parsed_args.io_threads).split_module(
+        parsed_args.old_module, new_fullnames, alias=alias)
+    if parsed_args.stats:
+        print stats.format()
+
+
+def apply_patches_main(argv):
+    parser = argparse.ArgumentParser(
+        prog='slicker.py apply-patches',
+        description=('Apply the changes written by one or more runs of '
+                     '`slicker.py --patch-output` -- typically, each shard '
+                     'of a move run with --shard.'))
+    parser.add_argument('patch_files', metavar='patch_file', nargs='+',
+                        help='a file written by --patch-output')
+    parser.add_argument('--root', default='.',
+                        help=('The project-root the patches were made in.  '
+                              'Files must not have changed since.'))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Print some information about what we're doing.")
+    parsed_args = parser.parse_args(argv)
+
+    records = []
+    for patch_file in parsed_args.patch_files:
+        with open(patch_file) as f:
+            records.extend(khodemod.read_records(f))
+    try:
+        khodemod.apply_patch_records(
+            khodemod.AcceptingFrontend(verbose=parsed_args.verbose), records,
+            root=parsed_args.root)
+    except khodemod.FatalError as e:
+        sys.exit(unicode(e).encode('utf-8'))
+
+
+def _shard(value):
+    """Parse a --shard argument, i/N, into a (0-indexed) pair (i - 1, N)."""
+    try:
+        (index, count) = [int(part) for part in value.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected i/N, not %s' % value)
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError('shard %s is not in 1..%s'
+                                         % (index, count))
+    return (index - 1, count)
+
+
+def _run_profiled(fn, profile_output, slowest_files=None):
+    """Call fn(), profiling it with cProfile, and return what it returns.
+
+    We write the profile to profile_output.  If slowest_files is set, we
+    instead profile each file separately, and write profiles of the slowest
+    few to profile_output.1, profile_output.2, etc.
+    """
+    if slowest_files:
+        with khodemod.profile_slowest_files(slowest_files) as profiler:
+            retval = fn()
+        for (path, elapsed, filename) in profiler.dump(profile_output):
+            print ("Profile of %s (%.2fs) written to %s"
+                   % (filename, elapsed, path))
+    else:
+        profiler = cProfile.Profile()
+        retval = profiler.runcall(fn)
+        profiler.dump_stats(profile_output)
+    return retval
 
 
 def main():
-    parser = argparse.ArgumentParser()
+    import server     # not at the top, since server imports us.
+
+    if sys.argv[1:2] == ['serve']:
+        server.main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['split-module']:
+        split_module_main(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ['apply-patches']:
+        apply_patches_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        epilog=('Run `%(prog)s serve --help` for how to keep a server '
+                'running, to make repeated moves faster, and `%(prog)s '
+                'split-module --help` for how to move many symbols out of a '
+                'module at once.  To spread a big move over several '
+                'machines, run it with --shard and --patch-output, then '
+                'combine the results with `%(prog)s apply-patches`.'))
     parser.add_argument('old_fullnames', metavar='old_fullname', nargs='+',
                         help=('fullname to move: can be path.to.package, '
                               'path.to.package.module, '
@@ -1694,7 +2895,137 @@ def main():
                               'and new_fullname are taken relative to root.'))
     parser.add_argument('-v', '--verbose', action='store_true',
                         help="Print some information about what we're doing.")
+    parser.add_argument('--io-threads', type=int, default=0,
+                        help=('Read files on this many background threads, '
+                              'and write them on another, so disk I/O '
+                              'overlaps with processing.  Most useful on '
+                              'slow (e.g. network) filesystems.  Default is '
+                              'to do all I/O on the main thread.'))
+    parser.add_argument('--workers', type=int, default=1,
+                        help=('When moving several things, do the steps of '
+                              'the move -- moving each, and fixing '
+                              'references to it -- on this many threads, '
+                              'running steps that touch different files at '
+                              'the same time.  The result is the same as '
+                              'with one worker.  Default is %(default)s.'))
+    parser.add_argument('--no-server', dest='use_server',
+                        action='store_false', default=True,
+                        help=('Do the move in this process, even if a '
+                              '`%(prog)s serve` is running for ROOT.'))
+    parser.add_argument('--progress', action='store_true',
+                        help=('Every second, print what we are doing: the '
+                              'phase, what we are moving where, which pass '
+                              'over the files we are on, how far through it '
+                              'we are (and an ETA for the pass), and the '
+                              'current file.  This always does the move '
+                              'in this process.  (Regardless of this flag, '
+                              'send SIGUSR1 to print that along with the '
+                              'stack of each thread.)'))
+    parser.add_argument('--stats', action='store_true',
+                        help=('When done, print how many files we looked '
+                              'at, read, parsed and wrote, and so on, for '
+                              'each phase of the move.'))
+    parser.add_argument('--profile', metavar='FILE',
+                        help=('Profile the move with cProfile, and write the '
+                              'stats to FILE, for use with pstats.  This '
+                              'always does the move in this process.'))
+    parser.add_argument('--profile-slowest', metavar='N', type=int,
+                        help=('With --profile, instead profile each file '
+                              'separately, and write profiles of the N '
+                              'slowest to FILE.1 through FILE.N.'))
+    parser.add_argument('--trace', metavar='FILE',
+                        help=('Write a trace of what we do -- each file '
+                              'read, suggestor run, and file written, with '
+                              'timings and sizes -- to FILE, as JSON lines.  '
+                              'This always does the move in this process.'))
+    parser.add_argument('--patch-output', metavar='FILE',
+                        help=('Rather than making the changes, write them '
+                              'to FILE, to apply later with `%(prog)s '
+                              'apply-patches`.'))
+    parser.add_argument('--shard', metavar='i/N', type=_shard,
+                        help=('Only look for references to fix in the i-th '
+                              'of N (roughly equal, and always the same) '
+                              'parts of the project.  Requires '
+                              '--patch-output; pass the outputs for all N '
+                              'shards to `%(prog)s apply-patches`.'))
+    parser.add_argument('--journal', metavar='FILE',
+                        help=('As the move goes, keep a journal of what it '
+                              'has done in FILE, deleting it when the move '
+                              'completes.  Default is %s in ROOT.'
+                              % journal.JOURNAL_NAME))
+    parser.add_argument('--costs', metavar='FILE',
+                        help=('Keep track of how long each file takes us '
+                              'in FILE, and use what earlier runs learned '
+                              'there to do the slowest work first, and to '
+                              'estimate how long the rest will take.  '
+                              'Pass the same FILE each time.  This always '
+                              'does the move in this process.'))
+    parser.add_argument('--memory-budget', metavar='MB', type=int,
+                        help=('Try to use no more than about this many '
+                              'megabytes of memory, for projects too big '
+                              'to keep in memory; this makes the move '
+                              'slower.  When done, print how much we '
+                              'used.  This always does the move in this '
+                              'process.'))
+    parser.add_argument('--resume', action='store_true',
+                        help=('If an earlier run of the same move died '
+                              'partway through, pick up where it left off, '
+                              'according to its journal, rather than '
+                              'starting over.  We first check that the '
+                              'files it changed are as it left them.  This '
+                              'always does the move in this process.'))
+    parser.add_argument('--verify', action='store_true',
+                        help=('Once the move is done, check that every '
+                              'file it touched compiles, that nothing in '
+                              'the project still refers to the old names or '
+                              'paths, and that it added no import cycles '
+                              'among the modules it touched; print a '
+                              'summary, and exit with an error if we find '
+                              'problems.  This always does the move in this '
+                              'process.'))
+    parser.add_argument('--report', action='store_true',
+                        help=('Rather than doing the move, print what it '
+                              'would do: how many references and imports '
+                              'it would change, of each kind, in each file, '
+                              'and where it would warn.  This is much '
+                              'faster than doing the move.'))
     parsed_args = parser.parse_args()
+    if parsed_args.shard and not parsed_args.patch_output:
+        parser.error('--shard requires --patch-output')
+    if parsed_args.resume and parsed_args.patch_output:
+        parser.error('--patch-output does not support --resume')
+    if parsed_args.verify and parsed_args.patch_output:
+        parser.error('--patch-output does not support --verify')
+    if parsed_args.report and (parsed_args.patch_output or
+                               parsed_args.resume or parsed_args.verify):
+        parser.error('--report makes no changes, so does not support '
+                     '--patch-output, --resume or --verify')
+    if parsed_args.profile_slowest and not parsed_args.profile:
+        parser.error('--profile-slowest requires --profile')
+
+    observers = []
+    trace_file = None
+    if parsed_args.trace:
+        trace_file = open(parsed_args.trace, 'w')
+        observers.append(khodemod.JSONTraceObserver(trace_file))
+
+    def run(fn):
+        khodemod.dump_status_on_signal()
+        try:
+            if parsed_args.progress:
+                with khodemod.report_progress():
+                    return run_profiled(fn)
+            return run_profiled(fn)
+        finally:
+            # We run just one thing, so the trace is done, even if it raised.
+            if trace_file is not None:
+                trace_file.close()
+
+    def run_profiled(fn):
+        if parsed_args.profile:
+            return _run_profiled(fn, parsed_args.profile,
+                                 parsed_args.profile_slowest)
+        return fn()
 
     if parsed_args.old_fullnames == ['-']:
         old_fullnames = sys.stdin.read().splitlines()
@@ -1706,12 +3037,73 @@ def main():
     else:
         alias = parsed_args.alias or 'NONE'    # empty string is same as NONE
 
-    make_fixes(
-        old_fullnames, parsed_args.new_fullname,
-        import_alias=alias,
-        project_root=parsed_args.root,
-        automove=parsed_args.automove,
-        verbose=parsed_args.verbose)
+    kwargs = dict(import_alias=alias,
+                  automove=parsed_args.automove,
+                  verbose=parsed_args.verbose,
+                  io_threads=parsed_args.io_threads,
+                  workers=parsed_args.workers)
+
+    if parsed_args.report:
+        report = run(lambda: Project(
+            parsed_args.root, verbose=parsed_args.verbose,
+            io_threads=parsed_args.io_threads, observers=observers).report(
+                old_fullnames, parsed_args.new_fullname, alias=alias))
+        print report.format()
+        if parsed_args.stats:
+            print report.stats.format()
+        return
+
+    if parsed_args.patch_output:
+        (shard_index, num_shards) = parsed_args.shard or (0, 1)
+        frontend = khodemod.PatchRecordingFrontend(
+            shard_index, num_shards, verbose=parsed_args.verbose,
+            io_threads=parsed_args.io_threads, observers=observers)
+        try:
+            stats = run(lambda: Project(
+                parsed_args.root, frontend=frontend).move(
+                    old_fullnames, parsed_args.new_fullname, alias=alias,
+                    automove=parsed_args.automove))
+            with open(parsed_args.patch_output, 'w') as f:
+                frontend.write_records(f)
+        finally:
+            frontend.close()
+        if parsed_args.stats:
+            print stats.format()
+        return
+
+    if (parsed_args.use_server and not parsed_args.profile
+            and not parsed_args.progress and not parsed_args.trace
+            and not parsed_args.resume and not parsed_args.journal
+            and not parsed_args.costs and not parsed_args.verify
+            and not parsed_args.memory_budget):
+        result = server.send_move(parsed_args.root, old_fullnames,
+                                  parsed_args.new_fullname,
+                                  stats=parsed_args.stats, **kwargs)
+        if result is not None:
+            (output, error) = result
+            sys.stdout.write(output.encode('utf-8'))
+            if error:
+                sys.exit(error.encode('utf-8'))
+            return
+
+    try:
+        stats = run(lambda: make_fixes(
+            old_fullnames, parsed_args.new_fullname,
+            project_root=parsed_args.root, observers=observers,
+            journal_path=parsed_args.journal, resume=parsed_args.resume,
+            verify=parsed_args.verify, costs_path=parsed_args.costs,
+            memory_budget=(parsed_args.memory_budget and
+                           parsed_args.memory_budget * 1024 * 1024),
+            **kwargs))
+    except verify.VerificationError as e:
+        sys.exit(str(e))
+    if parsed_args.verify and not parsed_args.verbose:
+        print "Verified the move: no problems found."
+    if parsed_args.stats:
+        print stats.format()
+    elif parsed_args.memory_budget and stats.peak_rss_bytes is not None:
+        print "Peak memory use: %.1f MB" % (
+            stats.peak_rss_bytes / 1024.0 / 1024.0)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,60 @@
+from __future__ import absolute_import
+
+import ast
+import os
+
+from benchmarks import generate
+from benchmarks import micro
+import khodemod
+import slicker
+import test_slicker
+
+
+class GenerateTreeTest(test_slicker.TestBase):
+    def _contents(self, root):
+        return {filename: open(os.path.join(root, filename)).read()
+                for filename in khodemod.resolve_paths(
+                    khodemod.default_path_filter(), root=root)}
+
+    def test_deterministic(self):
+        tree = generate.generate_tree(self.join('a'), num_files=50, seed=3)
+        generate.generate_tree(self.join('b'), num_files=50, seed=3)
+        generate.generate_tree(self.join('c'), num_files=50, seed=4)
+        self.assertEqual(50, len(tree.modules))
+        self.assertEqual(self._contents(self.join('a')),
+                         self._contents(self.join('b')))
+        self.assertNotEqual(self._contents(self.join('a')),
+                            self._contents(self.join('c')))
+
+    def test_tree(self):
+        tree = generate.generate_tree(
+            self.tmpdir, num_files=30, package_depth=2,
+            modules_per_package=10, import_density=4.0,
+            late_import_ratio=0.2, implicit_import_ratio=0.2,
+            reference_ratio=0.5)
+        self.assertEqual(['pkg0.sub1.mod0', 'pkg2.sub1.mod29'],
+                         [tree.modules[0], tree.modules[-1]])
+        self.assertEqual('pkg2.sub1', tree.packages[-1])
+        contents = self._contents(self.tmpdir)
+        self.assertIn('pkg2/__init__.py', contents)
+        body = '\n'.join(contents.values())
+        self.assertIn('\n    import pkg', body)    # a late import
+        self.assertIn("'pkg", body)                # a string reference
+        for text in contents.values():
+            ast.parse(text)
+
+    def test_move(self):
+        tree = generate.generate_tree(self.tmpdir, num_files=20)
+        slicker.make_fixes([tree.modules[0]], 'moved',
+                           project_root=self.tmpdir)
+        self.assertFileIsNot('pkg0/sub1/sub2/mod0.py')
+        self.assertNotIn(tree.modules[0] + '.',
+                         '\n'.join(self._contents(self.tmpdir).values()))
+
+
+class MicroTest(test_slicker.TestBase):
+    def test_benchmarks_run(self):
+        for name, benchmark in micro.BENCHMARKS.iteritems():
+            seconds, calls = micro.time_benchmark(benchmark(2), repeat=1,
+                                                  min_seconds=0)
+            self.assertEqual(1, calls, name)
@@ -0,0 +1,192 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+import journal
+import khodemod
+import server
+import slicker
+import test_slicker
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ResumeTest(test_slicker.TestBase):
+    def setUp(self):
+        super(ResumeTest, self).setUp()
+        self.journal_path = self.join(journal.JOURNAL_NAME)
+        self.write_file('pkg/__init__.py', '')
+        for i in xrange(4):
+            self.write_file('pkg/mod%s.py' % i, 'def f%s(): return %s\n'
+                            % (i, i))
+        for i in xrange(4):
+            self.write_file('user%s.py' % i,
+                            'import pkg.mod%s\n\nx = pkg.mod%s.f%s()\n'
+                            % (i, i, i))
+
+    def interrupt_after_writes(self, n, only_filename=None):
+        """Make the n+1-th write from now on die, as if we were killed.
+
+        If only_filename is set, we count only writes to that file.
+        """
+        old_write_file = vars(khodemod.Frontend)['write_file']
+        writes = [0]
+
+        def write_file(self, root, filename, *args, **kwargs):
+            if only_filename in (None, filename):
+                writes[0] += 1
+                if writes[0] == n + 1:
+                    raise Interrupted()
+            return old_write_file(self, root, filename, *args, **kwargs)
+
+        self.addCleanup(setattr, khodemod.Frontend, 'write_file',
+                        old_write_file)
+        khodemod.Frontend.write_file = write_file
+
+    def expected_contents(self):
+        """The files we'd have if the move weren't interrupted."""
+        expected_dir = os.path.join(tempfile.mkdtemp(), 'expected')
+        self.addCleanup(shutil.rmtree, os.path.dirname(expected_dir))
+        shutil.copytree(self.tmpdir, expected_dir)
+        slicker.make_fixes(['pkg'], 'newpkg', project_root=expected_dir,
+                           automove=False)
+        return self.contents(expected_dir)
+
+    def contents(self, root):
+        return {filename: open(os.path.join(root, filename)).read()
+                for filename in khodemod.resolve_paths(
+                    khodemod.default_path_filter(), root=root)}
+
+    def move(self, **kwargs):
+        # We don't automove, so each step writes just the user files.
+        slicker.make_fixes(['pkg'], 'newpkg', project_root=self.tmpdir,
+                           automove=False, **kwargs)
+
+    def test_journal_deleted_when_done(self):
+        self.move()
+        self.assertFalse(os.path.exists(self.journal_path))
+
+    def fixed_users(self):
+        return [filename for (filename, text)
+                in sorted(self.contents(self.tmpdir).iteritems())
+                if 'newpkg' in text]
+
+    def test_resume(self):
+        expected = self.expected_contents()
+        # Fixing references to pkg.__init__ writes nothing, and to each
+        # module writes its user twice (once to fix the references, and
+        # once to remove the old import).  So this dies while fixing the
+        # third pair.
+        self.interrupt_after_writes(3)
+        with self.assertRaises(Interrupted):
+            self.move()
+        self.assertTrue(os.path.exists(self.journal_path))
+        self.assertEqual(2, len(self.fixed_users()))
+
+        fixes = self.count_calls(slicker.Project, '_fix_uses')
+        self.move(resume=True)
+        # We redid the third pair, and did the last two.
+        self.assertEqual(3, sum(fixes.values()))
+        self.assertEqual(expected, self.contents(self.tmpdir))
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(self.error_output)
+
+    def test_resume_server_move(self):
+        expected = self.expected_contents()
+        self.interrupt_after_writes(3)
+        (_, error) = server.Server(self.tmpdir).move(['pkg'], 'newpkg',
+                                                     automove=False)
+        self.assertIn('Interrupted', error)
+        self.assertTrue(os.path.exists(self.journal_path))
+        self.move(resume=True)
+        self.assertEqual(expected, self.contents(self.tmpdir))
+        self.assertFalse(os.path.exists(self.journal_path))
+        self.assertFalse(self.error_output)
+
+    def test_resume_rewritten_file(self):
+        self.write_file('user.py', 'import pkg.mod1\nimport pkg.mod2\n\n'
+                        'x = pkg.mod1.f1() + pkg.mod2.f2()\n')
+        expected = self.expected_contents()
+        # The steps for mod1 and mod2 each write user.py twice.  We die
+        # partway through the second of them, so user.py has changed since
+        # the first one finished, but that's no reason not to resume.
+        self.interrupt_after_writes(3, only_filename='user.py')
+        with self.assertRaises(Interrupted):
+            self.move()
+        self.move(resume=True)
+        self.assertEqual(expected, self.contents(self.tmpdir))
+        self.assertFalse(self.error_output)
+
+    def test_resume_after_package_move(self):
+        self.interrupt_after_writes(1)
+        with self.assertRaises(Interrupted):
+            slicker.make_fixes(['pkg'], 'newpkg', project_root=self.tmpdir)
+        slicker.make_fixes(['pkg'], 'newpkg', project_root=self.tmpdir,
+                           resume=True)
+        self.assertFileIsNot('pkg/mod0.py')
+        for i in xrange(4):
+            self.assertFileIs('newpkg/mod%s.py' % i, 'def f%s(): return %s\n'
+                              % (i, i))
+            self.assertFileIs('user%s.py' % i,
+                              'import newpkg.mod%s\n\nx = newpkg.mod%s.f%s()\n'
+                              % (i, i, i))
+        self.assertFalse(self.error_output)
+
+    def assert_resumes_after_rename(self, old_fullname, new_fullname):
+        def move(**kwargs):
+            slicker.make_fixes([old_fullname], new_fullname,
+                               project_root=self.tmpdir, **kwargs)
+
+        expected_dir = os.path.join(tempfile.mkdtemp(), 'expected')
+        self.addCleanup(shutil.rmtree, os.path.dirname(expected_dir))
+        shutil.copytree(self.tmpdir, expected_dir)
+        slicker.make_fixes([old_fullname], new_fullname,
+                           project_root=expected_dir)
+        # We die after the rename, before adding the __init__.py files of
+        # the new package.
+        old_write_file = vars(khodemod.Frontend)['write_file']
+        self.interrupt_after_writes(0)
+        with self.assertRaises(Interrupted):
+            move()
+        self.assertFileIsNot('newpkg/__init__.py')
+        khodemod.Frontend.write_file = old_write_file
+        move(resume=True)
+        self.assertEqual(self.contents(expected_dir),
+                         self.contents(self.tmpdir))
+        self.assertFalse(self.error_output)
+
+    def test_resume_after_module_rename(self):
+        self.assert_resumes_after_rename('pkg.mod0', 'newpkg.sub.mod0')
+        self.assertFileIs('newpkg/sub/mod0.py', 'def f0(): return 0\n')
+
+    def test_resume_after_package_rename(self):
+        self.assert_resumes_after_rename('pkg', 'newpkg.sub')
+        self.assertFileIs('newpkg/sub/mod0.py', 'def f0(): return 0\n')
+
+    def test_tree_changed(self):
+        self.interrupt_after_writes(2)
+        with self.assertRaises(Interrupted):
+            self.move()
+        (filename,) = self.fixed_users()
+        with open(self.join(filename), 'a') as f:
+            f.write('# I changed this myself.\n')
+        with self.assertRaisesRegexp(ValueError,
+                                     '%s has changed' % filename):
+            self.move(resume=True)
+
+    def test_different_move(self):
+        self.interrupt_after_writes(2)
+        with self.assertRaises(Interrupted):
+            self.move()
+        with self.assertRaisesRegexp(ValueError, 'different move'):
+            slicker.make_fixes(['pkg'], 'otherpkg',
+                               project_root=self.tmpdir, automove=False,
+                               resume=True)
+
+    def test_no_journal(self):
+        with self.assertRaisesRegexp(ValueError, 'no journal'):
+            self.move(resume=True)
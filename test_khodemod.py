@@ -1,5 +1,15 @@
 from __future__ import absolute_import
 
+import StringIO
+import json
+import os
+import pstats
+import re
+import signal
+import threading
+import time
+import unittest
+
 import khodemod
 import test_slicker
 
@@ -35,3 +45,641 @@ class PathFilterTest(test_slicker.TestBase):
                     extensions=('js', 'css'), include_extensionless=True),
                 root=self.tmpdir),
             ['foo_extensionless_py', 'foo.js', 'foo.css'])
+
+    def test_gitignore(self):
+        self.write_file('.gitignore',
+                        '# comment\n\n*_pb2.py\n/vendor/\nfoo/**/gen\n')
+        self.write_file('foo/.gitignore', 'ignored.py\n!keep_pb2.py\n')
+        self.write_file('a.py', '')
+        self.write_file('a_pb2.py', '')
+        self.write_file('vendor/lib.py', '')
+        self.write_file('bar/vendor/lib.py', '')
+        self.write_file('foo/keep_pb2.py', '')
+        self.write_file('foo/ignored.py', '')
+        self.write_file('foo/bar/ignored.py', '')
+        self.write_file('foo/bar/gen/x.py', '')
+        self.write_file('gen/x.py', '')
+
+        self.assertItemsEqual(
+            khodemod.resolve_paths(
+                khodemod.default_path_filter(root=self.tmpdir),
+                root=self.tmpdir),
+            ['a.py', 'bar/vendor/lib.py', 'foo/keep_pb2.py', 'gen/x.py'])
+
+
+class NeedlesTest(test_slicker.TestBase):
+    def test_skips_files_without_needles(self):
+        self.write_file('foo.py', 'import foo\n')
+        self.write_file('bar.py', 'import bar\n')
+        self.write_file('empty.py', '')
+
+        seen_filenames = []
+
+        def suggestor(filename, body):
+            seen_filenames.append(filename)
+            return []
+        suggestor.needles = ['foo']
+
+        khodemod.AcceptingFrontend().run_suggestor(suggestor,
+                                                   root=self.tmpdir)
+        self.assertEqual(seen_filenames, ['foo.py'])
+
+    def test_file_contains_any(self):
+        self.write_file('foo.py', '# -*- coding: utf-8 -*-\n# \xc3\xa9 foo\n')
+        self.assertTrue(
+            khodemod.file_contains_any(self.tmpdir, 'foo.py', ['bar', 'foo']))
+        self.assertFalse(
+            khodemod.file_contains_any(self.tmpdir, 'foo.py', ['bar']))
+        self.assertFalse(
+            khodemod.file_contains_any(self.tmpdir, 'nope.py', ['foo']))
+
+
+class PatchSetTest(unittest.TestCase):
+    def test_duplicates(self):
+        patch_set = khodemod.PatchSet([
+            khodemod.Patch('foo.py', 'abc', 'aXc', 0, 3),
+            khodemod.Patch('foo.py', 'b', 'X', 1, 2),
+            khodemod.Patch('foo.py', 'abc', 'aXc', 0, 3),
+            khodemod.Patch('foo.py', 'd', 'd', 3, 4),
+            khodemod.Patch('bar.py', 'b', 'X', 1, 2),
+        ])
+        self.assertEqual(['foo.py', 'bar.py'], patch_set.filenames())
+        self.assertEqual([(0, 3)], [(p.start, p.end) for p in
+                                    patch_set.patches_for('foo.py')])
+        self.assertEqual([], patch_set.conflicts())
+
+    def test_order(self):
+        patches = [
+            khodemod.Patch('foo.py', 'bc', 'Y', 1, 3),
+            khodemod.Patch('foo.py', '', 'short', 1, 1),
+            khodemod.Patch('foo.py', '', 'longer', 1, 1),
+            khodemod.Patch('foo.py', 'a', 'X', 0, 1),
+            khodemod.Patch('foo.py', '', 'end', 3, 3),
+        ]
+        patch_set = khodemod.PatchSet(patches)
+        self.assertEqual([patches[i] for i in (3, 2, 1, 0, 4)],
+                         patch_set.patches_for('foo.py'))
+        patch_set.check()
+
+    def test_conflicts(self):
+        patches = [
+            khodemod.Patch('foo.py', 'abc', 'X', 0, 3),
+            khodemod.Patch('foo.py', 'bcd', 'Y', 1, 4),
+            khodemod.Patch('foo.py', '', 'Z', 2, 2),
+            khodemod.Patch('foo.py', 'f', 'W', 5, 6),
+            khodemod.Patch('bar.py', 'ab', None, 0, 2),
+            khodemod.Patch('bar.py', '', 'V', 2, 2),
+        ]
+        patch_set = khodemod.PatchSet(patches)
+        self.assertItemsEqual(
+            [(patches[0], patches[1]), (patches[1], patches[2]),
+             (patches[4], patches[5])],
+            patch_set.conflicts())
+        with self.assertRaises(khodemod.FatalError) as e:
+            patch_set.check()
+        self.assertEqual(3, e.exception.message.count(' and '))
+
+
+class LRUCacheTest(test_slicker.TestBase):
+    def test_evicts_least_recently_used(self):
+        cache = khodemod.LRUCache(10, sizeof=len)
+        with khodemod.collect_stats() as stats:
+            cache['a'] = 'aaaa'
+            cache['b'] = 'bbbb'
+            self.assertEqual('aaaa', cache.get('a'))
+            cache['c'] = 'cccc'
+        # We used 'a' more recently than 'b', so 'b' went.
+        self.assertEqual('aaaa', cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('cccc', cache.get('c'))
+        self.assertEqual(8, cache.size)
+        self.assertEqual(1, stats.get('cache_evictions'))
+
+        self.assertEqual('aaaa', cache.pop('a'))
+        self.assertNotIn('a', cache)
+        self.assertEqual(4, cache.size)
+        # Replacing a value charges us for the new one instead.
+        cache['c'] = 'cc'
+        self.assertEqual((1, 2), (len(cache), cache.size))
+
+    def test_too_big(self):
+        cache = khodemod.LRUCache(10, sizeof=len)
+        cache['a'] = 'aaaa'
+        cache['b'] = 'b' * 11
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual('aaaa', cache.get('a'))
+
+
+class FileSetTest(test_slicker.TestBase):
+    def test_add_while_iterating(self):
+        files = khodemod._FileSet([('root', 'a.py'), ('root', 'b.py')])
+        seen = []
+        for pair in files:
+            seen.append(pair)
+            files.add(('root', 'c.py'))
+            files.add(('other', 'd.py'))
+        # We saw the files as of when we started, but kept the new ones.
+        self.assertItemsEqual([('root', 'a.py'), ('root', 'b.py')], seen)
+        self.assertEqual({('root', 'a.py'), ('root', 'b.py'),
+                          ('root', 'c.py'), ('other', 'd.py')}, files)
+        self.assertFalse(files._readers)
+
+
+class CombineSuggestorsTest(test_slicker.TestBase):
+    def _replacer(self, old, new, insert=None):
+        def suggestor(filename, body):
+            if insert is not None:
+                yield khodemod.Patch(filename, '', insert, 0, 0)
+            start = body.find(old)
+            if start != -1:
+                yield khodemod.Patch(filename, old, new,
+                                     start, start + len(old))
+        suggestor.needles = [old]
+        return suggestor
+
+    def test_combine(self):
+        self.write_file('foo.py', 'a = b\n')
+        self.write_file('bar.py', 'c = d\n')
+        khodemod.AcceptingFrontend().run_suggestor(
+            khodemod.combine_suggestors([
+                self._replacer('a', 'x', insert='import q\n'),
+                self._replacer('b', 'y', insert='import q\n'),
+                self._replacer('zzz', 'w', insert='import z\n')]),
+            root=self.tmpdir)
+        self.assertFileIs('foo.py', 'import q\nx = y\n')
+        self.assertFileIs('bar.py', 'c = d\n')
+        self.assertFalse(self.error_output)
+
+    def test_conflict(self):
+        self.write_file('foo.py', 'abc = 1\n')
+        khodemod.AcceptingFrontend().run_suggestor(
+            khodemod.combine_suggestors([self._replacer('abc', 'x'),
+                                         self._replacer('bc', 'y')]),
+            root=self.tmpdir)
+        self.assertFileIs('foo.py', 'abc = 1\n')
+        self.assertIn('Conflicting changes', self.error_output[0])
+
+
+class StatsTest(test_slicker.TestBase):
+    def test_counts(self):
+        self.write_file('foo.py', 'import foo\n')
+        self.write_file('bar.py', 'import bar\n')
+        self.write_file('baz.py', 'import foo, bar\n')
+
+        def suggestor(filename, body):
+            yield khodemod.Patch(filename, 'foo', 'qux', 7, 10)
+            yield khodemod.Patch(filename, 'import', 'import', 0, 6)
+        suggestor.needles = ['foo']
+
+        frontend = khodemod.AcceptingFrontend()
+        with khodemod.collect_stats() as stats:
+            with khodemod.stats_phase('first'):
+                frontend.run_suggestor(suggestor, root=self.tmpdir)
+            with khodemod.stats_phase('second'):
+                frontend.write_file(self.tmpdir, 'foo.py', 'import foo\n')
+
+        self.assertEqual(['first', 'second'], stats.phases)
+        self.assertEqual(3, stats.get('files_enumerated'))
+        self.assertEqual(1, stats.get('files_prefiltered'))
+        # We read each file once to run the suggestor, and again to patch it.
+        self.assertEqual(4, stats.get('files_read'))
+        self.assertEqual(2 * (len('import foo\n') + len('import foo, bar\n')),
+                         stats.get('bytes_read'))
+        self.assertEqual(4, stats.get('patches'))
+        self.assertEqual(2, stats.get('files_written', 'first'))
+        self.assertEqual(0, stats.get('rewrites', 'first'))
+        self.assertEqual(1, stats.get('files_written', 'second'))
+        self.assertEqual(2, stats.get('files_written'))
+        self.assertEqual(1, stats.get('rewrites'))
+        self.assertEqual([(self.join('foo.py'), 2)], stats.most_rewritten())
+        self.assertIn('files rejected by prefilter', stats.format())
+        as_dict = stats.to_dict()
+        self.assertEqual({'first', 'second', 'total'}, set(as_dict))
+        self.assertEqual(1, as_dict['second']['files_written'])
+        self.assertEqual(1, as_dict['total']['rewrites'])
+        self.assertGreater(stats.peak_rss_bytes, 0)
+        self.assertIn('peak memory use', stats.format())
+
+    def test_not_collecting(self):
+        self.write_file('foo.py', 'import foo\n')
+        khodemod.read_file(self.tmpdir, 'foo.py')
+        self.assertIsNone(khodemod._STATS)
+
+
+class ProfileSlowestFilesTest(test_slicker.TestBase):
+    def test_profile(self):
+        for i in xrange(5):
+            self.write_file('f%s.py' % i, '')
+
+        def suggestor(filename, body):
+            if filename in ('f1.py', 'f3.py'):
+                time.sleep(0.05 if filename == 'f1.py' else 0.02)
+            return []
+
+        with khodemod.profile_slowest_files(2) as profiler:
+            khodemod.AcceptingFrontend().run_suggestor(suggestor,
+                                                       root=self.tmpdir)
+        self.assertIsNone(khodemod._FILE_PROFILER)
+        self.assertEqual(['f1.py', 'f3.py'],
+                         [filename for (_, filename, _)
+                          in profiler.slowest()])
+
+        dumped = profiler.dump(self.join('out.prof'))
+        self.assertEqual([self.join('out.prof.1'), self.join('out.prof.2')],
+                         [path for (path, _, _) in dumped])
+        stats = pstats.Stats(self.join('out.prof.1'))
+        self.assertTrue(any(name == 'suggestor'
+                            for (_, _, name) in stats.stats))
+
+    def test_threads(self):
+        profiler = khodemod.SlowestFilesProfiler(3)
+
+        def profile_files():
+            for i in xrange(50):
+                profiler.runcall('f%s.py' % i, lambda: None)
+
+        threads = [threading.Thread(target=profile_files) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(200, profiler._count)
+        self.assertEqual(3, len(profiler.slowest()))
+
+
+class RunStatusTest(test_slicker.TestBase):
+    def setUp(self):
+        super(RunStatusTest, self).setUp()
+        for i in xrange(4):
+            self.write_file('f%s.py' % i, 'x = 1\n')
+
+    def test_status(self):
+        statuses = []
+
+        def suggestor(filename, body):
+            statuses.append(khodemod._STATUS.format())
+            return []
+
+        with khodemod.track_status():
+            khodemod.set_status_task('foo -> bar')
+            with khodemod.stats_phase('fix references'):
+                khodemod.AcceptingFrontend().run_suggestor_on_files(
+                    suggestor, ['f0.py', 'f1.py', 'f2.py'], root=self.tmpdir)
+        self.assertIsNone(khodemod._STATUS)
+        self.assertEqual('[fix references] foo -> bar pass 1: 0/3 files f0.py',
+                         statuses[0])
+        self.assertRegexpMatches(
+            statuses[2],
+            r'^\[fix references\] foo -> bar pass 1: 2/3 files '
+            r'pass ETA 0:\d\d f2.py$')
+
+    def test_report_progress(self):
+        def suggestor(filename, body):
+            time.sleep(0.03)
+            return []
+
+        output = StringIO.StringIO()
+        with khodemod.track_status():
+            with khodemod.report_progress(output, interval=0.01):
+                khodemod.AcceptingFrontend().run_suggestor(
+                    suggestor, root=self.tmpdir)
+        self.assertIn('/4 files', output.getvalue())
+
+    def test_dump_status_on_signal(self):
+        self.addCleanup(signal.signal, signal.SIGUSR1,
+                        signal.getsignal(signal.SIGUSR1))
+        output = StringIO.StringIO()
+        khodemod.dump_status_on_signal(stream=output)
+
+        def suggestor(filename, body):
+            if filename == 'f1.py':
+                os.kill(os.getpid(), signal.SIGUSR1)
+            return []
+
+        with khodemod.track_status():
+            khodemod.AcceptingFrontend().run_suggestor_on_files(
+                suggestor, ['f0.py', 'f1.py'], root=self.tmpdir)
+        self.assertRegexpMatches(output.getvalue(),
+                                 r'^Status: pass 1: 1/2 files pass ETA 0:00 '
+                                 r'f1.py\n'
+                                 r'Stack of thread MainThread ')
+        self.assertIn('in suggestor\n', output.getvalue())
+
+    def test_dump_other_threads_on_signal(self):
+        self.addCleanup(signal.signal, signal.SIGUSR1,
+                        signal.getsignal(signal.SIGUSR1))
+        output = StringIO.StringIO()
+        khodemod.dump_status_on_signal(stream=output)
+        started = threading.Event()
+        done = threading.Event()
+
+        def wait_in_worker():
+            started.set()
+            done.wait(5)
+
+        worker = threading.Thread(target=wait_in_worker, name='worker')
+        worker.start()
+        self.assertTrue(started.wait(5))
+        os.kill(os.getpid(), signal.SIGUSR1)
+        done.set()
+        worker.join()
+        self.assertIn('Stack of thread MainThread ', output.getvalue())
+        self.assertIn('Stack of thread worker ', output.getvalue())
+        self.assertIn('in wait_in_worker\n', output.getvalue())
+
+
+class FileCostsTest(test_slicker.TestBase):
+    def setUp(self):
+        super(FileCostsTest, self).setUp()
+        self.costs_path = self.join('costs.json')
+        for i in xrange(4):
+            self.write_file('f%s.py' % i, 'x = %s\n' % i)
+
+    def test_record(self):
+        def suggestor(filename, body):
+            if filename == 'f2.py':
+                time.sleep(0.05)
+            return []
+
+        costs = khodemod.FileCosts(self.tmpdir, self.costs_path)
+        with khodemod.record_costs(costs):
+            khodemod.AcceptingFrontend().run_suggestor(suggestor,
+                                                       root=self.tmpdir)
+        self.assertIsNone(khodemod._COSTS)
+        # Nothing counts until we save.
+        self.assertEqual(1.0, costs.cost(self.tmpdir, 'f2.py'))
+        costs.save()
+
+        costs = khodemod.FileCosts(self.tmpdir, self.costs_path)
+        self.assertGreaterEqual(costs.cost(self.tmpdir, 'f2.py'), 0.05)
+        self.assertLess(costs.cost(self.tmpdir, 'f0.py'), 0.05)
+        # A file we haven't seen costs the mean.
+        self.assertAlmostEqual(
+            sum(costs.cost(self.tmpdir, 'f%s.py' % i) for i in xrange(4)) / 4,
+            costs.cost(self.tmpdir, 'new.py'))
+        self.assertEqual('f2.py', costs.longest_first(
+            self.tmpdir, ['f0.py', 'f1.py', 'f2.py'])[0])
+        with open(self.costs_path) as f:
+            self.assertEqual(['f%s.py' % i for i in xrange(4)],
+                             sorted(json.load(f)))
+
+    def test_record_other_files_patched(self):
+        # The suggestor for f0.py also changes f1.py; the time is f0.py's.
+        def suggestor(filename, body):
+            yield khodemod.Patch('f1.py', 'x', 'y', 0, 1)
+            yield khodemod.Patch(filename, 'x', 'z', 0, 1)
+
+        costs = khodemod.FileCosts(self.tmpdir, self.costs_path)
+        with khodemod.record_costs(costs):
+            khodemod.AcceptingFrontend().run_suggestor_on_files(
+                suggestor, ['f0.py'], root=self.tmpdir)
+        costs.save()
+        self.assertFileIs('f1.py', 'y = 1\n')
+        with open(self.costs_path) as f:
+            self.assertEqual(['f0.py'], json.load(f).keys())
+
+    def test_batches(self):
+        with open(self.costs_path, 'w') as f:
+            json.dump({'big.py': [10, 1000], 'medium.py': [4, 400],
+                       'small1.py': [1, 100], 'small2.py': [1, 100],
+                       'small3.py': [1, 100]}, f)
+        costs = khodemod.FileCosts(self.tmpdir, self.costs_path)
+        self.assertEqual(
+            [['big.py'], ['medium.py', 'small1.py'], ['small2.py',
+                                                      'small3.py']],
+            costs.batches(self.tmpdir, ['small1.py', 'small2.py', 'big.py',
+                                        'medium.py', 'small3.py'], 5))
+
+    def test_other_root(self):
+        with open(self.costs_path, 'w') as f:
+            json.dump({'sub/big.py': [10, 1000], 'small.py': [1, 100]}, f)
+        costs = khodemod.FileCosts(self.tmpdir, self.costs_path)
+        self.assertEqual(10, costs.cost(self.join('sub'), 'big.py'))
+        self.assertEqual(10, costs.cost(self.tmpdir, 'sub/big.py'))
+        self.assertEqual(1, costs.cost(self.join('sub'), '../small.py'))
+
+    def test_eta(self):
+        status = khodemod.RunStatus()
+        status.start_pass(['big.py', 'small1.py', 'small2.py'], [8, 1, 1])
+        status.pass_started = time.time() - 8
+        status.file_done(8)
+        # Counting files, we'd say we had twice as long to go.
+        self.assertAlmostEqual(2, status.eta(), places=1)
+
+
+class ObserverTest(test_slicker.TestBase):
+    def test_observers(self):
+        self.write_file('foo.py', 'import foo\n')
+        self.write_file('bar.py', 'import bar\n')
+        self.write_file('baz.py', 'import baz\n')
+
+        def suggestor(filename, body):
+            if filename == 'baz.py':
+                raise khodemod.FatalError(filename, 0, 'nope')
+            yield khodemod.Patch(filename, 'import', 'from', 0, 6)
+            yield khodemod.WarningInfo(filename, 0, 'hmm')
+        suggestor.needles = ['foo', 'baz']
+
+        aggregator = khodemod.AggregatingObserver()
+        trace = StringIO.StringIO()
+        khodemod.AcceptingFrontend(
+            observers=[aggregator, khodemod.JSONTraceObserver(trace)]
+        ).run_suggestor_on_files(suggestor, ['foo.py', 'bar.py', 'baz.py'],
+                                 root=self.tmpdir)
+
+        self.assertEqual({'run_start', 'run_end', 'file_read',
+                          'suggestor_start', 'suggestor_end', 'warning',
+                          'patches_applied', 'error', 'file_written'},
+                         set(aggregator.totals))
+        self.assertEqual(1, aggregator.totals['run_start']['events'])
+        self.assertEqual(3, aggregator.totals['run_start']['count'])
+        self.assertEqual(2, aggregator.totals['file_read']['events'])
+        self.assertEqual(len('import foo\n') * 2,
+                         aggregator.totals['file_read']['size'])
+        self.assertEqual(1, aggregator.totals['patches_applied']['count'])
+        self.assertEqual(len('from foo\n'),
+                         aggregator.totals['file_written']['size'])
+
+        events = [json.loads(line) for line in trace.getvalue().splitlines()]
+        self.assertEqual('run_start', events[0]['kind'])
+        self.assertEqual('run_end', events[-1]['kind'])
+        self.assertIn({'kind', 'time', 'filename', 'seconds', 'size'},
+                      [set(event) for event in events
+                       if event['kind'] == 'file_written'])
+
+    def test_read_size_in_bytes(self):
+        self.write_file('foo.py', '# -*- coding: utf-8 -*-\n# \xe2\x98\x83\n')
+        aggregator = khodemod.AggregatingObserver()
+        khodemod.AcceptingFrontend(observers=[aggregator]).run_suggestor(
+            lambda filename, body: [], root=self.tmpdir)
+        self.assertEqual(len('# -*- coding: utf-8 -*-\n# \xe2\x98\x83\n'),
+                         aggregator.totals['file_read']['size'])
+
+    def test_run_end_on_error(self):
+        self.write_file('foo.py', 'import foo\n')
+
+        def suggestor(filename, body):
+            raise ValueError('oops')
+
+        aggregator = khodemod.AggregatingObserver()
+        with self.assertRaises(ValueError):
+            khodemod.AcceptingFrontend(observers=[aggregator]).run_suggestor(
+                suggestor, root=self.tmpdir)
+        self.assertEqual(1, aggregator.totals['run_end']['events'])
+
+
+class PipelinedFrontendTest(test_slicker.TestBase):
+    def test_file_exists(self):
+        # Poor-man's mock: pretend these writes are still on their way to
+        # disk.
+        self.write_file('old.py', 'x = 1\n')
+        self.addCleanup(khodemod._PENDING_WRITES.clear)
+        khodemod._PENDING_WRITES[self.join('new.py')] = (object(), 'y = 1\n')
+        khodemod._PENDING_WRITES[self.join('old.py')] = (object(), None)
+        self.assertTrue(khodemod.file_exists(self.tmpdir, 'new.py'))
+        self.assertFalse(khodemod.file_exists(self.tmpdir, 'old.py'))
+        self.assertFalse(khodemod.file_exists(self.tmpdir, 'other.py'))
+
+    def test_sees_earlier_writes(self):
+        filenames = ['f%s.py' % i for i in xrange(50)]
+        for filename in filenames:
+            self.write_file(filename, 'x = 1\n')
+
+        def suggestor(filename, body):
+            # Each file tells the next file what it saw.
+            i = filenames.index(filename)
+            if i + 1 < len(filenames):
+                next_body = khodemod.read_file(self.tmpdir, filenames[i + 1])
+                yield khodemod.Patch(filenames[i + 1], '', body,
+                                     len(next_body), len(next_body))
+
+        khodemod.AcceptingFrontend(io_threads=4).run_suggestor_on_files(
+            suggestor, filenames, root=self.tmpdir)
+        self.assertFileIs('f3.py', 'x = 1\n' * 4)
+        self.assertFileIs('f49.py', 'x = 1\n' * 50)
+        self.assertFalse(khodemod._PENDING_WRITES)
+        self.assertFalse(self.error_output)
+
+
+class ResolvePathsCacheTest(test_slicker.TestBase):
+    def setUp(self):
+        super(ResolvePathsCacheTest, self).setUp()
+        self.path_filter = khodemod.default_path_filter()
+        self.addCleanup(khodemod._RESOLVE_PATHS_CACHE.clear)
+
+    def _assert_paths_without_walking(self, expected):
+        # Poor-man's mock: make sure we're answering from the cache.
+        _old_walk = khodemod.os.walk
+
+        def restore_walk():
+            khodemod.os.walk = _old_walk
+        self.addCleanup(restore_walk)
+        khodemod.os.walk = lambda *args: self.fail("Walked the tree!")
+
+        self.assertItemsEqual(
+            khodemod.resolve_paths(self.path_filter, root=self.tmpdir),
+            expected)
+        restore_walk()
+
+    def test_updated_in_place(self):
+        self.write_file('foo.py', '')
+        self.write_file('bar/baz.py', '')
+        self.write_file('bar/qux.py', '')
+        list(khodemod.resolve_paths(self.path_filter, root=self.tmpdir))
+
+        frontend = khodemod.AcceptingFrontend()
+        frontend.write_file(self.tmpdir, 'new/file.py', 'x = 1\n')
+        frontend.write_file(self.tmpdir, 'genfiles/file.py', 'x = 1\n')
+        frontend.write_file(self.tmpdir, 'new/file.js', 'x = 1\n')
+        frontend.write_file(self.tmpdir, 'foo.py', None)
+        self._assert_paths_without_walking(
+            ['bar/baz.py', 'bar/qux.py', 'new/file.py'])
+
+        frontend.rename_file(self.tmpdir, 'bar/', 'moved/bar/')
+        frontend.rename_file(self.tmpdir, 'new/file.py', 'file.py')
+        self._assert_paths_without_walking(
+            ['moved/bar/baz.py', 'moved/bar/qux.py', 'file.py'])
+
+
+class LowMemoryTest(test_slicker.TestBase):
+    def setUp(self):
+        super(LowMemoryTest, self).setUp()
+        self.path_filter = khodemod.default_path_filter()
+        self.addCleanup(khodemod._RESOLVE_PATHS_CACHE.clear)
+        self.write_file('foo.py', 'import foo\n')
+        self.write_file('bar/baz.py', 'import foo\n')
+
+    def test_paths_not_cached(self):
+        with khodemod.low_memory():
+            paths = khodemod.resolve_paths(self.path_filter, root=self.tmpdir)
+            self.assertNotIsInstance(paths, list)
+            self.assertItemsEqual(['foo.py', 'bar/baz.py'], paths)
+            self.assertEqual({}, khodemod._RESOLVE_PATHS_CACHE)
+        self.assertFalse(khodemod._LOW_MEMORY)
+
+    def test_modified_files(self):
+        def suggestor(filename, body):
+            yield khodemod.Patch(filename, 'foo', 'qux', 7, 10)
+
+        frontend = khodemod.AcceptingFrontend()
+        with khodemod.low_memory():
+            frontend.run_suggestor(suggestor, root=self.tmpdir)
+        frontend.add_modified_files(self.tmpdir, ['new.py'])
+        self.assertEqual({(self.tmpdir, 'foo.py'),
+                          (self.tmpdir, 'bar/baz.py'),
+                          (self.tmpdir, 'new.py')},
+                         frontend.modified_files())
+        self.assertEqual(3, len(frontend.pop_modified_files()))
+        self.assertEqual(set(), frontend.modified_files())
+
+
+class PatchRecordingFrontendTest(test_slicker.TestBase):
+    def record(self, suggestor, shard_index=0, num_shards=1):
+        frontend = khodemod.PatchRecordingFrontend(shard_index, num_shards)
+        try:
+            frontend.run_suggestor(suggestor, root=self.tmpdir)
+            return list(frontend.records())
+        finally:
+            frontend.close()
+
+    def test_in_shard(self):
+        filenames = ['f%s.py' % i for i in xrange(100)]
+        shards = [[f for f in filenames if khodemod.in_shard(f, i, 3)]
+                  for i in xrange(3)]
+        self.assertItemsEqual(filenames, sum(shards, []))
+        self.assertTrue(all(shards))
+
+    def test_record_and_apply(self):
+        filenames = ['f%s.py' % i for i in xrange(20)]
+        for filename in filenames:
+            self.write_file(filename, 'a = 1\nb = 2\n')
+        suggestor = khodemod.regex_suggestor(re.compile('b'), 'c')
+
+        records = []
+        for i in xrange(3):
+            shard_records = self.record(suggestor, i, 3)
+            self.assertTrue(shard_records)
+            records.extend(shard_records)
+        self.assertFileIs('f0.py', 'a = 1\nb = 2\n')
+        self.assertEqual(
+            sorted(filenames),
+            sorted(record['filename'] for record in records))
+        self.assertEqual(('b', 'c', 6, 7),
+                         (records[0]['old'], records[0]['new'],
+                          records[0]['start'], records[0]['end']))
+
+        khodemod.apply_patch_records(khodemod.AcceptingFrontend(),
+                                     records, root=self.tmpdir)
+        for filename in filenames:
+            self.assertFileIs(filename, 'a = 1\nc = 2\n')
+        self.assertFalse(self.error_output)
+
+    def test_conflict(self):
+        self.write_file('foo.py', 'abc = 1\n')
+        records = (
+            self.record(khodemod.regex_suggestor(re.compile('abc'), 'x')) +
+            self.record(khodemod.regex_suggestor(re.compile('bc'), 'y')))
+        with self.assertRaises(khodemod.FatalError):
+            khodemod.apply_patch_records(khodemod.AcceptingFrontend(),
+                                         records, root=self.tmpdir)
+        self.assertFileIs('foo.py', 'abc = 1\n')
@@ -3,6 +3,8 @@ from __future__ import absolute_import
 import os
 import stat
 
+import khodemod
+import moves
 import slicker
 import test_slicker
 
@@ -94,9 +96,19 @@ class FileMoveSuggestorTest(test_slicker.TestBase):
                            'import newfoo.baz\n\n'
                            'return newfoo.bar.val + newfoo.baz.val +'
                            ' newfoo.bang.qux.qux\n'))
-        self.assertFileIsNot('foo/bar.py')
+        self.assertFileIsNot('foo')
+        self.assertFalse(self.error_output)
+
+    def test_move_package_moves_non_python_files(self):
+        self.write_file('foo/__init__.py', '')
+        self.write_file('foo/bar.py', 'def myfunc(): return 4\n')
+        self.write_file('foo/data/template.html', '<p>hi</p>\n')
+        slicker.make_fixes(['foo'], 'newfoo',
+                           project_root=self.tmpdir)
+        self.assertFileIs('newfoo/bar.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('newfoo/data/template.html', '<p>hi</p>\n')
+        self.assertFileIsNot('foo')
         self.assertFalse(self.error_output)
-        # TODO(csilvers): assert that the whole dir `foo` has gone away.
 
     def test_move_package_to_existing_name(self):
         self.write_file('foo/__init__.py', '')
@@ -135,6 +147,32 @@ class FileMoveSuggestorTest(test_slicker.TestBase):
         self.assertEqual(
             0o755, stat.S_IMODE(os.stat(self.join('baz.py')).st_mode))
 
+    def test_move_is_a_rename(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        inode = os.stat(self.join('foo.py')).st_ino
+        slicker.make_fixes(['foo'], 'baz',
+                           project_root=self.tmpdir)
+        self.assertEqual(inode, os.stat(self.join('baz.py')).st_ino)
+
+    def test_pending_writes(self):
+        # Poor-man's mock: pretend writes to baz.py and bang.py are still
+        # on their way to disk.
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bang.py', '')
+        self.addCleanup(khodemod._PENDING_WRITES.clear)
+        khodemod._PENDING_WRITES[self.join('baz.py')] = (object(), 'x = 1\n')
+        khodemod._PENDING_WRITES[self.join('bang.py')] = (object(), None)
+
+        def move(new_fullname):
+            suggestor = moves.move_module_suggestor(self.tmpdir, 'foo',
+                                                    new_fullname)
+            return list(suggestor('foo.py', 'def myfunc(): return 4\n'))
+
+        with self.assertRaises(AssertionError):
+            move('baz')
+        self.assertEqual([khodemod.Rename('foo.py', 'bang.py')],
+                         move('bang'))
+
 
 class SymbolMoveSuggestorTest(test_slicker.TestBase):
     def test_move_function(self):
@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import threading
+
+import khodemod
+import schedule
+import slicker
+import test_slicker
+
+
+class DependenciesTest(test_slicker.TestBase):
+    def test_conflicts(self):
+        tasks = [schedule.Task('write a', None, reads=['a'], writes=['a']),
+                 schedule.Task('read a', None, reads=['a'], writes=[]),
+                 schedule.Task('read a too', None, reads=['a'], writes=[]),
+                 schedule.Task('write b', None, reads=[], writes=['b']),
+                 schedule.Task('anything', None),
+                 schedule.Task('write c', None, reads=[], writes=['c'])]
+        self.assertEqual([set(), {0}, {0}, set(), {0, 1, 2, 3}, {4}],
+                         schedule.dependencies(tasks))
+
+
+class RunTasksTest(test_slicker.TestBase):
+    def test_in_order(self):
+        ran = []
+        tasks = [schedule.Task(i, lambda i=i: ran.append(i), ['a'], ['a'])
+                 for i in xrange(10)]
+        schedule.run_tasks(tasks, workers=4)
+        self.assertEqual(range(10), ran)
+
+    def test_concurrent(self):
+        # The first task can only finish once the second has started, so
+        # they must run at once.
+        started = threading.Event()
+        ran = []
+
+        def first():
+            self.assertTrue(started.wait(5))
+            ran.append('first')
+
+        def second():
+            started.set()
+            ran.append('second')
+
+        schedule.run_tasks([schedule.Task('first', first, ['a'], ['a']),
+                            schedule.Task('second', second, ['b'], ['b']),
+                            schedule.Task('third', lambda: ran.append('third'),
+                                          ['a', 'b'], [])],
+                           workers=2)
+        self.assertEqual(['second', 'first', 'third'], ran)
+
+    def test_costliest_first(self):
+        ran = []
+        tasks = [schedule.Task(name, lambda name=name: ran.append(name),
+                               [name], [name], cost=cost)
+                 for (name, cost) in (('cheap', 1), ('costly', 5),
+                                      ('medium', 3))]
+        schedule.run_tasks(tasks, workers=2)
+        self.assertEqual({'costly', 'medium'}, set(ran[:2]))
+        self.assertEqual('cheap', ran[2])
+
+    def test_error(self):
+        ran = []
+
+        def fail():
+            raise ValueError('oops')
+
+        tasks = [schedule.Task('fail', fail, ['a'], ['a']),
+                 schedule.Task('after', lambda: ran.append('after'),
+                               ['a'], ['a'])]
+        for workers in (1, 4):
+            with self.assertRaisesRegexp(ValueError, 'oops'):
+                schedule.run_tasks(tasks, workers=workers)
+        self.assertEqual([], ran)
+
+
+class MoveTest(test_slicker.TestBase):
+    def setUp(self):
+        super(MoveTest, self).setUp()
+        for name in ('alpha', 'beta', 'gamma'):
+            self.write_file('%s/__init__.py' % name, '')
+            self.write_file('%s/%smod.py' % (name, name),
+                            'def f(): return "%s"\n' % name)
+            self.write_file('%s_user.py' % name,
+                            'import %s.%smod\n\nx = %s.%smod.f()\n'
+                            % (name, name, name, name))
+        self.write_file('all_users.py',
+                        'import alpha.alphamod\nimport gamma.gammamod\n\n'
+                        'x = alpha.alphamod.f() + gamma.gammamod.f()\n')
+        self.write_file('new/__init__.py', '')
+
+    def contents(self, root):
+        return {filename: open(os.path.join(root, filename)).read()
+                for filename in khodemod.resolve_paths(
+                    khodemod.default_path_filter(), root=root)}
+
+    def move(self, root, workers):
+        slicker.make_fixes(
+            ['alpha.alphamod', 'beta.betamod', 'gamma.gammamod'], 'new',
+            project_root=root, workers=workers)
+
+    def test_same_as_in_order(self):
+        expected_dir = os.path.join(tempfile.mkdtemp(), 'expected')
+        self.addCleanup(shutil.rmtree, os.path.dirname(expected_dir))
+        shutil.copytree(self.tmpdir, expected_dir)
+        self.move(expected_dir, workers=1)
+
+        old_run_tasks = schedule.run_tasks
+        self.addCleanup(setattr, schedule, 'run_tasks', old_run_tasks)
+        task_names = {}
+
+        def run_tasks(tasks, workers=1):
+            task_names.update(
+                (task.name, {tasks[i].name for i in deps})
+                for (task, deps) in zip(tasks,
+                                        schedule.dependencies(tasks)))
+            return old_run_tasks(tasks, workers)
+
+        schedule.run_tasks = run_tasks
+        self.move(self.tmpdir, workers=4)
+        self.assertEqual(self.contents(expected_dir),
+                         self.contents(self.tmpdir))
+        self.assertFalse(self.error_output)
+        # The steps for beta touch nothing those for alpha do.
+        self.assertEqual(set(), task_names['move 1'])
+        self.assertEqual({'move 1'}, task_names['fix references 1'])
+        # But all_users.py mentions both alpha and gamma.
+        self.assertIn('fix references 0', task_names['fix references 2'])
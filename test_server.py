@@ -0,0 +1,56 @@
+from __future__ import absolute_import
+
+import threading
+import time
+
+import server
+import test_slicker
+
+
+class ServerTest(test_slicker.TestBase):
+    def setUp(self):
+        super(ServerTest, self).setUp()
+        self.server_thread = threading.Thread(
+            target=server.Server(self.tmpdir).serve_forever)
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        while True:
+            sock = server._connect(self.tmpdir)
+            if sock is not None:
+                sock.close()
+                break
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.assertTrue(server.stop(self.tmpdir))
+        self.server_thread.join()
+        super(ServerTest, self).tearDown()
+
+    def test_move(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        self.assertEqual(('', None),
+                         server.send_move(self.tmpdir, ['foo'], 'baz'))
+        self.assertFileIs('baz.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('bar.py', 'import baz\n\nbaz.myfunc()\n')
+        self.assertFileIsNot('foo.py')
+        self.assertFalse(self.error_output)
+
+    def test_notices_changes_between_moves(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        server.send_move(self.tmpdir, ['foo'], 'baz')
+
+        # Change some files, and add some new ones, behind the server's back.
+        self.write_file('bar.py', 'import baz\n\nx = baz.myfunc()\n')
+        self.write_file('qux/quux.py', 'import baz\n\nbaz.myfunc()\n')
+        self.assertEqual(('', None),
+                         server.send_move(self.tmpdir, ['baz'], 'foo'))
+        self.assertFileIs('foo.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('bar.py', 'import foo\n\nx = foo.myfunc()\n')
+        self.assertFileIs('qux/quux.py', 'import foo\n\nfoo.myfunc()\n')
+        self.assertFalse(self.error_output)
+
+    def test_error(self):
+        output, error = server.send_move(self.tmpdir, ['nonexistent'], 'foo')
+        self.assertIn('nonexistent', error)
@@ -1,16 +1,25 @@
 from __future__ import absolute_import
 
 import ast
+import collections
+import json
 import os
 import shutil
 import tempfile
 import unittest
 
+import asttokens
+
 import khodemod
 import slicker
 import util
 
 
+# Counts of the expensive things we did; see TestBase.count_work.
+WorkCounts = collections.namedtuple(
+    'WorkCounts', ['parses', 'tokens', 'reads', 'walks', 'writes'])
+
+
 class TestBase(unittest.TestCase):
     maxDiff = None
 
@@ -51,6 +60,52 @@ class TestBase(unittest.TestCase):
     def assertFileIsNot(self, filename):
         self.assertFalse(os.path.exists(self.join(filename)))
 
+    def count_calls(self, obj, name, key=lambda *args, **kwargs: None):
+        """Count calls to obj.name (a function), for the rest of the test.
+
+        obj may be a module or a class.  Returns a collections.Counter from
+        key(*args, **kwargs), for each call's arguments, to the number of
+        calls with that key.
+        """
+        counts = collections.Counter()
+        # Poor-man's mock, again.  We look in obj's __dict__, so that for a
+        # method we get (and later restore) the function itself.
+        old_function = vars(obj)[name]
+
+        def counting_function(*args, **kwargs):
+            counts[key(*args, **kwargs)] += 1
+            return old_function(*args, **kwargs)
+
+        self.addCleanup(setattr, obj, name, old_function)
+        setattr(obj, name, counting_function)
+        return counts
+
+    def count_work(self):
+        """Count the expensive things we do, for the rest of the test.
+
+        Returns a WorkCounts of collections.Counters:
+            parses: calls to ast.parse, by source text
+            tokens: asttokens.ASTTokens constructions, by source text
+            reads: calls to khodemod.read_file, by absolute path
+            walks: calls to os.walk, by absolute path
+            writes: calls to khodemod.Frontend.write_file, by absolute path
+        Unlike timings, these are deterministic, so tests can assert bounds
+        on them, to check that our caches work.
+        """
+        def abspath(root, filename):
+            return os.path.abspath(os.path.join(root, filename))
+
+        return WorkCounts(
+            parses=self.count_calls(ast, 'parse', lambda source, *_: source),
+            tokens=self.count_calls(asttokens, 'ASTTokens',
+                                    lambda source_text, *_, **__: source_text),
+            reads=self.count_calls(khodemod, 'read_file', abspath),
+            walks=self.count_calls(os, 'walk',
+                                   lambda top, *_, **__: os.path.abspath(top)),
+            writes=self.count_calls(
+                khodemod.Frontend, 'write_file',
+                lambda frontend, root, filename, *_: abspath(root, filename)))
+
 
 class ImportProvidesModuleTest(unittest.TestCase):
     def _create_import(self, import_text):
@@ -99,6 +154,18 @@ class ComputeAllImportsTest(unittest.TestCase):
                 util.File('some_file.py', 'import foo\n')),
             {('foo', 'foo', 0, 10)})
 
+    def test_equality(self):
+        file_info = util.File('some_file.py', 'from foo import bar\n')
+        (imp,) = slicker._compute_all_imports(file_info)
+        (other_imp,) = slicker._compute_all_imports(file_info)
+        self.assertIsNot(imp, other_imp)
+        self.assertEqual(imp, other_imp)
+        self.assertEqual(hash(imp), hash(other_imp))
+        # The names are interned, so are shared among imports.
+        self.assertIs(imp.name, other_imp.name)
+        self.assertFalse(
+            imp == slicker.Import('foo.bar', 'baz', imp.node, file_info))
+
     def test_other_junk(self):
         self.assertFalse(
             slicker._compute_all_imports(
@@ -674,6 +741,14 @@ class DottedPrefixTest(unittest.TestCase):
             slicker._dotted_prefixes('abc.def.ghi'),
             ['abc', 'abc.def', 'abc.def.ghi'])
 
+    def test_proper_prefixes(self):
+        self.assertEqual(
+            list(slicker._dotted_prefixes('abc', proper_only=True)),
+            [])
+        self.assertEqual(
+            list(slicker._dotted_prefixes('abc.def.ghi', proper_only=True)),
+            ['abc', 'abc.def'])
+
 
 class NamesStartingWithTest(unittest.TestCase):
     def test_simple(self):
@@ -1249,7 +1324,6 @@ class AliasTest(TestBase):
             'import foo.bar', 'import baz.bang')
 
 
-
 class FixMovedRegionSuggestorTest(TestBase):
     def test_rename_references_self(self):
         self.write_file('foo.py',
@@ -2131,3 +2205,368 @@ class ImportSortTest(TestBase):
             expected = f.read()
         self.assertMultiLineEqual(expected, actual)
         self.assertFalse(self.error_output)
+
+
+class ProjectTest(TestBase):
+    def setUp(self):
+        super(ProjectTest, self).setUp()
+        self.addCleanup(khodemod.forget_resolved_paths, self.tmpdir)
+
+    def test_several_moves(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        project = slicker.Project(self.tmpdir)
+        project.move('foo', 'baz')
+        self.assertFileIs('baz.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('bar.py', 'import baz\n\nbaz.myfunc()\n')
+        self.assertEqual({'baz.py', 'bar.py'}, project.modified_files)
+
+        # Poor-man's mock: the second move should reuse the list of files.
+        _old_walk = khodemod.os.walk
+
+        def restore_walk():
+            khodemod.os.walk = _old_walk
+        self.addCleanup(restore_walk)
+        khodemod.os.walk = lambda *args: self.fail("Walked the tree!")
+
+        project.move(['baz'], 'qux')
+        restore_walk()
+        self.assertFileIs('qux.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('bar.py', 'import qux\n\nqux.myfunc()\n')
+        self.assertFileIsNot('baz.py')
+        self.assertEqual({'baz.py', 'bar.py', 'qux.py'},
+                         project.modified_files)
+        self.assertFalse(self.error_output)
+
+    def test_stats(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        self.write_file('baz.py', 'x = 1\n')
+        stats = slicker.Project(self.tmpdir).move('foo.myfunc', 'newfoo')
+        self.assertEqual(['move', 'fix references', 'clean up',
+                          'sort imports'], stats.phases)
+        # Only bar.py and newfoo.py mention myfunc, so we skip the others.
+        self.assertEqual(2, stats.get('files_prefiltered', 'fix references'))
+        self.assertEqual(3, stats.get('files_written'))
+        # By the time we sort imports, we've read everything we need.
+        self.assertEqual(0, stats.get('files_read', 'sort imports'))
+        self.assertFalse(self.error_output)
+
+    def test_invalidate(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        project = slicker.Project(self.tmpdir)
+        project.move('foo', 'baz')
+
+        self.write_file('bar.py', 'import baz\n\nbaz.myfunc()\n')
+        project.invalidate()
+        project.move('baz', 'qux')
+        self.assertFileIs('bar.py', 'import qux\n\nqux.myfunc()\n')
+        self.assertFalse(self.error_output)
+
+
+class SplitModuleTest(TestBase):
+    def setUp(self):
+        super(SplitModuleTest, self).setUp()
+        self.addCleanup(khodemod.forget_resolved_paths, self.tmpdir)
+
+    def test_split_module(self):
+        self.write_file('foo.py',
+                        ('def f(): return 4\n\n\n'
+                         'def g(): return f()\n\n\n'
+                         'def h(): return 5\n'))
+        self.write_file('bar.py',
+                        'import foo\n\nprint foo.f() + foo.g()\n')
+        slicker.Project(self.tmpdir).split_module(
+            'foo', {'f': 'newf', 'g': 'newg'})
+        self.assertFileIs('foo.py', 'def h(): return 5\n')
+        self.assertFileIs('newf.py', 'def f(): return 4\n')
+        self.assertFileIs('newg.py',
+                          ('from __future__ import absolute_import\n\n'
+                           'import newf\n\n\n'
+                           'def g(): return newf.f()\n'))
+        self.assertFileIs('bar.py',
+                          ('import newf\nimport newg\n\n'
+                           'print newf.f() + newg.g()\n'))
+        self.assertFalse(self.error_output)
+
+    def test_same_destination(self):
+        self.write_file('foo.py',
+                        ('def f(): return 4\n\n\n'
+                         'def g(): return f()\n'))
+        self.write_file('bar.py', 'import foo\n\nprint foo.f() + foo.g()\n')
+        slicker.Project(self.tmpdir).split_module(
+            'foo', {'f': 'newfoo', 'g': 'newfoo.newg'})
+        self.assertFileIsNot('foo.py')
+        self.assertFileIs('newfoo.py',
+                          ('def f(): return 4\n\n\n'
+                           'def newg(): return f()\n'))
+        self.assertFileIs('bar.py',
+                          ('import newfoo\n\n'
+                           'print newfoo.f() + newfoo.newg()\n'))
+        self.assertFalse(self.error_output)
+
+    def test_not_a_symbol(self):
+        self.write_file('foo.py', 'def f(): return 4\n')
+        with self.assertRaises(ValueError):
+            slicker.Project(self.tmpdir).split_module(
+                'foo', {'f': 'newfoo', 'f.x': 'other'})
+
+
+class ShardTest(TestBase):
+    def setUp(self):
+        super(ShardTest, self).setUp()
+        self.addCleanup(khodemod.forget_resolved_paths, self.tmpdir)
+
+    def record_shards(self, old_fullname, new_fullname, num_shards):
+        records = []
+        for i in xrange(num_shards):
+            frontend = khodemod.PatchRecordingFrontend(i, num_shards)
+            try:
+                slicker.Project(self.tmpdir, frontend=frontend).move(
+                    old_fullname, new_fullname)
+                records.extend(frontend.records())
+            finally:
+                frontend.close()
+        return records
+
+    def test_move_module(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        for i in xrange(10):
+            self.write_file('bar%s.py' % i, 'import foo\n\nfoo.myfunc()\n')
+        records = self.record_shards('foo', 'baz', 3)
+        self.assertFileIs('foo.py', 'def myfunc(): return 4\n')
+        self.assertFileIs('bar0.py', 'import foo\n\nfoo.myfunc()\n')
+
+        khodemod.apply_patch_records(khodemod.AcceptingFrontend(), records,
+                                     root=self.tmpdir)
+        self.assertFileIsNot('foo.py')
+        self.assertFileIs('baz.py', 'def myfunc(): return 4\n')
+        for i in xrange(10):
+            self.assertFileIs('bar%s.py' % i, 'import baz\n\nbaz.myfunc()\n')
+        self.assertFalse(self.error_output)
+
+    def test_move_symbol(self):
+        self.write_file('foo.py', 'def f(): return 4\n\n\ndef g(): return 5\n')
+        for i in xrange(10):
+            self.write_file('bar%s.py' % i, 'import foo\n\nfoo.f()\n')
+        records = self.record_shards('foo.f', 'newfoo', 3)
+        khodemod.apply_patch_records(khodemod.AcceptingFrontend(), records,
+                                     root=self.tmpdir)
+        self.assertFileIs('foo.py', 'def g(): return 5\n')
+        self.assertFileIs('newfoo.py', 'def f(): return 4\n')
+        for i in xrange(10):
+            self.assertFileIs('bar%s.py' % i,
+                              'import newfoo\n\nnewfoo.f()\n')
+        self.assertFalse(self.error_output)
+
+
+class ReportTest(TestBase):
+    def setUp(self):
+        super(ReportTest, self).setUp()
+        self.addCleanup(khodemod.forget_resolved_paths, self.tmpdir)
+
+    def test_simple(self):
+        self.write_file('foo.py', 'def some_function(): return 4\n')
+        self.copy_file('simple_in.py')
+        self.write_file('other.py', '# foo.some_function is great\n'
+                        'x = "foo.some_function"\n')
+        report = slicker.Project(self.tmpdir).report('foo.some_function',
+                                                     'bar.new_name')
+        self.assertEqual({
+            'simple_in.py': {'code references': 1, 'imports added': 1,
+                             'imports removed': 1},
+            'other.py': {'comment references': 1, 'string references': 1},
+        }, {filename: {kind: n for (kind, n) in counts.iteritems() if n}
+            for (filename, counts) in report.counts.iteritems()})
+        self.assertEqual([], report.warnings)
+        self.assertEqual(0, report.stats.get('files_written'))
+        self.assertEqual(0, report.stats.get('tokens_built'))
+        with open('testdata/simple_in.py') as f:
+            self.assertFileIs('simple_in.py', f.read())
+        self.assertFalse(self.error_output)
+
+    def test_warnings(self):
+        self.write_file('foo/__init__.py', '')
+        self.write_file('foo/bar/__init__.py', '')
+        self.write_file('foo/bar/baz.py', 'def some_function(): return 4\n')
+        self.copy_file('implicit_in.py')
+        report = slicker.Project(self.tmpdir).report(
+            'foo.bar.baz.some_function', 'quux.new_name')
+        # The line is that of the file as it is now, before the move adds
+        # an import above it.
+        self.assertEqual(
+            [('implicit_in.py', 5, 'This import may be used implicitly.')],
+            report.warnings)
+        self.assertIn('implicit_in.py: 1 code references, 1 imports added',
+                      report.format())
+
+    def test_conflict(self):
+        self.write_file('foo/__init__.py', '')
+        self.write_file('foo/bar.py', 'def interesting_function(): pass\n')
+        self.copy_file('conflict_in.py')
+        report = slicker.Project(self.tmpdir).report(
+            'foo.bar.interesting_function', 'bar.interesting_function',
+            alias='foo')
+        self.assertEqual(
+            [('conflict_in.py', 1,
+              'Your alias will conflict with imports in this file.')],
+            report.warnings)
+        self.assertNotIn('conflict_in.py', report.counts)
+
+    def test_matches_move(self):
+        self.write_file('foo.py', 'def some_function(): return 4\n')
+        for name in ('simple', 'many_imports', 'comments', 'unused'):
+            self.copy_file('%s_in.py' % name)
+        project = slicker.Project(self.tmpdir)
+        report = project.report('foo', 'newfoo')
+        project.move('foo', 'newfoo')
+        self.assertEqual(project.modified_files - {'newfoo.py'},
+                         set(report.counts) - {'foo.py'})
+
+
+class FileCostsTest(TestBase):
+    def test_costs_saved(self):
+        self.write_file('foo.py', 'def f(): return 4\n')
+        self.write_file('user.py', 'import foo\n\nfoo.f()\n')
+        self.write_file('unrelated.py', 'x = 1\n')
+        slicker.make_fixes(['foo'], 'bar', project_root=self.tmpdir,
+                           costs_path=self.join('costs.json'))
+        with open(self.join('costs.json')) as f:
+            costs = json.load(f)
+        # We record the files we ran suggestors on; the prefilter kept us
+        # from reading unrelated.py.
+        self.assertIn('user.py', costs)
+        self.assertNotIn('unrelated.py', costs)
+        self.assertEqual(len('import bar\n\nbar.f()\n'), costs['user.py'][1])
+
+    def test_not_saved_by_default(self):
+        self.write_file('foo.py', 'def f(): return 4\n')
+        self.write_file('user.py', 'import foo\n\nfoo.f()\n')
+        slicker.make_fixes(['foo'], 'bar', project_root=self.tmpdir)
+        self.assertItemsEqual(['bar.py', 'user.py'], os.listdir(self.tmpdir))
+
+
+class MemoryBudgetTest(TestBase):
+    def test_move(self):
+        self.write_file('foo.py', 'def f(): return 4\n')
+        for i in xrange(10):
+            self.write_file('user%s.py' % i, 'import foo\n\nx = foo.f()\n')
+        # A budget this small holds only a few parses at a time.
+        project = slicker.Project(self.tmpdir, memory_budget=10000)
+        stats = project.move('foo', 'bar')
+        for i in xrange(10):
+            self.assertFileIs('user%s.py' % i, 'import bar\n\nx = bar.f()\n')
+        self.assertFileIs('bar.py', 'def f(): return 4\n')
+        self.assertGreater(stats.get('cache_evictions'), 0)
+        self.assertLessEqual(project._parses.size, 10000 * 3 // 4)
+        self.assertFalse(self.error_output)
+
+    def test_cache_budget(self):
+        self.write_file('foo.py', 'def f(): return 4\n')
+        for i in xrange(10):
+            self.write_file('user%s.py' % i, 'import foo\n\nx = foo.f()\n')
+        project = slicker.Project(self.tmpdir, cache_budget=10000)
+        stats = project.move('foo', 'bar')
+        for i in xrange(10):
+            self.assertFileIs('user%s.py' % i, 'import bar\n\nx = bar.f()\n')
+        self.assertGreater(stats.get('cache_evictions'), 0)
+        self.assertLessEqual(project._parses.size, 10000 * 3 // 4)
+        self.assertFalse(self.error_output)
+
+
+class WorkCountTest(TestBase):
+    """Check that we don't do expensive things more often than we need to.
+
+    These are upper bounds, not exact counts: if you make slicker do less
+    work, feel free to tighten them.
+    """
+    def assertWalkedOnce(self, work):
+        self.assertEqual(1, work.walks[self.tmpdir])
+
+    def assertNotRead(self, work, *filenames):
+        for filename in filenames:
+            self.assertNotIn(self.join(filename), work.reads)
+
+    def assertParsedAtMost(self, work, n):
+        # Each parse is of a particular file's contents at some point; we
+        # mostly want to avoid re-parsing unchanged files.
+        self.assertLessEqual(max(work.parses.values()), n)
+        self.assertLessEqual(max(work.tokens.values()), 1)
+
+    def test_symbol_move(self):
+        self.write_file('foo.py', ('def some_function(): return 4\n\n\n'
+                                   'def other(): return 5\n'))
+        self.copy_file('simple_in.py')
+        self.write_file('other.py', 'import foo\n\nfoo.other()\n')
+        self.write_file('unrelated.py', 'import os\n')
+        work = self.count_work()
+        slicker.make_fixes(['foo.some_function'], 'bar.new_name',
+                           project_root=self.tmpdir)
+        with open('testdata/simple_out.py') as f:
+            self.assertFileIs('simple_in.py', f.read())
+
+        self.assertWalkedOnce(work)
+        self.assertNotRead(work, 'other.py', 'unrelated.py')
+        self.assertParsedAtMost(work, 2)
+        # We only need tokens for the files we edit.
+        self.assertLessEqual(sum(work.tokens.values()), 3)
+        self.assertLessEqual(max(work.writes.values()), 2)
+        self.assertFalse(self.error_output)
+
+    def test_module_move(self):
+        self.write_file('foo.py', 'def some_function(): return 4\n')
+        self.copy_file('simple_in.py')
+        self.write_file('unrelated.py', 'import os\n')
+        work = self.count_work()
+        slicker.make_fixes(['foo'], 'bar', project_root=self.tmpdir)
+
+        self.assertWalkedOnce(work)
+        self.assertNotRead(work, 'unrelated.py')
+        self.assertParsedAtMost(work, 1)
+        self.assertEqual([self.join('simple_in.py')], list(work.writes))
+        self.assertFalse(self.error_output)
+
+    def test_package_move(self):
+        self.write_file('pkg/__init__.py', '')
+        for i in xrange(5):
+            self.write_file('pkg/mod%s.py' % i,
+                            'import pkg.mod%s\n\npkg.mod%s.f()\n'
+                            % ((i + 1) % 5, (i + 1) % 5))
+        self.write_file('user.py', 'from pkg import mod1\n\nmod1.f()\n')
+        self.write_file('unrelated.py', 'import os\n')
+        work = self.count_work()
+        slicker.make_fixes(['pkg'], 'newpkg', project_root=self.tmpdir)
+        self.assertFileIsNot('pkg/mod0.py')
+
+        # We walk the package directories to move them, but only walk the
+        # whole tree once.
+        self.assertWalkedOnce(work)
+        self.assertNotRead(work, 'unrelated.py')
+        # A moved file may be parsed again under its new name.
+        self.assertParsedAtMost(work, 2)
+        self.assertLessEqual(max(work.writes.values()), 2)
+        self.assertFalse(self.error_output)
+
+    def test_make_fixes_remembers_files(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        slicker.make_fixes(['foo'], 'baz', project_root=self.tmpdir)
+        work = self.count_work()
+        slicker.make_fixes(['baz'], 'qux', project_root=self.tmpdir)
+        self.assertFileIs('bar.py', 'import qux\n\nqux.myfunc()\n')
+        self.assertEqual(0, sum(work.walks.values()))
+        self.assertFalse(self.error_output)
+
+    def test_project_remembers_files(self):
+        self.write_file('foo.py', 'def myfunc(): return 4\n')
+        self.write_file('bar.py', 'import foo\n\nfoo.myfunc()\n')
+        project = slicker.Project(self.tmpdir)
+        project.move('foo', 'baz')
+        work = self.count_work()
+        project.move('baz', 'qux')
+        self.assertFileIs('bar.py', 'import qux\n\nqux.myfunc()\n')
+
+        self.assertEqual(0, sum(work.walks.values()))
+        # We parsed bar.py's new contents last time, as we sorted imports.
+        self.assertNotIn('import baz\n\nbaz.myfunc()\n', work.parses)
+        self.assertFalse(self.error_output)
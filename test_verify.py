@@ -0,0 +1,84 @@
+from __future__ import absolute_import
+
+import slicker
+import test_slicker
+import verify
+
+
+class FindNewCyclesTest(test_slicker.TestBase):
+    def test_new_cycle(self):
+        old_graph = {'a': set(), 'b': {'a'}, 'c': set()}
+        new_graph = {'a': {'c'}, 'b': {'a'}, 'c': {'b'}}
+        self.assertEqual([['a', 'b', 'c']],
+                         verify.find_new_cycles(old_graph, new_graph))
+
+    def test_old_cycle(self):
+        graph = {'a': {'b'}, 'b': {'a'}, 'c': {'a'}}
+        self.assertEqual([], verify.find_new_cycles(graph, graph))
+
+    def test_bigger_cycle(self):
+        old_graph = {'a': {'b'}, 'b': {'a'}, 'c': set()}
+        new_graph = {'a': {'b'}, 'b': {'c'}, 'c': {'a'}}
+        self.assertEqual([['a', 'b', 'c']],
+                         verify.find_new_cycles(old_graph, new_graph))
+
+
+class VerifyTest(test_slicker.TestBase):
+    def _verify(self, touched_files, all_files, processes=None):
+        return verify.verify(
+            self.tmpdir, touched_files, all_files,
+            slicker._stale_reference_checks([('foo.bar', 'foo.bar.baz',
+                                              False)]),
+            {}, {}, processes=processes)
+
+    def test_problems(self):
+        self.write_file('broken.py', 'def f(:\n')
+        self.write_file('stale.py', 'import foo.bar\n\nfoo.bar.f()\n')
+        self.write_file('path.py', 'x = "foo/bar.py"\n')
+        self.write_file('fine.py', 'import foo.bar.baz\n\nfoo.bar.baz.f()\n')
+        for processes in (1, None):
+            result = self._verify(['broken.py', 'fine.py'],
+                                  ['broken.py', 'fine.py', 'path.py',
+                                   'stale.py'],
+                                  processes=processes)
+            self.assertEqual(
+                [verify.Problem('broken.py', 1, 'does not compile: '
+                                'invalid syntax'),
+                 verify.Problem('path.py', 1, 'still refers to foo/bar.py'),
+                 verify.Problem('stale.py', 1, 'still refers to foo.bar'),
+                 verify.Problem('stale.py', 3, 'still refers to foo.bar')],
+                result.problems)
+            self.assertEqual(2, result.files_compiled)
+            self.assertEqual(4, result.files_searched)
+
+    def test_format(self):
+        self.write_file('stale.py', 'import foo.bar\n')
+        summary = self._verify([], ['stale.py']).format()
+        self.assertIn('Found 1 problems:\n    stale.py:1: still refers to '
+                      'foo.bar', summary)
+
+
+class MoveTest(test_slicker.TestBase):
+    def test_clean_move(self):
+        self.write_file('pkg/__init__.py', '')
+        self.write_file('pkg/a.py', 'import pkg.b\n\nx = pkg.b.y\n')
+        self.write_file('pkg/b.py', 'import pkg.a\n\ny = 1\n')
+        self.write_file('user.py', 'from pkg import a\n\na.x\n')
+        slicker.make_fixes(['pkg'], 'newpkg', project_root=self.tmpdir,
+                           verify=True)
+        self.assertFileIs('user.py', 'import newpkg.a\n\nnewpkg.a.x\n')
+        self.assertFalse(self.error_output)
+
+    def test_new_cycle(self):
+        self.write_file('a.py', ('def h(): return 1\n\n\n'
+                                 'def f(): return h()\n\n\n'
+                                 'def k(): return f()\n'))
+        self.write_file('b.py', 'import a\n\n\ndef g(): return a.f()\n')
+        with self.assertRaises(verify.VerificationError) as cm:
+            slicker.make_fixes(['a.f'], 'b', project_root=self.tmpdir,
+                               verify=True)
+        self.assertEqual([verify.Problem(None, None,
+                                         'new import cycle among a, b')],
+                         cm.exception.result.problems)
+        # The move itself still happened.
+        self.assertIn('def f(): return a.h()', open(self.join('b.py')).read())
@@ -27,7 +27,20 @@ _PYTHON_ENCODING_RE = re.compile(
     r'^[ \t\v]*#.*?coding[:=][ \t]*([-_.a-zA-Z0-9]+)')
 
 
-def _get_encoding(filename, text):
+def _head(text):
+    """Return the first two lines of text, which is where PEP 263 looks.
+
+    We find them without splitting the whole file into lines, since that's
+    expensive on large files and we only care about the beginning.
+    """
+    end = text.find('\n')
+    if end != -1:
+        end = text.find('\n', end + 1)
+    head = text if end == -1 else text[:end]
+    return head.splitlines()[:2]
+
+
+def get_encoding(filename, text):
     """Determine the encoding of a python file, per PEP 263.
 
     Note that text may be either string or unicode, depending on whether we're
@@ -37,15 +50,24 @@ def _get_encoding(filename, text):
         # Not implemented yet!
         return 'ascii'
 
-    for line in text.splitlines()[:2]:
+    for line in _head(text):
+        # Most files have no coding comment at all, in which case we can skip
+        # the regex.
+        if 'coding' not in line:
+            continue
         match = _PYTHON_ENCODING_RE.search(line)
         if match:
             return match.group(1)
     return 'ascii'
 
 
-def encode(filename, text):
-    encoding = _get_encoding(filename, text)
+def encode(filename, text, encoding=None):
+    """Encode text, the contents of filename, to a string.
+
+    If the caller already knows the encoding of the file -- for instance
+    util.File caches it -- it may pass it, and we won't look for it again.
+    """
+    encoding = encoding or get_encoding(filename, text)
     try:
         return text.encode(encoding)
     except UnicodeEncodeError as e:
@@ -57,7 +79,7 @@ def encode(filename, text):
 
 
 def decode(filename, text):
-    encoding = _get_encoding(filename, text)
+    encoding = get_encoding(filename, text)
     try:
         return text.decode(encoding)
     except UnicodeDecodeError as e:
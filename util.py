@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
 import ast
+import contextlib
 import os
 import tokenize
 
@@ -10,6 +11,29 @@ import khodemod
 import unicode_util
 
 
+# Dict from filename to the most recent File for it whose AST we computed, or
+# None if we're not caching parses.  See cache_parses.
+_PARSE_CACHE = None
+
+
+@contextlib.contextmanager
+def cache_parses(cache=None):
+    """Within this context, Files share ASTs with earlier identical Files.
+
+    This is for long-running processes that may parse the same files many
+    times: a File whose filename and body match a File we've already parsed
+    reuses its AST and tokens.  As with khodemod.cache_file_contents, pass
+    the same dict as cache to keep the cache across several contexts.
+    """
+    global _PARSE_CACHE
+    old_cache = _PARSE_CACHE
+    _PARSE_CACHE = {} if cache is None else cache
+    try:
+        yield
+    finally:
+        _PARSE_CACHE = old_cache
+
+
 def filename_for_module_name(module_name):
     """filename is relative to a sys.path entry, such as your project-root."""
     return '%s.py' % module_name.replace('.', os.sep)
@@ -25,25 +49,48 @@ class File(object):
 
     TODO(benkraft): Also cache things like _compute_all_imports.
     """
-    def __init__(self, filename, body):
-        """filename is relative to the value of --root."""
+    # A big move makes a lot of these, so we keep them small.
+    __slots__ = ('filename', 'body', '_encoding', '_tree', '_tokens')
+
+    def __init__(self, filename, body, encoding=None):
+        """filename is relative to the value of --root.
+
+        encoding is the PEP 263 encoding of the file, if the caller knows
+        it; otherwise we figure it out when we need it.
+        """
         self.filename = filename
         self.body = body
+        self._encoding = encoding  # computed lazily
         self._tree = None    # computed lazily
         self._tokens = None  # computed lazily
 
+    @property
+    def encoding(self):
+        """The encoding of the file.  Computed lazily on first use."""
+        if self._encoding is None:
+            self._encoding = unicode_util.get_encoding(self.filename,
+                                                       self.body)
+        return self._encoding
+
     @property
     def tree(self):
         """The AST for the file.  Computed lazily on first use."""
         if self._tree is None:
+            twin = self._cached_twin()
+            if twin is not None:
+                self._tree = twin.tree
+                return self._tree
             try:
                 # ast.parse would really prefer to run on bytes.
                 # Luckily we ignore all of the (useless) line/col
                 # information in the AST nodes -- we get it via
                 # asttokens instead -- so we don't have to worry
                 # about the fact that these will be byte offsets.
-                self._tree = ast.parse(
-                    unicode_util.encode(self.filename, self.body))
+                # (In the common case of an ascii file, this is just a
+                # copy; we never have to look for a coding comment again.)
+                self._tree = ast.parse(unicode_util.encode(
+                    self.filename, self.body, self.encoding))
+                khodemod.count('files_parsed')
             except SyntaxError as e:
                 raise khodemod.FatalError(self.filename, 0,
                                           "Couldn't parse this file: %s" % e)
@@ -58,9 +105,28 @@ class File(object):
         editing).
         """
         if self._tokens is None:
-            self._tokens = asttokens.ASTTokens(self.body, tree=self.tree)
+            twin = self._cached_twin()
+            if twin is not None:
+                self._tokens = twin.tokens
+            else:
+                self._tokens = asttokens.ASTTokens(self.body, tree=self.tree)
+                khodemod.count('tokens_built')
         return self._tokens
 
+    def _cached_twin(self):
+        """A File we already parsed with the same filename and body, if any.
+
+        If there's none (or we're not caching parses), returns None, and if
+        we are caching, this File becomes the one later Files will share with.
+        """
+        if _PARSE_CACHE is None:
+            return None
+        twin = _PARSE_CACHE.get(self.filename)
+        if twin is not None and twin is not self and twin.body == self.body:
+            return twin
+        _PARSE_CACHE[self.filename] = self
+        return None
+
 
 def is_newline(token):
     # I think this is equivalent to doing
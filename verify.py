@@ -0,0 +1,273 @@
+"""Checking that a move did what it should have.
+
+After a big move, we want to know it left the tree in good shape, without
+running our own slow scripts over it.  So with --verify, once the move is
+done we check that:
+1) every python file the move touched still compiles;
+2) no file in the project still refers to anything we moved by its old
+   fullname or old path (we look using the same regexes slicker uses to
+   fix those references, so this finds what it missed: say, a reference
+   it warned it couldn't fix);
+3) the move didn't add an import cycle among the modules it touched.  We
+   only look at toplevel imports, since late imports are the usual way
+   to break a cycle.  A cycle the modules were in before the move (under
+   their old names) doesn't count.
+The first two mean reading every file in the project, so we spread them
+over a pool of processes; we look for cycles while they work.  If we know
+how long each file took us in the past (see khodemod.FileCosts), we hand out
+the costliest files first, and pack the cheap ones into bigger batches, so
+no process is left with a slow file at the end.
+
+This knows nothing about how slicker moves things: the caller tells us what
+to look for (see StaleReferenceCheck), and gives us the import graphs.
+"""
+from __future__ import absolute_import
+
+import collections
+import multiprocessing
+import os
+
+import khodemod
+
+
+# Something wrong with the tree after the move.  filename and lineno are
+# None for a problem that isn't in any one place (an import cycle).
+Problem = collections.namedtuple('Problem', ['filename', 'lineno', 'message'])
+
+# A name (or path) the project shouldn't refer to any more.  regex finds
+# references to it; needle is a string any file that refers to it must
+# contain, to let us skip the rest quickly.  A reference that is the start
+# of one of allowed isn't stale: if we moved foo to foo.bar, references to
+# foo.bar are what we want.
+StaleReferenceCheck = collections.namedtuple(
+    'StaleReferenceCheck', ['name', 'regex', 'needle', 'allowed'])
+
+
+class VerificationError(Exception):
+    """The move completed, but verification found problems with it."""
+    def __init__(self, result):
+        super(VerificationError, self).__init__(result.format())
+        self.result = result
+
+
+class Result(object):
+    """What verification found, and how much it looked at."""
+    def __init__(self, problems, files_compiled, files_searched,
+                 modules_checked):
+        self.problems = problems
+        self.files_compiled = files_compiled
+        self.files_searched = files_searched
+        self.modules_checked = modules_checked
+
+    def format(self):
+        """A summary of everything we found, for the user."""
+        lines = ['Verified the move: compiled %s touched files, searched %s '
+                 'files for stale references, and checked %s touched '
+                 'modules for import cycles.'
+                 % (self.files_compiled, self.files_searched,
+                    self.modules_checked)]
+        if not self.problems:
+            lines.append('No problems found.')
+        else:
+            lines.append('Found %s problems:' % len(self.problems))
+        for problem in self.problems:
+            if problem.filename is None:
+                lines.append('    %s' % problem.message)
+            else:
+                lines.append('    %s:%s: %s' % (problem.filename,
+                                                problem.lineno,
+                                                problem.message))
+        return '\n'.join(lines)
+
+
+# What the worker processes check, set by _init_worker: (root, checks).
+_WORKER_STATE = None
+
+
+def _init_worker(root, checks):
+    global _WORKER_STATE
+    _WORKER_STATE = (root, checks)
+
+
+def _check_file(args):
+    """Check one file, in a worker process; return a list of Problems.
+
+    We compile the file if should_compile, and search it for stale
+    references in any case.
+    """
+    (filename, should_compile) = args
+    (root, checks) = _WORKER_STATE
+    checks = [check for check in checks
+              if khodemod.file_contains_any(root, filename, [check.needle])]
+    if not should_compile and not checks:
+        return []
+    try:
+        with open(os.path.join(root, filename), 'rb') as f:
+            data = f.read()
+    except IOError as e:
+        if e.errno == 2:    # No such file: it's nothing to us.
+            return []
+        raise
+
+    problems = []
+    if should_compile:
+        try:
+            compile(data, filename, 'exec', 0, True)
+        except (SyntaxError, TypeError) as e:
+            problems.append(Problem(filename, getattr(e, 'lineno', None),
+                                    'does not compile: %s'
+                                    % getattr(e, 'msg', e)))
+    # Map from position to the longest stale name found there: if we moved
+    # a package, a reference to one of its modules is also a reference to
+    # the package, but we only want to hear about it once.
+    stale = {}
+    for check in checks:
+        for m in check.regex.finditer(data):
+            if any(data.startswith(name, m.start())
+                   for name in check.allowed):
+                continue
+            if len(check.name) > len(stale.get(m.start(), '')):
+                stale[m.start()] = check.name
+    for (pos, name) in sorted(stale.iteritems()):
+        problems.append(Problem(filename, data.count('\n', 0, pos) + 1,
+                                'still refers to %s' % name))
+    return problems
+
+
+def _check_files(batch):
+    """Check a batch of files, in a worker process; see _check_file."""
+    return [problem for args in batch for problem in _check_file(args)]
+
+
+def _batches(root, work, costs, processes):
+    """Split the work into batches, to hand to the pool one at a time.
+
+    Without costs, we use batches of 16 files, in order.  With them, we go
+    costliest first, aiming for about 4 batches per process.
+    """
+    if costs is None:
+        return [work[i:i + 16] for i in xrange(0, len(work), 16)]
+    should_compile = dict(work)
+    total_cost = sum(costs.cost(root, filename) for filename in should_compile)
+    size = total_cost / (4 * (processes or multiprocessing.cpu_count()))
+    return [[(filename, should_compile[filename]) for filename in batch]
+            for batch in costs.batches(root, should_compile, size)]
+
+
+def _strongly_connected_components(graph):
+    """Tarjan's algorithm, without recursion (import graphs can be deep).
+
+    graph maps each node to the set of nodes it has edges to.  Returns a
+    list of sets of nodes.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for root in sorted(graph):
+        if root in index:
+            continue
+        # Each frame is (node, iterator over the nodes it has edges to).
+        frames = [(root, iter(sorted(graph[root])))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        while frames:
+            (node, edges) = frames[-1]
+            for target in edges:
+                if target not in index:
+                    index[target] = lowlink[target] = len(index)
+                    stack.append(target)
+                    on_stack.add(target)
+                    frames.append((target, iter(sorted(graph[target]))))
+                    break
+                elif target in on_stack:
+                    lowlink[node] = min(lowlink[node], index[target])
+            else:
+                frames.pop()
+                if frames:
+                    parent = frames[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+def find_new_cycles(old_graph, new_graph):
+    """Return the import cycles in new_graph that weren't in old_graph.
+
+    Each graph maps a module to the set of modules it imports (at toplevel);
+    every module a graph mentions must be one of its keys.  We return a
+    sorted list of cycles, each a sorted list of the modules in it.  A cycle
+    is a set of modules that (transitively) all import each other; it's new
+    if old_graph didn't already have them all in one cycle.
+    """
+    old_components = {}
+    for component in _strongly_connected_components(old_graph):
+        for module in component:
+            old_components[module] = component
+    new_cycles = []
+    for component in _strongly_connected_components(new_graph):
+        if len(component) < 2:
+            continue
+        first = next(iter(component))
+        if not component <= old_components.get(first, set()):
+            new_cycles.append(sorted(component))
+    return sorted(new_cycles)
+
+
+def verify(root, touched_files, all_files, checks, old_graph, new_graph,
+           processes=None, costs=None):
+    """Check that a move left the project at root in good shape.
+
+    touched_files are the files (relative to root) the move changed, which
+    we compile if they're python; all_files are those we search for stale
+    references, using checks, a list of StaleReferenceChecks.  old_graph and
+    new_graph are the toplevel imports among the touched modules before and
+    after the move, as for find_new_cycles; old_graph should use the
+    modules' new names.  We use a pool of processes (by default, one per
+    CPU) to do the first two, in the order costs (a khodemod.FileCosts)
+    suggests, if passed; pass processes=1 to do everything in this process.
+    Returns a Result.
+    """
+    touched_files = set(touched_files)
+    compiled = {filename for filename in touched_files
+                if filename.endswith('.py')}
+    work = [(filename, filename in compiled)
+            for filename in sorted(set(all_files) | touched_files)]
+
+    if processes == 1:
+        pool = None
+        _init_worker(root, checks)
+        results = [_check_file(args) for args in work]
+    else:
+        pool = multiprocessing.Pool(processes, _init_worker, (root, checks))
+        results = pool.imap_unordered(_check_files,
+                                      _batches(root, work, costs, processes))
+
+    try:
+        # The pool works on the files while we look for cycles.
+        cycles = find_new_cycles(old_graph, new_graph)
+        # The batches may finish in any order, but the problems in each
+        # file are in order.
+        problems = sorted((problem for file_problems in results
+                           for problem in file_problems),
+                          key=lambda problem: problem.filename)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    for cycle in cycles:
+        problems.append(Problem(
+            None, None, 'new import cycle among %s' % ', '.join(cycle)))
+    return Result(problems, files_compiled=len(compiled),
+                  files_searched=len(work), modules_checked=len(new_graph))